@@ -0,0 +1,29 @@
+# File: app/api/v1/endpoints/catalog.py
+
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from app.core.config import settings
+from app.services import plan_service
+
+router = APIRouter()
+
+
+@router.post("/invalidate")
+async def invalidate_catalog(x_admin_token: Optional[str] = Header(default=None)):
+    """
+    POST /api/v1/catalog/invalidate
+    Tells the planner the locations catalog changed: precomputed candidate
+    lists and cached catalog rows are dropped and rebuilt on next use.
+    Call it after importing or editing locations. Requires the
+    X-Admin-Token header (CATALOG_ADMIN_TOKEN); disabled when that is unset.
+    """
+    if not settings.CATALOG_ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token.encode(), settings.CATALOG_ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token.")
+    # Clearing a shared cache backend is blocking I/O
+    await run_in_threadpool(plan_service.invalidate_candidate_lists)
+    return {"status": "invalidated"}
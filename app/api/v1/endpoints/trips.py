@@ -116,35 +116,43 @@
 
 # File: app/api/v1/endpoints/trips.py
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 # --- IMPORT ClerkUser and auth dependency ---
 from app.models.schemas import TripGenerationRequest, TripResponse, ReservationRequest, ReservationUserResponse, \
-    ClerkUser  # <-- (FIX 1)
+    ClerkUser, BatchTripGenerationRequest, BatchTripResponse, RouteGeometryResponse, TripDayEditRequest, \
+    TripDayResponse, TripGeometryOptions, TripListResponse, RoutingProfile  # <-- (FIX 1)
 from app.core.auth import get_authenticated_user
 # ---
-from app.db.supabase_client import supabase_client
+from app.db.supabase_client import get_async_client
+from app.core import deadline
+from app.core.config import settings
+from app.core.profiling import profile_request
+from app.core.responses import FastJSONResponse, json_dumps
 from app.services import plan_service
-from supabase import Client
+from fastapi.concurrency import run_in_threadpool
+from supabase import AsyncClient
+from typing import Any, Callable, Literal, Optional
+import hashlib
 import sys
 
 router = APIRouter()
 
 
 # Dependency
-def get_db():
-    return supabase_client
+async def get_db() -> AsyncClient:
+    return await get_async_client()
 
 
-# --- MODIFIED /generate-plan ---
-@router.post("/generate-plan", response_model=TripResponse)
-def generate_plan(
-        request: TripGenerationRequest,
-        current_user: ClerkUser = Depends(get_authenticated_user),
-        db: Client = Depends(get_db)
-):
+def _run_profiled(http_request: Request, label: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+    # profile_request samples the thread it runs in, so it has to wrap the call inside the worker thread
+    with profile_request(http_request, label):
+        return func(*args, **kwargs)
+
+
+async def _upsert_user_profile(current_user: ClerkUser, db: AsyncClient) -> None:
     """
-    Generates a new personalized travel plan based on user inputs.
-    Requires authentication.
+    Makes sure the authenticated user has a row in 'users' before a trip is linked to it.
     """
     try:
         user_data_to_upsert = {'id': current_user.id}
@@ -155,7 +163,7 @@ def generate_plan(
         print(f"--- Upserting user profile: {user_data_to_upsert} ---")
         sys.stdout.flush()
 
-        db.table('users').upsert(user_data_to_upsert, on_conflict='id').execute()
+        await db.table('users').upsert(user_data_to_upsert, on_conflict='id').execute()
 
         print(f"--- User profile upsert successful for {current_user.id} ---")
         sys.stdout.flush()
@@ -166,32 +174,265 @@ def generate_plan(
         sys.stderr.flush()
         raise HTTPException(status_code=500, detail=f"Failed to create user profile in DB: {e}")
 
-    try:
-        print(f"Generating plan for user: {current_user.id}")
-        trip_plan = plan_service.generate_trip_plan(request, user_id=current_user.id)
-        return trip_plan
 
+# --- MODIFIED /generate-plan ---
+@router.post("/generate-plan", response_model=TripResponse)
+async def generate_plan(
+        request: TripGenerationRequest,
+        http_request: Request,
+        current_user: ClerkUser = Depends(get_authenticated_user),
+        db: AsyncClient = Depends(get_db)
+):
+    """
+    Generates a new personalized travel plan based on user inputs.
+    Answers within GENERATE_PLAN_DEADLINE, degrading the plan if needed
+    (see TripResponse.degradations).
+    Requires authentication.
+    """
+    with deadline.request_deadline(settings.GENERATE_PLAN_DEADLINE):
+        await _upsert_user_profile(current_user, db)
+
+        try:
+            print(f"Generating plan for user: {current_user.id}")
+            # Planning is CPU work plus ORS calls; the worker thread inherits the request budget
+            trip_plan = await run_in_threadpool(
+                _run_profiled, http_request, "generate-plan",
+                plan_service.generate_trip_plan, request, user_id=current_user.id
+            )
+            return FastJSONResponse(trip_plan)
+
+        except HTTPException as e:
+            raise e
+        except Exception as e:
+            print(f"Unexpected error in /generate-plan endpoint: {e}", file=sys.stderr)
+            sys.stderr.flush()
+            raise HTTPException(status_code=500, detail=f"Error during plan generation: {e}")
+
+
+# --- NEW /generate-plan/stream ---
+@router.post("/generate-plan/stream")
+async def generate_plan_stream(
+        request: TripGenerationRequest,
+        current_user: ClerkUser = Depends(get_authenticated_user),
+        db: AsyncClient = Depends(get_db)
+):
+    """
+    Same as /generate-plan, but streams the plan as NDJSON (one JSON object per line).
+    Each day is sent as soon as its locations are chosen, followed by its route
+    geometries, and finally the saved trip id. See plan_service.stream_trip_plan.
+    Requires authentication.
+    """
+    await _upsert_user_profile(current_user, db)
+
+    # Budget and location errors are raised here, before the stream starts,
+    # so they still come back as normal HTTP errors.
+    try:
+        print(f"Streaming plan for user: {current_user.id}")
+        candidates = await run_in_threadpool(plan_service.prepare_candidate_locations, request)
     except HTTPException as e:
         raise e
     except Exception as e:
-        print(f"Unexpected error in /generate-plan endpoint: {e}", file=sys.stderr)
+        print(f"Unexpected error in /generate-plan/stream endpoint: {e}", file=sys.stderr)
         sys.stderr.flush()
         raise HTTPException(status_code=500, detail=f"Error during plan generation: {e}")
 
+    def ndjson_lines():
+        for event in plan_service.stream_trip_plan(request, candidates, user_id=current_user.id):
+            yield json_dumps(event) + b"\n"
+
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+
+# --- NEW /generate-plans/batch ---
+@router.post("/generate-plans/batch", response_model=BatchTripResponse)
+async def generate_plans_batch(
+        batch: BatchTripGenerationRequest,
+        http_request: Request,
+        current_user: ClerkUser = Depends(get_authenticated_user),
+        db: AsyncClient = Depends(get_db)
+):
+    """
+    Generates several plans in one call (travel agents, precompute jobs).
+    Catalog, matrix and route work is shared across the items; every item
+    gets its own result, and a failed item does not fail the batch.
+    Requires authentication.
+    """
+    if not batch.requests:
+        raise HTTPException(status_code=400, detail="Batch must contain at least one request.")
+    if len(batch.requests) > settings.MAX_BATCH_PLANS:
+        raise HTTPException(status_code=400,
+                            detail=f"Batch is too large. Maximum is {settings.MAX_BATCH_PLANS} plans per call.")
+
+    await _upsert_user_profile(current_user, db)
+
+    try:
+        print(f"Generating {len(batch.requests)} plans for user: {current_user.id}")
+        with deadline.request_deadline(settings.BATCH_PLAN_DEADLINE):
+            results = await run_in_threadpool(
+                _run_profiled, http_request, "generate-plans-batch",
+                plan_service.generate_trip_plans_batch, batch.requests, user_id=current_user.id
+            )
+        return FastJSONResponse(BatchTripResponse(results=results))
+
+    except Exception as e:
+        print(f"Unexpected error in /generate-plans/batch endpoint: {e}", file=sys.stderr)
+        sys.stderr.flush()
+        raise HTTPException(status_code=500, detail=f"Error during batch plan generation: {e}")
+
+
+def _etag_response(http_request: Request, body: dict, cache_control: str) -> Response:
+    """
+    Serializes `body` once and answers with a weak ETag of the JSON: the
+    CompressionMiddleware may send it as identity, gzip or br bytes, which
+    are the same representation but not byte-identical.
+    Returns 304 Not Modified when the client already has this body.
+    """
+    payload = json_dumps(body)
+    etag = 'W/"' + hashlib.sha256(payload).hexdigest()[:32] + '"'
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+
+    # Weak comparison: a W/ prefix on either side does not matter
+    if_none_match = http_request.headers.get("if-none-match", "")
+    client_tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    if etag.removeprefix("W/") in client_tags or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=payload, media_type="application/json", headers=headers)
+
+
+# --- NEW /routes/{ref} ---
+@router.get("/routes/{ref}", response_model=RouteGeometryResponse)
+def get_route_geometry(
+        ref: str,
+        http_request: Request,
+        format: Literal["geojson", "polyline"] = "geojson",
+        simplify_tolerance_m: Optional[float] = Query(default=None, ge=0),
+        profile: Optional[RoutingProfile] = None,
+        current_user: ClerkUser = Depends(get_authenticated_user)
+):
+    """
+    Returns the route geometries for a leg or day reference from a plan made
+    with geometry_mode "refs". The reference only depends on the routing
+    profile and the stop coordinates, so responses carry an ETag and a
+    long cache lifetime. `format` and `simplify_tolerance_m` work like the
+    plan request fields. `profile` is only used for older references that do
+    not carry their profile (default driving-car).
+    Requires authentication.
+    """
+    try:
+        ref_profile, points = plan_service.parse_route_ref(ref)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid route reference: {e}")
+    profile = ref_profile or profile or "driving-car"
+
+    geometries = plan_service.get_route_geometries_for_ref(points, format, simplify_tolerance_m, profile)
+    if all(geometry is None for geometry in geometries):
+        raise HTTPException(status_code=502, detail="Could not fetch route geometry.")
+
+    # Don't let clients keep a partial result for a month
+    if any(geometry is None for geometry in geometries):
+        cache_control = "no-store"
+    else:
+        cache_control = f"private, max-age={settings.ROUTE_GEOMETRY_MAX_AGE}, immutable"
+
+    body = RouteGeometryResponse(ref=ref, route_geometries=geometries).model_dump()
+    return _etag_response(http_request, body, cache_control)
+
+
+# --- NEW PATCH /{trip_id}/days/{day_number} ---
+@router.patch("/{trip_id}/days/{day_number}", response_model=TripDayResponse)
+def edit_trip_day(
+        trip_id: str,
+        day_number: int,
+        edit: TripDayEditRequest,
+        http_request: Request,
+        current_user: ClerkUser = Depends(get_authenticated_user)
+):
+    """
+    Adds, removes or reorders the locations of one day of a saved trip.
+    Only that day is re-planned; the rest of the trip is untouched.
+    Requires authentication (and ownership of the trip).
+    """
+    try:
+        print(f"Editing trip {trip_id} day {day_number} for user: {current_user.id}")
+        with profile_request(http_request, "edit-trip-day"):
+            day = plan_service.edit_trip_day(trip_id, day_number, edit, user_id=current_user.id)
+        return FastJSONResponse(day)
+
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        print(f"Unexpected error in trip day edit endpoint: {e}", file=sys.stderr)
+        sys.stderr.flush()
+        raise HTTPException(status_code=500, detail=f"Error editing trip day: {e}")
+
+
+# --- NEW GET / (list the user's trips) ---
+@router.get("", response_model=TripListResponse)
+def list_trips(
+        http_request: Request,
+        limit: int = Query(default=20, ge=1, le=100),
+        cursor: Optional[str] = None,
+        current_user: ClerkUser = Depends(get_authenticated_user)
+):
+    """
+    Lists the current user's trips, newest first.
+    Pages are keyset-paginated: pass the returned `next_cursor` as `cursor`
+    to get the next page. Supports If-None-Match.
+    Requires authentication.
+    """
+    try:
+        page = plan_service.list_trips(current_user.id, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+    return _etag_response(http_request, page.model_dump(), "private, no-cache")
+
+
+# --- NEW GET /{trip_id} ---
+@router.get("/{trip_id}", response_model=TripResponse)
+def get_trip(
+        trip_id: str,
+        http_request: Request,
+        geometry_mode: Literal["inline", "refs"] = "inline",
+        geometry_format: Literal["geojson", "polyline"] = "geojson",
+        simplify_tolerance_m: Optional[float] = Query(default=None, ge=0),
+        current_user: ClerkUser = Depends(get_authenticated_user)
+):
+    """
+    Returns one of the current user's saved trips, from the snapshot written
+    when it was planned (and updated by day edits). Geometry options work like
+    the plan request fields. Supports If-None-Match.
+    Requires authentication (and ownership of the trip).
+    """
+    options = TripGeometryOptions(
+        geometry_mode=geometry_mode,
+        geometry_format=geometry_format,
+        simplify_tolerance_m=simplify_tolerance_m
+    )
+    try:
+        trip = plan_service.get_trip(trip_id, current_user.id, options)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        print(f"Unexpected error loading trip {trip_id}: {e}", file=sys.stderr)
+        sys.stderr.flush()
+        raise HTTPException(status_code=500, detail=f"Error loading trip: {e}")
+    return _etag_response(http_request, trip.model_dump(), "private, no-cache")
+
 
 # --- (FIX 2) MODIFIED /reserve-trip ---
 @router.post("/reserve-trip", response_model=ReservationUserResponse)  # <-- Renamed UserResponse
-def reserve_trip(
+async def reserve_trip(
         request: ReservationRequest,
         current_user: ClerkUser = Depends(get_authenticated_user),
-        db: Client = Depends(get_db)
+        db: AsyncClient = Depends(get_db)
 ):
     """
     Saves reservation details for a user and links it to their trip.
     Requires authentication.
     """
     try:
-        user_response = db.table('users').upsert({
+        user_response = await db.table('users').upsert({
             'id': current_user.id,
             'email': request.email,
             'first_name': request.first_name,
@@ -203,7 +444,7 @@ def reserve_trip(
 
         new_user_profile = user_response.data[0]
 
-        trip_update_response = db.table('trips').update({
+        trip_update_response = await db.table('trips').update({
             'user_id': new_user_profile['id']
         }).eq('id', request.trip_id).execute()
 
@@ -1,8 +1,8 @@
 # File: app/api/v1/endpoints/users.py
 
 from fastapi import APIRouter, Depends, HTTPException
-from supabase import Client
-from app.db.supabase_client import supabase_client
+from supabase import AsyncClient
+from app.db.supabase_client import get_async_client
 from app.core.auth import get_authenticated_user
 from app.models.schemas import ClerkUser, UserProfileResponse, UserProfileUpdate
 import sys
@@ -11,14 +11,14 @@ router = APIRouter()
 
 
 # Dependency to get the DB client (same as in trips.py)
-def get_db():
-    return supabase_client
+async def get_db() -> AsyncClient:
+    return await get_async_client()
 
 
 @router.get("/me", response_model=UserProfileResponse)
-def get_current_user_profile(
+async def get_current_user_profile(
         current_user: ClerkUser = Depends(get_authenticated_user),
-        db: Client = Depends(get_db)
+        db: AsyncClient = Depends(get_db)
 ):
     """
     GET /api/v1/users/me
@@ -26,7 +26,7 @@ def get_current_user_profile(
     """
     print(f"--- Fetching profile for user: {current_user.id} ---")
     try:
-        response = db.table('users').select(
+        response = await db.table('users').select(
             "id, first_name, last_name, email, address, post_code, country, mobile_phone, passport_number"
         ).eq('id', current_user.id).single().execute()
 
@@ -48,10 +48,10 @@ def get_current_user_profile(
 
 
 @router.put("/me", response_model=UserProfileResponse)
-def update_current_user_profile(
+async def update_current_user_profile(
         profile_update: UserProfileUpdate,
         current_user: ClerkUser = Depends(get_authenticated_user),
-        db: Client = Depends(get_db)
+        db: AsyncClient = Depends(get_db)
 ):
     """
     PUT /api/v1/users/me
@@ -69,11 +69,10 @@ def update_current_user_profile(
     print(f"--- Update data: {update_data} ---")
 
     try:
-        response = db.table('users').update(
+        # PostgREST returns the updated row; response_model trims it to the profile fields
+        response = await db.table('users').update(
             update_data
-        ).eq('id', current_user.id).select(
-            "id, first_name, last_name, email, address, post_code, country, mobile_phone, passport_number"
-        ).execute()
+        ).eq('id', current_user.id).execute()
 
         if not response.data:
             print(f"---!!! Error: Failed to update or find user {current_user.id} ---", file=sys.stderr)
@@ -82,6 +81,8 @@ def update_current_user_profile(
         print("--- Update successful ---")
         return response.data[0]  # Return the updated profile data
 
+    except HTTPException as e:
+        raise e
     except Exception as e:
         print(f"---!!! Error updating user profile: {e} !!!---", file=sys.stderr)
         sys.stderr.flush()
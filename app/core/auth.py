@@ -5,11 +5,14 @@ from jose import jwt, jwk
 from jose.exceptions import JOSEError
 from typing import Dict
 from app.models.schemas import ClerkUser
+from app.core import cache
 from app.core.config import settings  # Import your settings
 
 # --- Configuration ---
-# We will cache the Clerk public keys (JWKS) to avoid fetching them on every request
-JWKS_CACHE = {}
+# We will cache the Clerk public keys (JWKS) to avoid fetching them on every request.
+# In-process only (it is read on the event loop) and refreshed after JWKS_CACHE_TTL
+# so rotated keys are picked up.
+JWKS_CACHE = cache.get_cache("clerk_jwks", 1, ttl=settings.JWKS_CACHE_TTL, local_only=True)
 oauth2_scheme = HTTPBearer()
 
 
@@ -18,9 +21,9 @@ async def get_clerk_jwks() -> Dict:
     Fetches Clerk's JSON Web Key Set (JWKS) to verify token signatures.
     Caches the keys for performance.
     """
-    global JWKS_CACHE
-    if JWKS_CACHE:
-        return JWKS_CACHE
+    cached_keys = JWKS_CACHE.get("keys")
+    if cached_keys:
+        return cached_keys
 
     if not settings.CLERK_ISSUER_URL:
         raise Exception("CLERK_ISSUER_URL is not set in .env")
@@ -32,8 +35,9 @@ async def get_clerk_jwks() -> Dict:
             response = await client.get(jwks_url)
             response.raise_for_status()  # Raise an error for bad responses
             jwks = response.json()
-            JWKS_CACHE = {key['kid']: key for key in jwks['keys']}
-            return JWKS_CACHE
+            keys = {key['kid']: key for key in jwks['keys']}
+            JWKS_CACHE.set("keys", keys)
+            return keys
     except Exception as e:
         print(f"Error fetching JWKS: {e}")
         raise HTTPException(status_code=500, detail="Could not fetch authentication keys.")
@@ -0,0 +1,575 @@
+# File: app/core/cache.py
+
+"""
+Cache backends shared by every caching layer (ORS durations and routes,
+formatted geometries, catalog rows, Clerk keys).
+
+A layer asks for a named cache once, at import:
+
+    ROUTE_CACHE = cache.get_cache("routes", settings.ROUTE_CACHE_MAX_ENTRIES)
+
+and uses get/set/get_many/set_many with an optional TTL per entry.
+`get_or_compute` adds single-flight: concurrent misses on one key compute it
+once, and the other callers wait for that result.
+
+CACHE_BACKEND picks where entries live:
+  "local"   in-process LRU (one copy per worker; the default). Caches asked
+            for with persistent=True use the SQLite file instead, so they
+            survive restarts
+  "sqlite"  one SQLite file in WAL mode (CACHE_SQLITE_PATH), shared by all
+            workers on the host; single-flight also holds across workers
+  "redis"   a Redis-compatible server (CACHE_REDIS_URL); needs the optional
+            `redis` package
+The shared backends keep a small in-process LRU in front, so hot keys are
+not read from disk or the network on every lookup. Shared values are
+pickled, so only cache data this service produced itself.
+"""
+
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from app.core.config import settings
+
+MISSING = object()
+# How long a worker may hold a single-flight lease, and how often the others check on it
+LEASE_SECONDS = 30.0
+LEASE_POLL_SECONDS = 0.05
+# Keys per SQL statement / Redis MGET in get_many
+BATCH_SIZE = 500
+
+
+class Cache(ABC):
+    """Interface of every backend. Keys must have a stable repr() (tuples of str/float/int)."""
+
+    def __init__(self, namespace: str, max_entries: int, ttl: Optional[float] = None):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._flights: Dict[Hashable, threading.Lock] = {}
+        self._flights_lock = threading.Lock()
+
+    @abstractmethod
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        ...
+
+    @abstractmethod
+    def get_many_with_expiry(self, keys: Iterable[Hashable]) -> Dict[Hashable, Tuple[Any, Optional[float]]]:
+        """Like get_many, with each entry's expiry time (time.time() based; None = never)."""
+
+    @abstractmethod
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, key: Hashable) -> None:
+        ...
+
+    @abstractmethod
+    def clear(self) -> None:
+        ...
+
+    def get_many(self, keys: Iterable[Hashable]) -> Dict[Hashable, Any]:
+        """The cached entries among `keys` (misses are left out)."""
+        found = {}
+        for key in keys:
+            value = self.get(key, MISSING)
+            if value is not MISSING:
+                found[key] = value
+        return found
+
+    def set_many(self, items: Dict[Hashable, Any], ttl: Optional[float] = None) -> None:
+        for key, value in items.items():
+            self.set(key, value, ttl)
+
+    @contextmanager
+    def _lease(self, key: Hashable):
+        # Cross-worker single-flight; only shared backends need one
+        yield
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """
+        The cached value of `key`, or compute() stored under it. Concurrent
+        callers missing the same key wait for one computation. None results
+        are returned but not cached, so failures are retried next time.
+        """
+        value = self.get(key, MISSING)
+        if value is not MISSING:
+            return value
+        with self._flights_lock:
+            flight = self._flights.setdefault(key, threading.Lock())
+        try:
+            with flight:
+                value = self.get(key, MISSING)
+                if value is not MISSING:
+                    return value
+                with self._lease(key):
+                    value = self.get(key, MISSING)
+                    if value is MISSING:
+                        value = compute()
+                        if value is not None:
+                            self.set(key, value, ttl)
+                return value
+        finally:
+            with self._flights_lock:
+                if self._flights.get(key) is flight and not flight.locked():
+                    del self._flights[key]
+
+    def _expiry(self, ttl: Optional[float]) -> Optional[float]:
+        ttl = self.ttl if ttl is None else ttl
+        return time.time() + ttl if ttl else None
+
+
+class LocalCache(Cache):
+    """In-process LRU with optional per-entry expiry."""
+
+    def __init__(self, namespace: str, max_entries: int, ttl: Optional[float] = None):
+        super().__init__(namespace, max_entries, ttl)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            if entry[1] is not None and entry[1] < time.time():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def get_many_with_expiry(self, keys: Iterable[Hashable]) -> Dict[Hashable, Tuple[Any, Optional[float]]]:
+        found = {}
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if entry[1] is not None and entry[1] < now:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = entry
+        return found
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        self.set_many_with_expiry({key: (value, self._expiry(ttl))})
+
+    def set_many(self, items: Dict[Hashable, Any], ttl: Optional[float] = None) -> None:
+        expires_at = self._expiry(ttl)
+        self.set_many_with_expiry({key: (value, expires_at) for key, value in items.items()})
+
+    def set_many_with_expiry(self, entries: Dict[Hashable, Tuple[Any, Optional[float]]]) -> None:
+        """Stores (value, expires_at) pairs as they are, e.g. copied from another cache."""
+        with self._lock:
+            for key, entry in entries.items():
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    expires_at REAL,
+    stored_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS cache_entries_age ON cache_entries (namespace, stored_at);
+CREATE TABLE IF NOT EXISTS cache_leases (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+"""
+
+
+class SQLiteCache(Cache):
+    """
+    Entries in a SQLite file (WAL mode) shared by every worker on the host.
+    Eviction is by age of the write (oldest first) once a namespace grows
+    past max_entries; it runs every few hundred writes, not on each one.
+    """
+
+    PRUNE_EVERY = 500
+
+    def __init__(self, namespace: str, max_entries: int, ttl: Optional[float] = None,
+                 path: Optional[str] = None):
+        super().__init__(namespace, max_entries, ttl)
+        self.path = path or settings.CACHE_SQLITE_PATH
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must stay on the thread that opened them
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SQLITE_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _report(self, action: str, e: Exception) -> None:
+        print(f"Cache '{self.namespace}' {action} failed: {e}", file=sys.stderr)
+        sys.stderr.flush()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        return self.get_many([key]).get(key, default)
+
+    def get_many(self, keys: Iterable[Hashable]) -> Dict[Hashable, Any]:
+        return {key: value for key, (value, _) in self.get_many_with_expiry(keys).items()}
+
+    def get_many_with_expiry(self, keys: Iterable[Hashable]) -> Dict[Hashable, Tuple[Any, Optional[float]]]:
+        by_text = {repr(key): key for key in keys}
+        texts = list(by_text)
+        found = {}
+        now = time.time()
+        try:
+            conn = self._connection()
+            for start in range(0, len(texts), BATCH_SIZE):
+                chunk = texts[start:start + BATCH_SIZE]
+                rows = conn.execute(
+                    f"SELECT key, value, expires_at FROM cache_entries "
+                    f"WHERE namespace = ? AND key IN ({','.join('?' * len(chunk))})",
+                    [self.namespace] + chunk
+                ).fetchall()
+                for key_text, blob, expires_at in rows:
+                    if expires_at is None or expires_at >= now:
+                        found[by_text[key_text]] = (pickle.loads(blob), expires_at)
+        except sqlite3.Error as e:
+            # A broken cache only costs recomputation
+            self._report("read", e)
+        return found
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, items: Dict[Hashable, Any], ttl: Optional[float] = None) -> None:
+        if not items:
+            return
+        expires_at = self._expiry(ttl)
+        now = time.time()
+        rows = [(self.namespace, repr(key), pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires_at, now)
+                for key, value in items.items()]
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany(
+                    "INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at, stored_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    rows
+                )
+            self._writes += len(rows)
+            if self._writes >= self.PRUNE_EVERY:
+                self._writes = 0
+                self._prune(conn)
+        except sqlite3.Error as e:
+            self._report("write", e)
+
+    def _prune(self, conn: sqlite3.Connection) -> None:
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND expires_at < ?",
+                         (self.namespace, time.time()))
+            conn.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND key IN ("
+                "  SELECT key FROM cache_entries WHERE namespace = ? ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+                (self.namespace, self.namespace, self.max_entries)
+            )
+
+    def delete(self, key: Hashable) -> None:
+        try:
+            self._connection().execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?",
+                                       (self.namespace, repr(key)))
+        except sqlite3.Error as e:
+            self._report("delete", e)
+
+    def clear(self) -> None:
+        try:
+            self._connection().execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+        except sqlite3.Error as e:
+            self._report("clear", e)
+
+    def _try_lease(self, conn: sqlite3.Connection, key_text: str) -> bool:
+        now = time.time()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM cache_leases WHERE namespace = ? AND key = ? AND expires_at < ?",
+                         (self.namespace, key_text, now))
+            cursor = conn.execute("INSERT OR IGNORE INTO cache_leases (namespace, key, expires_at) VALUES (?, ?, ?)",
+                                  (self.namespace, key_text, now + LEASE_SECONDS))
+            return cursor.rowcount == 1
+
+    @contextmanager
+    def _lease(self, key: Hashable):
+        """Holds the key's lease while computing; waits while another worker holds it."""
+        key_text = repr(key)
+        held = False
+        try:
+            conn = self._connection()
+            give_up_at = time.monotonic() + LEASE_SECONDS
+            while not (held := self._try_lease(conn, key_text)):
+                if self.get(key, MISSING) is not MISSING or time.monotonic() > give_up_at:
+                    break
+                time.sleep(LEASE_POLL_SECONDS)
+        except sqlite3.Error as e:
+            self._report("lease", e)
+        try:
+            yield
+        finally:
+            if held:
+                try:
+                    conn.execute("DELETE FROM cache_leases WHERE namespace = ? AND key = ?",
+                                 (self.namespace, key_text))
+                except sqlite3.Error as e:
+                    self._report("lease release", e)
+
+
+class RedisCache(Cache):
+    """Entries in a Redis-compatible server; Redis' own maxmemory policy does the eviction."""
+
+    def __init__(self, namespace: str, max_entries: int, ttl: Optional[float] = None,
+                 url: Optional[str] = None):
+        super().__init__(namespace, max_entries, ttl)
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("CACHE_BACKEND=redis needs the 'redis' package (pip install redis)") from e
+        self._client = _redis_client(redis, url or settings.CACHE_REDIS_URL)
+        self._error = redis.RedisError
+        self._prefix = f"{settings.CACHE_KEY_PREFIX}{namespace}:"
+
+    def _report(self, action: str, e: Exception) -> None:
+        print(f"Cache '{self.namespace}' {action} failed: {e}", file=sys.stderr)
+        sys.stderr.flush()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        return self.get_many([key]).get(key, default)
+
+    def get_many(self, keys: Iterable[Hashable]) -> Dict[Hashable, Any]:
+        keys = list(keys)
+        found = {}
+        try:
+            for start in range(0, len(keys), BATCH_SIZE):
+                chunk = keys[start:start + BATCH_SIZE]
+                for key, blob in zip(chunk, self._client.mget([self._prefix + repr(k) for k in chunk])):
+                    if blob is not None:
+                        found[key] = pickle.loads(blob)
+        except self._error as e:
+            self._report("read", e)
+        return found
+
+    def get_many_with_expiry(self, keys: Iterable[Hashable]) -> Dict[Hashable, Tuple[Any, Optional[float]]]:
+        keys = list(keys)
+        found = {}
+        try:
+            for start in range(0, len(keys), BATCH_SIZE):
+                chunk = keys[start:start + BATCH_SIZE]
+                pipe = self._client.pipeline(transaction=False)
+                for key in chunk:
+                    pipe.get(self._prefix + repr(key))
+                    pipe.pttl(self._prefix + repr(key))
+                replies = pipe.execute()
+                now = time.time()
+                for key, blob, pttl in zip(chunk, replies[::2], replies[1::2]):
+                    if blob is not None:
+                        # PTTL is -1 for keys without an expiry
+                        found[key] = (pickle.loads(blob), now + pttl / 1000.0 if pttl >= 0 else None)
+        except self._error as e:
+            self._report("read", e)
+        return found
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, items: Dict[Hashable, Any], ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        try:
+            pipe = self._client.pipeline(transaction=False)
+            for key, value in items.items():
+                pipe.set(self._prefix + repr(key), pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                         px=int(ttl * 1000) if ttl else None)
+            pipe.execute()
+        except self._error as e:
+            self._report("write", e)
+
+    def delete(self, key: Hashable) -> None:
+        try:
+            self._client.delete(self._prefix + repr(key))
+        except self._error as e:
+            self._report("delete", e)
+
+    def clear(self) -> None:
+        try:
+            for name in self._client.scan_iter(match=self._prefix + "*", count=1000):
+                self._client.delete(name)
+        except self._error as e:
+            self._report("clear", e)
+
+    @contextmanager
+    def _lease(self, key: Hashable):
+        lease_key = f"{self._prefix}lease:{key!r}"
+        held = False
+        try:
+            give_up_at = time.monotonic() + LEASE_SECONDS
+            while not (held := bool(self._client.set(lease_key, b"1", nx=True, px=int(LEASE_SECONDS * 1000)))):
+                if self.get(key, MISSING) is not MISSING or time.monotonic() > give_up_at:
+                    break
+                time.sleep(LEASE_POLL_SECONDS)
+        except self._error as e:
+            self._report("lease", e)
+        try:
+            yield
+        finally:
+            if held:
+                try:
+                    self._client.delete(lease_key)
+                except self._error as e:
+                    self._report("lease release", e)
+
+
+_redis_clients: Dict[str, Any] = {}
+
+
+def _redis_client(redis_module, url: str):
+    # One connection pool per URL for all namespaces
+    if url not in _redis_clients:
+        _redis_clients[url] = redis_module.Redis.from_url(url)
+    return _redis_clients[url]
+
+
+class TieredCache(Cache):
+    """A small in-process LRU in front of a shared backend (reads fill it, writes go to both)."""
+
+    def __init__(self, front: LocalCache, back: Cache):
+        super().__init__(back.namespace, back.max_entries, back.ttl)
+        self.front = front
+        self.back = back
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        value = self.front.get(key, MISSING)
+        if value is MISSING:
+            entry = self.back.get_many_with_expiry([key]).get(key)
+            if entry is None:
+                return default
+            self._fill_front({key: entry})
+            value = entry[0]
+        return value
+
+    def get_many(self, keys: Iterable[Hashable]) -> Dict[Hashable, Any]:
+        return {key: value for key, (value, _) in self.get_many_with_expiry(keys).items()}
+
+    def get_many_with_expiry(self, keys: Iterable[Hashable]) -> Dict[Hashable, Tuple[Any, Optional[float]]]:
+        keys = list(keys)
+        found = self.front.get_many_with_expiry(keys)
+        if len(found) < len(keys):
+            fetched = self.back.get_many_with_expiry([key for key in keys if key not in found])
+            if fetched:
+                self._fill_front(fetched)
+                found.update(fetched)
+        return found
+
+    def _fill_front(self, entries: Dict[Hashable, Tuple[Any, Optional[float]]]) -> None:
+        # A copy never outlives its source: capped at the shared entry's own expiry
+        front_until = time.time() + self.front.ttl if self.front.ttl else None
+        capped = {}
+        for key, (value, expires_at) in entries.items():
+            if front_until is not None and (expires_at is None or front_until < expires_at):
+                expires_at = front_until
+            capped[key] = (value, expires_at)
+        self.front.set_many_with_expiry(capped)
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        self.back.set(key, value, ttl)
+        self.front.set(key, value, self._front_ttl(ttl))
+
+    def set_many(self, items: Dict[Hashable, Any], ttl: Optional[float] = None) -> None:
+        self.back.set_many(items, ttl)
+        self.front.set_many(items, self._front_ttl(ttl))
+
+    def _front_ttl(self, ttl: Optional[float]) -> Optional[float]:
+        ttl = self.ttl if ttl is None else ttl
+        return min(ttl, self.front.ttl) if ttl else self.front.ttl
+
+    def delete(self, key: Hashable) -> None:
+        self.back.delete(key)
+        self.front.delete(key)
+
+    def clear(self) -> None:
+        self.back.clear()
+        self.front.clear()
+
+    def _lease(self, key: Hashable):
+        return self.back._lease(key)
+
+    def __len__(self) -> int:
+        return len(self.front)
+
+
+_caches: Dict[str, Cache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(namespace: str, max_entries: int, ttl: Optional[float] = None, local_only: bool = False,
+              persistent: bool = False, local_front: bool = True) -> Cache:
+    """
+    The cache named `namespace` on the configured backend (created on first use).
+    `local_only` keeps it in-process whatever the backend, for values that are
+    cheap to rebuild or must not leave the process. `persistent` is for values
+    that are expensive to get again (e.g. rate-limited lookups): on the local
+    backend they go to the SQLite file. `local_front=False` skips the in-process
+    copy of a shared backend, for small values every worker must see change at
+    once (each read then goes to the backend).
+    """
+    with _caches_lock:
+        existing = _caches.get(namespace)
+        if existing is not None:
+            return existing
+        backend = "local" if local_only else settings.CACHE_BACKEND
+        if persistent and backend == "local":
+            backend = "sqlite"
+        if backend == "local":
+            created: Cache = LocalCache(namespace, max_entries, ttl)
+        elif backend in ("sqlite", "redis"):
+            back = SQLiteCache(namespace, max_entries, ttl) if backend == "sqlite" \
+                else RedisCache(namespace, max_entries, ttl)
+            if local_front:
+                front = LocalCache(namespace, min(max_entries, settings.CACHE_LOCAL_MAX_ENTRIES),
+                                   settings.CACHE_LOCAL_TTL)
+                created = TieredCache(front, back)
+            else:
+                created = back
+        else:
+            raise ValueError(f"CACHE_BACKEND must be 'local', 'sqlite' or 'redis', got {backend!r}")
+        _caches[namespace] = created
+        return created
@@ -0,0 +1,296 @@
+# File: app/core/cassette.py
+
+"""
+Record/replay of outbound HTTP traffic (ORS, Supabase, hotel service).
+
+With CASSETTE_MODE=record, every request made through `transport()` is sent
+as usual and the request/response pair is appended to a gzip-compressed
+JSON-lines cassette. With CASSETTE_MODE=replay, nothing leaves the process.
+Responses are served from the cassette, matched on method, URL and body.
+Identical requests are answered in the order they were recorded. Replay can
+keep the recorded latency of each call (CASSETTE_REPLAY_LATENCY=original) or
+answer immediately (none).
+
+Credentials are never written: request headers are not stored, and the
+`api_key` query parameter is stripped from URLs.
+
+A specific cassette can also be used from a script:
+
+    with use_cassette("slow-plan.cassette.gz", "replay"):
+        plan_service.generate_trip_plan(request, user_id)
+
+Outbound clients are created lazily, on first use or by the startup
+prewarm, and take their transport at that point:
+  - The pooled ORS client and the async Supabase client (endpoints) always
+    use CassetteTransport / AsyncCassetteTransport. These pass requests
+    straight through while no cassette is active, so `use_cassette` covers
+    them whenever it is entered.
+  - The sync Supabase client (planning) and the hotel service client only
+    get the transport if a cassette is active when they are created. That
+    means CASSETTE_MODE at startup, or a `use_cassette` block around their
+    first use.
+"""
+
+import asyncio
+import base64
+import gzip
+import hashlib
+import json
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Optional, Tuple
+
+import httpx
+from app.core.config import settings
+
+MODES = ("off", "record", "replay")
+SECRET_PARAMS = ("api_key",)
+# Response headers worth keeping; the rest (dates, cookies, tracing ids) are noise
+KEPT_RESPONSE_HEADERS = ("content-type", "content-encoding", "content-range", "location")
+
+
+class CassetteMissError(httpx.TransportError):
+    """Replay mode got a request the cassette has no recording for."""
+
+
+def _request_key(method: str, url: httpx.URL, body: bytes) -> Tuple[str, str, str]:
+    try:
+        # JSON bodies are compared by content, not by key order or whitespace
+        body = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":")).encode()
+    except ValueError:
+        pass
+    return method, _match_url(url), hashlib.sha1(body).hexdigest()
+
+
+def _redact(url: httpx.URL) -> httpx.URL:
+    params = url.params
+    for name in SECRET_PARAMS:
+        params = params.remove(name)
+    return url.copy_with(params=params)
+
+
+def _match_url(url: httpx.URL) -> str:
+    # postgrest builds `columns` from a set, so its order changes between processes
+    items = sorted(
+        (key, ",".join(sorted(value.split(","))) if key == "columns" else value)
+        for key, value in _redact(url).params.multi_items()
+    )
+    return str(url.copy_with(params=items))
+
+
+def _encode_body(content: bytes) -> Dict[str, str]:
+    try:
+        return {"text": content.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"b64": base64.b64encode(content).decode("ascii")}
+
+
+def _decode_body(entry: Dict[str, str]) -> bytes:
+    if "b64" in entry:
+        return base64.b64decode(entry["b64"])
+    return entry.get("text", "").encode("utf-8")
+
+
+class Cassette:
+    """One cassette file, opened for either recording or replay."""
+
+    def __init__(self, path: str, mode: str, replay_latency: str = "original"):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Cassette mode must be 'record' or 'replay', got {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.replay_latency = replay_latency
+        self._lock = threading.Lock()
+        self._file: Optional[gzip.GzipFile] = None
+        self._recorded: Dict[Tuple[str, str, str], Deque[dict]] = defaultdict(deque)
+        if mode == "replay":
+            self._load()
+
+    def _load(self) -> None:
+        count = 0
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            try:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    self._recorded[tuple(entry["key"])].append(entry)
+                    count += 1
+            except EOFError:
+                # The recording process stopped mid-write; keep every complete entry
+                pass
+        print(f"--- Cassette: loaded {count} interactions from {self.path} ---")
+
+    def record(self, request: httpx.Request, response: httpx.Response, content: bytes, elapsed: float) -> None:
+        entry = {
+            "key": list(_request_key(request.method, request.url, request.content)),
+            "request": {"method": request.method, "url": str(_redact(request.url)), **_encode_body(request.content)},
+            "response": {
+                "status_code": response.status_code,
+                "headers": [[k, v] for k, v in response.headers.items() if k.lower() in KEPT_RESPONSE_HEADERS],
+                **_encode_body(content)
+            },
+            "elapsed": round(elapsed, 4)
+        }
+        line = (json.dumps(entry, separators=(",", ":")) + "\n").encode("utf-8")
+        with self._lock:
+            if self._file is None:
+                self._file = gzip.open(self.path, "ab")
+            self._file.write(line)
+            # Sync-flush so the cassette stays readable if the process dies
+            self._file.flush()
+
+    def _next_entry(self, request: httpx.Request) -> dict:
+        key = _request_key(request.method, request.url, request.content)
+        with self._lock:
+            queue = self._recorded.get(key)
+            if not queue:
+                raise CassetteMissError(f"No recorded response for {request.method} {_redact(request.url)}", request=request)
+            # The last recording keeps answering once earlier ones are used up
+            return queue.popleft() if len(queue) > 1 else queue[0]
+
+    def _replay_delay(self, entry: dict) -> float:
+        return entry["elapsed"] if self.replay_latency == "original" else 0.0
+
+    @staticmethod
+    def _recorded_response(request: httpx.Request, entry: dict) -> httpx.Response:
+        recorded = entry["response"]
+        return httpx.Response(
+            recorded["status_code"],
+            headers=recorded["headers"],
+            content=_decode_body(recorded),
+            request=request
+        )
+
+    def replay(self, request: httpx.Request) -> httpx.Response:
+        entry = self._next_entry(request)
+        time.sleep(self._replay_delay(entry))
+        return self._recorded_response(request, entry)
+
+    async def replay_async(self, request: httpx.Request) -> httpx.Response:
+        entry = self._next_entry(request)
+        await asyncio.sleep(self._replay_delay(entry))
+        return self._recorded_response(request, entry)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class CassetteTransport(httpx.BaseTransport):
+    """httpx transport that records to, or replays from, the active cassette."""
+
+    def __init__(self, **transport_kwargs):
+        self._wrapped = httpx.HTTPTransport(**transport_kwargs)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        cassette = active_cassette()
+        if cassette is None:
+            return self._wrapped.handle_request(request)
+        if cassette.mode == "replay":
+            return cassette.replay(request)
+
+        started = time.perf_counter()
+        response = self._wrapped.handle_request(request)
+        try:
+            # Raw bytes, still content-encoded, exactly as they came off the wire
+            content = b"".join(response.stream)
+        finally:
+            response.close()
+        cassette.record(request, response, content, time.perf_counter() - started)
+        return httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            content=content,
+            request=request,
+            extensions=response.extensions
+        )
+
+    def close(self) -> None:
+        self._wrapped.close()
+
+
+class AsyncCassetteTransport(httpx.AsyncBaseTransport):
+    """Async twin of CassetteTransport, for httpx.AsyncClient."""
+
+    def __init__(self, **transport_kwargs):
+        self._wrapped = httpx.AsyncHTTPTransport(**transport_kwargs)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        cassette = active_cassette()
+        if cassette is None:
+            return await self._wrapped.handle_async_request(request)
+        if cassette.mode == "replay":
+            return await cassette.replay_async(request)
+
+        started = time.perf_counter()
+        response = await self._wrapped.handle_async_request(request)
+        try:
+            content = b"".join([chunk async for chunk in response.stream])
+        finally:
+            await response.aclose()
+        cassette.record(request, response, content, time.perf_counter() - started)
+        return httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            content=content,
+            request=request,
+            extensions=response.extensions
+        )
+
+    async def aclose(self) -> None:
+        await self._wrapped.aclose()
+
+
+_active: Optional[Cassette] = None
+_active_lock = threading.Lock()
+
+
+def active_cassette() -> Optional[Cassette]:
+    """The cassette set by `use_cassette`, else the one configured in settings (if any)."""
+    global _active
+    if _active is None and settings.CASSETTE_MODE != "off":
+        with _active_lock:
+            if _active is None:
+                if settings.CASSETTE_MODE not in MODES:
+                    raise ValueError(f"CASSETTE_MODE must be one of {MODES}, got {settings.CASSETTE_MODE!r}")
+                _active = Cassette(settings.CASSETTE_PATH, settings.CASSETTE_MODE, settings.CASSETTE_REPLAY_LATENCY)
+                print(f"--- Cassette {settings.CASSETTE_MODE} mode: {settings.CASSETTE_PATH} ---", file=sys.stderr)
+    return _active
+
+
+@contextmanager
+def use_cassette(path: str, mode: str, replay_latency: str = "original"):
+    """Records or replays all outbound traffic to/from `path` inside the block."""
+    global _active
+    cassette = Cassette(path, mode, replay_latency)
+    with _active_lock:
+        previous, _active = _active, cassette
+    try:
+        yield cassette
+    finally:
+        with _active_lock:
+            _active = previous
+        cassette.close()
+
+
+def transport(**transport_kwargs) -> Optional[httpx.BaseTransport]:
+    """
+    Transport for a new outbound httpx client. None (httpx's default) when no
+    cassette is active, so normal traffic goes through unchanged.
+    """
+    if active_cassette() is None:
+        return None
+    return CassetteTransport(**transport_kwargs)
+
+
+def async_transport(**transport_kwargs) -> Optional[httpx.AsyncBaseTransport]:
+    """Like transport(), for a new httpx.AsyncClient."""
+    if active_cassette() is None:
+        return None
+    return AsyncCassetteTransport(**transport_kwargs)
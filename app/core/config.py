@@ -1,31 +1,193 @@
 
 
 import os
-from dotenv import load_dotenv
+import threading
+from typing import Optional
 
-# Load environment variables from .env file
-load_dotenv()
+from dotenv import load_dotenv
 
-# +++ ADD THIS DEBUG LINE +++
-print(f"--- DEBUG: ORS_API_KEY loaded as: {os.getenv('ORS_API_KEY')} ---")
-# +++++++++++++++++++++++++++
 
 class Settings:
-    SUPABASE_URL: str = os.getenv("SUPABASE_URL")
-    SUPABASE_KEY: str = os.getenv("SUPABASE_KEY")
-    ORS_API_KEY: str = os.getenv("ORS_API_KEY")
-    CLERK_SECRET_KEY: str = os.getenv("CLERK_SECRET_KEY") # Keep this, just in case
-    CLERK_ISSUER_URL: str = os.getenv("CLERK_ISSUER_URL") # <-- ADD THIS
-
-    # --- NEW ---
-    # Add the URL for the external hotel service.
-    # We use os.getenv to make it configurable in the .env file,
-    # but provide a default placeholder IP as requested.
-    HOTEL_SERVICE_URL: str = os.getenv("HOTEL_SERVICE_URL", "http://10.88.174.1:8085/")
-    # --- END NEW ---
-
-    # Bandaranaike International Airport (Katunayake)
-    STARTING_POINT_COORDS: tuple[float, float] = (79.8841, 7.1807)
-    DAILY_BUDGET_PER_PERSON: int = 150
-
-settings = Settings()
\ No newline at end of file
+    """
+    The app's configuration, from the environment and the .env file. Importing
+    this module reads nothing: the values are loaded on first access to any
+    setting, or by an explicit load().
+    """
+
+    def __init__(self):
+        self._load_lock = threading.Lock()
+        self._loaded = False
+
+    def load(self, dotenv_path: Optional[str] = None) -> "Settings":
+        """Reads .env into the environment (real environment variables win), then every setting."""
+        with self._load_lock:
+            load_dotenv(dotenv_path)
+            self._read_environment()
+            self._loaded = True
+        return self
+
+    def __getattr__(self, name: str):
+        # Only reached for settings not read yet, i.e. before the first load()
+        if name.startswith("_") or self._loaded:
+            raise AttributeError(name)
+        with self._load_lock:
+            loaded = self._loaded
+        if not loaded:
+            self.load()
+        return getattr(self, name)
+
+    def _read_environment(self) -> None:
+        self.SUPABASE_URL: str = os.getenv("SUPABASE_URL")
+        self.SUPABASE_KEY: str = os.getenv("SUPABASE_KEY")
+        # Async Supabase client used by the endpoints (app/db/supabase_client.py): pooled
+        # connections and per-request timeout in seconds
+        self.SUPABASE_MAX_CONNECTIONS: int = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "50"))
+        self.SUPABASE_TIMEOUT: float = float(os.getenv("SUPABASE_TIMEOUT", "30"))
+        self.ORS_API_KEY: str = os.getenv("ORS_API_KEY")
+        self.ORS_BASE_URL: str = os.getenv("ORS_BASE_URL", "https://api.openrouteservice.org")
+        self.CLERK_SECRET_KEY: str = os.getenv("CLERK_SECRET_KEY") # Keep this, just in case
+        self.CLERK_ISSUER_URL: str = os.getenv("CLERK_ISSUER_URL") # <-- ADD THIS
+
+        # --- NEW ---
+        # Add the URL for the external hotel service.
+        # We use os.getenv to make it configurable in the .env file,
+        # but provide a default placeholder IP as requested.
+        self.HOTEL_SERVICE_URL: str = os.getenv("HOTEL_SERVICE_URL", "http://10.88.174.1:8085/")
+        # --- END NEW ---
+
+        # Hotel lookups run in the background (app/services/hotel_service.py): per-call deadline
+        # in seconds, pooled connections, and the circuit breaker thresholds
+        self.HOTEL_SERVICE_TIMEOUT: float = float(os.getenv("HOTEL_SERVICE_TIMEOUT", "2.0"))
+        self.HOTEL_SERVICE_MAX_CONNECTIONS: int = int(os.getenv("HOTEL_SERVICE_MAX_CONNECTIONS", "20"))
+        self.HOTEL_BREAKER_FAILURES: int = int(os.getenv("HOTEL_BREAKER_FAILURES", "5"))
+        self.HOTEL_BREAKER_RESET_SECONDS: float = float(os.getenv("HOTEL_BREAKER_RESET_SECONDS", "30"))
+
+        # Where nearest hotels come from: "service" (HOTEL_SERVICE_URL) or "local" (in-process
+        # index, see app/services/hotel_index.py). The local dataset is HOTEL_DATASET_PATH if set,
+        # else the Supabase table HOTEL_DATASET_TABLE; HOTEL_NEAREST_K hotels are returned per day.
+        self.HOTEL_BACKEND: str = os.getenv("HOTEL_BACKEND", "service")
+        self.HOTEL_DATASET_PATH: str = os.getenv("HOTEL_DATASET_PATH", "")
+        self.HOTEL_DATASET_TABLE: str = os.getenv("HOTEL_DATASET_TABLE", "hotels")
+        self.HOTEL_NEAREST_K: int = int(os.getenv("HOTEL_NEAREST_K", "3"))
+
+        # Worker threads for sync endpoints (0 = Starlette's default of 40)
+        self.THREADPOOL_SIZE: int = int(os.getenv("THREADPOOL_SIZE", "0"))
+
+        # CPU-bound planning stages (app/services/planner_pool.py): "inline" or "process".
+        # With "process", PLANNER_PROCESSES workers (0 = one per CPU) take the stages whose
+        # work reaches the thresholds: matrix cells scanned by the day selection, and
+        # route coordinates to simplify/encode.
+        self.PLANNER_EXECUTOR: str = os.getenv("PLANNER_EXECUTOR", "inline")
+        self.PLANNER_PROCESSES: int = int(os.getenv("PLANNER_PROCESSES", "0"))
+        self.PLANNER_OFFLOAD_MIN_STEPS: int = int(os.getenv("PLANNER_OFFLOAD_MIN_STEPS", "200000"))
+        self.PLANNER_OFFLOAD_MIN_POINTS: int = int(os.getenv("PLANNER_OFFLOAD_MIN_POINTS", "20000"))
+
+        # Upper limit for POST /trips/generate-plans/batch
+        self.MAX_BATCH_PLANS: int = int(os.getenv("MAX_BATCH_PLANS", "50"))
+
+        # Time budgets in seconds (0 = none), see app/core/deadline.py. PLAN_SAVE_RESERVE_SECONDS
+        # of the budget is kept for saving the trip; of the rest, when less than
+        # PLAN_MATRIX_MIN_SECONDS is left an uncached duration matrix is estimated instead of fetched,
+        # below PLAN_GEOMETRY_MIN_SECONDS days get route refs instead of inline geometry, and once it
+        # is used up no further days are planned.
+        self.GENERATE_PLAN_DEADLINE: float = float(os.getenv("GENERATE_PLAN_DEADLINE", "10"))
+        self.BATCH_PLAN_DEADLINE: float = float(os.getenv("BATCH_PLAN_DEADLINE", "120"))
+        self.PLAN_GEOMETRY_MIN_SECONDS: float = float(os.getenv("PLAN_GEOMETRY_MIN_SECONDS", "3"))
+        self.PLAN_MATRIX_MIN_SECONDS: float = float(os.getenv("PLAN_MATRIX_MIN_SECONDS", "4"))
+        self.PLAN_SAVE_RESERVE_SECONDS: float = float(os.getenv("PLAN_SAVE_RESERVE_SECONDS", "1.5"))
+        # Per-call timeout for ORS requests (httpx's default), further capped by the request budget
+        self.ORS_REQUEST_TIMEOUT: float = float(os.getenv("ORS_REQUEST_TIMEOUT", "5"))
+
+        # Route geometries (GET /trips/routes/{ref} and the in-memory route cache)
+        self.ROUTE_CACHE_MAX_ENTRIES: int = int(os.getenv("ROUTE_CACHE_MAX_ENTRIES", "5000"))
+        self.ROUTE_GEOMETRY_MAX_AGE: int = int(os.getenv("ROUTE_GEOMETRY_MAX_AGE", str(30 * 24 * 3600)))  # seconds
+        self.MAX_ROUTE_REF_POINTS: int = 25
+        self.POLYLINE_PRECISION: int = 5  # Decimal places kept by the encoded polyline format
+
+        # Persisted route segments (SQLite, see app/services/segment_store.py); empty disables
+        self.ROUTE_SEGMENT_STORE_PATH: str = os.getenv("ROUTE_SEGMENT_STORE_PATH", "var/route_segments.sqlite3")
+
+        # ORS matrix tiling: max sources x destinations per request, parallel tiles, retries per tile
+        self.ORS_MATRIX_MAX_ELEMENTS: int = int(os.getenv("ORS_MATRIX_MAX_ELEMENTS", "3500"))
+        self.ORS_MATRIX_CONCURRENCY: int = int(os.getenv("ORS_MATRIX_CONCURRENCY", "4"))
+        self.ORS_MATRIX_TILE_RETRIES: int = int(os.getenv("ORS_MATRIX_TILE_RETRIES", "2"))
+        # Pooled ORS connections shared by all requests
+        self.ORS_MAX_CONNECTIONS: int = int(os.getenv("ORS_MAX_CONNECTIONS", "20"))
+
+        self.DURATION_CACHE_MAX_ENTRIES: int = int(os.getenv("DURATION_CACHE_MAX_ENTRIES", "500000"))
+
+        # Batch geocoding (ors_service.geocode_locations): ORS geocode rate limit, parallel
+        # requests and retries per name, and how long names stay in the persistent cache
+        # (seconds; names ORS found nothing for are retried sooner)
+        self.ORS_GEOCODE_RATE_PER_MINUTE: float = float(os.getenv("ORS_GEOCODE_RATE_PER_MINUTE", "100"))
+        self.ORS_GEOCODE_CONCURRENCY: int = int(os.getenv("ORS_GEOCODE_CONCURRENCY", "4"))
+        self.ORS_GEOCODE_RETRIES: int = int(os.getenv("ORS_GEOCODE_RETRIES", "3"))
+        self.GEOCODE_CACHE_MAX_ENTRIES: int = int(os.getenv("GEOCODE_CACHE_MAX_ENTRIES", "200000"))
+        self.GEOCODE_CACHE_TTL: float = float(os.getenv("GEOCODE_CACHE_TTL", str(90 * 24 * 3600)))
+        self.GEOCODE_NOT_FOUND_TTL: float = float(os.getenv("GEOCODE_NOT_FOUND_TTL", str(24 * 3600)))
+
+        # Where caches live (see app/core/cache.py): "local" (per process), "sqlite" (one WAL file
+        # shared by all workers on the host) or "redis" (needs the redis package). Shared backends
+        # keep up to CACHE_LOCAL_MAX_ENTRIES per cache in process for CACHE_LOCAL_TTL seconds.
+        self.CACHE_BACKEND: str = os.getenv("CACHE_BACKEND", "local")
+        self.CACHE_SQLITE_PATH: str = os.getenv("CACHE_SQLITE_PATH", "var/cache.sqlite3")
+        self.CACHE_REDIS_URL: str = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+        self.CACHE_KEY_PREFIX: str = os.getenv("CACHE_KEY_PREFIX", "travel-planner:")
+        self.CACHE_LOCAL_MAX_ENTRIES: int = int(os.getenv("CACHE_LOCAL_MAX_ENTRIES", "50000"))
+        self.CACHE_LOCAL_TTL: float = float(os.getenv("CACHE_LOCAL_TTL", "300"))
+        self.LOCATION_CACHE_MAX_ENTRIES: int = int(os.getenv("LOCATION_CACHE_MAX_ENTRIES", "100000"))
+        self.JWKS_CACHE_TTL: float = float(os.getenv("JWKS_CACHE_TTL", "3600"))
+
+        # Startup prewarm (see app/main.py): /ready answers 503 until it finishes, or until
+        # PREWARM_TIMEOUT seconds have passed. PREWARM_LOCATION_CATALOG loads the whole
+        # locations table into the catalog cache.
+        self.PREWARM_TIMEOUT: float = float(os.getenv("PREWARM_TIMEOUT", "30"))
+        self.PREWARM_LOCATION_CATALOG: bool = os.getenv("PREWARM_LOCATION_CATALOG", "true").lower() in ("1", "true", "yes")
+
+        # Routing backend for durations and route geometry: "ors" (public API) or "local"
+        # (offline road graph, see app/services/routing_engine.py)
+        self.ROUTING_BACKEND: str = os.getenv("ROUTING_BACKEND", "ors")
+        self.ROAD_GRAPH_PATH: str = os.getenv(
+            "ROAD_GRAPH_PATH",
+            os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "sri_lanka_fixture_graph.json")
+        )
+        self.ROUTING_BACKWARD_CACHE_SIZE: int = 20000  # Cached CH backward search spaces (one per destination node)
+
+        # Responses smaller than this (bytes) are sent uncompressed
+        self.COMPRESSION_MIN_SIZE: int = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+
+        # Precomputed candidate lists per interest combination (plan_service.get_candidate_list):
+        # seconds before an entry is rebuilt in the background, and how many combinations to keep.
+        self.CANDIDATE_LIST_TTL: int = int(os.getenv("CANDIDATE_LIST_TTL", "600"))
+        self.CANDIDATE_LIST_MAX_COMBOS: int = int(os.getenv("CANDIDATE_LIST_MAX_COMBOS", "256"))
+        # Token for POST /api/v1/catalog/invalidate (X-Admin-Token header); empty disables the endpoint
+        self.CATALOG_ADMIN_TOKEN: str = os.getenv("CATALOG_ADMIN_TOKEN", "")
+        # Combinations built at startup, e.g. "nature+beach,history+culture"
+        self.PRECOMPUTE_INTEREST_COMBOS: list[list[str]] = [
+            [tag.strip() for tag in combo.split("+") if tag.strip()]
+            for combo in os.getenv("PRECOMPUTE_INTEREST_COMBOS", "").split(",") if combo.strip()
+        ]
+
+        # Record/replay of outbound ORS, Supabase and hotel traffic (see app/core/cassette.py):
+        # mode "off", "record" or "replay"; replay latency "original" or "none"
+        self.CASSETTE_MODE: str = os.getenv("CASSETTE_MODE", "off")
+        self.CASSETTE_PATH: str = os.getenv("CASSETTE_PATH", "cassettes/default.cassette.gz")
+        self.CASSETTE_REPLAY_LATENCY: str = os.getenv("CASSETTE_REPLAY_LATENCY", "original")
+
+        # Per-request sampling profiler (see app/core/profiling.py). Requests sending
+        # X-Profile-Token == PROFILER_TOKEN are profiled; PROFILE_ALL_REQUESTS profiles everything.
+        self.PROFILER_TOKEN: str = os.getenv("PROFILER_TOKEN", "")
+        self.PROFILE_ALL_REQUESTS: bool = os.getenv("PROFILE_ALL_REQUESTS", "false").lower() in ("1", "true", "yes")
+        self.PROFILER_OUTPUT_DIR: str = os.getenv("PROFILER_OUTPUT_DIR", "var/profiles")
+        self.PROFILER_INTERVAL_MS: float = float(os.getenv("PROFILER_INTERVAL_MS", "5"))
+
+        # Bandaranaike International Airport (Katunayake)
+        self.STARTING_POINT_COORDS: tuple[float, float] = (79.8841, 7.1807)
+        self.DAILY_BUDGET_PER_PERSON: int = 150
+        # Day scheduling: hours of driving + visits per day, and the visit length of
+        # locations without a visit_duration_minutes value
+        self.DAILY_HOURS_BUDGET: float = float(os.getenv("DAILY_HOURS_BUDGET", "8"))
+        self.DEFAULT_VISIT_MINUTES: float = float(os.getenv("DEFAULT_VISIT_MINUTES", "90"))
+
+
+settings = Settings()
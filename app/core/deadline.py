@@ -0,0 +1,120 @@
+# File: app/core/deadline.py
+
+"""
+Per-request time budgets.
+
+An endpoint opens a budget with `request_deadline(seconds)`. Code further
+down (ors_service, plan_service) reads it through a context variable. It
+never needs the budget passed in as an argument:
+
+    with deadline.request_deadline(settings.GENERATE_PLAN_DEADLINE):
+        plan_service.generate_trip_plan(request, user_id)
+
+- `remaining()` is the time left in seconds, or None when there is no budget.
+- `timeout(default)` caps an outbound call's timeout at that.
+- `holding_back(seconds)` keeps part of the budget for later work, such as
+  the final save.
+- `degrade(flag)` records that the answer was simplified to meet the budget.
+
+A nested `request_deadline` can only shorten the budget. It collects its own
+flags, so a batch item reports only its own degradations.
+
+Context variables are not inherited by new threads. To run work inside the
+budget on a pool, submit it with `contextvars.copy_context().run`.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+# Never hand httpx a zero/negative timeout; callers check expired() to skip calls instead
+MIN_TIMEOUT = 0.05
+
+
+class Budget:
+    __slots__ = ("expires_at", "degradations")
+
+    def __init__(self, expires_at: Optional[float]):
+        self.expires_at = expires_at
+        self.degradations: List[str] = []
+
+
+_budget: ContextVar[Optional[Budget]] = ContextVar("request_budget", default=None)
+
+
+@contextmanager
+def request_deadline(seconds: Optional[float] = None):
+    """
+    Runs the block under a budget of `seconds` (None or 0: no new limit, but
+    still a fresh set of degradation flags). Yields the Budget.
+    """
+    outer = _budget.get()
+    expires_at = outer.expires_at if outer is not None else None
+    if seconds:
+        own = time.monotonic() + seconds
+        expires_at = own if expires_at is None else min(expires_at, own)
+    budget = Budget(expires_at)
+    token = _budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _budget.reset(token)
+
+
+@contextmanager
+def holding_back(seconds: float):
+    """
+    Runs the block as if the budget ended `seconds` earlier, keeping that
+    time for the work that follows (e.g. saving the plan).
+    """
+    budget = _budget.get()
+    if budget is None or budget.expires_at is None:
+        yield
+        return
+    original = budget.expires_at
+    budget.expires_at = original - seconds
+    try:
+        yield
+    finally:
+        budget.expires_at = original
+
+
+def remaining() -> Optional[float]:
+    """Seconds left in the current budget (may be negative), or None if there is none."""
+    budget = _budget.get()
+    if budget is None or budget.expires_at is None:
+        return None
+    return budget.expires_at - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def below(seconds: float) -> bool:
+    """True if a budget is set and less than `seconds` of it is left."""
+    left = remaining()
+    return left is not None and left < seconds
+
+
+def timeout(default: Optional[float]) -> Optional[float]:
+    """`default` capped at the remaining budget."""
+    left = remaining()
+    if left is None:
+        return default
+    left = max(left, MIN_TIMEOUT)
+    return left if default is None else min(default, left)
+
+
+def degrade(flag: str) -> None:
+    """Records a quality downgrade on the current budget (no-op without one)."""
+    budget = _budget.get()
+    if budget is not None and flag not in budget.degradations:
+        budget.degradations.append(flag)
+
+
+def degradations() -> List[str]:
+    budget = _budget.get()
+    return list(budget.degradations) if budget is not None else []
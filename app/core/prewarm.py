@@ -0,0 +1,70 @@
+# File: app/core/prewarm.py
+
+"""
+Startup prewarm and readiness.
+
+The app lifespan starts `run(steps)` in the background and does not wait for
+it. Steps run concurrently. Plain functions run in worker threads and
+coroutine functions run on the event loop. Until every step has finished,
+or PREWARM_TIMEOUT has passed, `is_ready()` is False and GET /ready answers
+503, so load balancers keep traffic away from a cold worker.
+
+A failed step does not block readiness. It is reported by `status()`, and
+the layer it was warming still fills itself on first use.
+"""
+
+import asyncio
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Union
+
+Step = Callable[[], Union[Any, Awaitable[Any]]]
+
+_steps: Dict[str, Dict[str, Any]] = {}
+_ready = False
+_started_at: Optional[float] = None
+
+
+async def _run_step(name: str, step: Step) -> None:
+    started = time.perf_counter()
+    try:
+        if asyncio.iscoroutinefunction(step):
+            result = await step()
+        else:
+            result = await asyncio.to_thread(step)
+    except Exception as e:
+        _steps[name] = {"status": "failed", "error": repr(e)}
+        print(f"Prewarm step {name} failed: {e!r}", file=sys.stderr)
+        sys.stderr.flush()
+        return
+    _steps[name] = {"status": "ok", "seconds": round(time.perf_counter() - started, 3)}
+    # Steps may return a count worth reporting (e.g. rows loaded)
+    if isinstance(result, (int, float, str)):
+        _steps[name]["result"] = result
+
+
+async def run(steps: Dict[str, Step], timeout: float) -> None:
+    """Runs all steps concurrently and marks the process ready when they finish (or time out)."""
+    global _ready, _started_at
+    _ready = False
+    _started_at = time.perf_counter()
+    _steps.clear()
+    _steps.update({name: {"status": "pending"} for name in steps})
+    tasks = [asyncio.ensure_future(_run_step(name, step)) for name, step in steps.items()]
+    if tasks:
+        # Worker threads can't be cancelled; slow steps keep going and report when done
+        await asyncio.wait(tasks, timeout=timeout)
+    late = [name for name, state in _steps.items() if state["status"] == "pending"]
+    if late:
+        print(f"Prewarm timed out after {timeout}s; still running: {', '.join(late)}", file=sys.stderr)
+        sys.stderr.flush()
+    _ready = True
+    print(f"--- Prewarm finished in {time.perf_counter() - _started_at:.2f}s; ready ---")
+
+
+def is_ready() -> bool:
+    return _ready
+
+
+def status() -> Dict[str, Any]:
+    return {"status": "ready" if _ready else "warming", "steps": dict(_steps)}
@@ -0,0 +1,119 @@
+# File: app/core/profiling.py
+
+"""
+Opt-in sampling profiler for single requests.
+
+Profiling happens when the request sends X-Profile-Token matching
+PROFILER_TOKEN (admin only), or for every request when PROFILE_ALL_REQUESTS
+is set (staging). While the wrapped code runs, a background thread samples
+the request thread's stack every PROFILER_INTERVAL_MS. The samples are
+written to PROFILER_OUTPUT_DIR in the "folded stacks" format:
+
+    frame;frame;frame <count>
+
+flamegraph.pl, speedscope and inferno all read this format directly.
+"""
+
+import hmac
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from typing import Optional
+
+from fastapi import Request
+from app.core.config import settings
+
+PROFILE_HEADER = "X-Profile-Token"
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def profiling_requested(request: Request) -> bool:
+    """True if this request should be profiled (config switch or a valid admin token)."""
+    if settings.PROFILE_ALL_REQUESTS:
+        return True
+    token = request.headers.get(PROFILE_HEADER)
+    if not token or not settings.PROFILER_TOKEN:
+        return False
+    return hmac.compare_digest(token.encode(), settings.PROFILER_TOKEN.encode())
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    if filename.startswith(_PROJECT_ROOT):
+        filename = os.path.relpath(filename, _PROJECT_ROOT)
+    else:
+        # Library code: keep the path from site-packages/ (or the stdlib) on
+        filename = re.sub(r"^.*[/\\](site-packages|lib[/\\]python[\d.]+)[/\\]", "", filename)
+    # ';' separates frames in the folded format
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ",")
+
+
+class StackSampler:
+    """Samples one thread's Python stack at a fixed interval, in a daemon thread."""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def write_folded(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+@contextmanager
+def profile_request(request: Request, label: str):
+    """
+    Profiles the enclosed block if `profiling_requested(request)`, else does nothing.
+    Must run in the thread that does the work (i.e. inside a sync endpoint).
+    """
+    if not profiling_requested(request):
+        yield None
+        return
+
+    sampler = StackSampler(threading.get_ident(), settings.PROFILER_INTERVAL_MS / 1000.0)
+    started = time.perf_counter()
+    sampler.start()
+    try:
+        yield sampler
+    finally:
+        sampler.stop()
+        elapsed = time.perf_counter() - started
+        path: Optional[str] = None
+        try:
+            os.makedirs(settings.PROFILER_OUTPUT_DIR, exist_ok=True)
+            path = os.path.join(
+                settings.PROFILER_OUTPUT_DIR,
+                f"{time.strftime('%Y%m%dT%H%M%S')}-{label}-{uuid.uuid4().hex[:8]}.folded"
+            )
+            sampler.write_folded(path)
+            print(f"--- Profiled {label}: {elapsed:.3f}s, {sum(sampler.samples.values())} samples -> {path} ---")
+        except OSError as e:
+            print(f"Could not write profile for {label}: {e}", file=sys.stderr)
+            sys.stderr.flush()
@@ -0,0 +1,30 @@
+# File: app/core/responses.py
+
+import orjson
+from typing import Any
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+
+def json_dumps(content: Any) -> bytes:
+    """
+    Fast JSON encoding for plain dict/list payloads (NDJSON events, ETag bodies).
+    """
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(Response):
+    """
+    JSON response for large, already-built payloads such as TripResponse.
+
+    Returning a Response from an endpoint makes FastAPI skip the
+    response_model re-validation, so a model we just constructed is not
+    validated a second time. Pydantic models are serialized straight to
+    bytes by pydantic-core; everything else goes through orjson.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, BaseModel):
+            return content.__pydantic_serializer__.to_json(content)
+        return json_dumps(content)
@@ -1,4 +1,11 @@
-from supabase import create_client, Client
+import asyncio
+import threading
+from typing import Optional
+
+import httpx
+from supabase import acreate_client, create_client, AsyncClient, Client
+from supabase.lib.client_options import AsyncClientOptions, SyncClientOptions
+from app.core import cassette
 from app.core.config import settings
 
 
@@ -9,9 +16,88 @@ def get_supabase_client() -> Client:
     if not settings.SUPABASE_URL or not settings.SUPABASE_KEY:
         raise ValueError("Supabase URL and Key must be set in .env file")
 
-    supabase: Client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+    options = None
+    if settings.CASSETTE_MODE != "off":
+        # Route PostgREST traffic through the record/replay transport
+        options = SyncClientOptions(
+            httpx_client=httpx.Client(transport=cassette.CassetteTransport(), timeout=120, follow_redirects=True)
+        )
+
+    supabase: Client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY, options=options)
     return supabase
 
 
-# Create a single instance to be used by the app
-supabase_client = get_supabase_client()
\ No newline at end of file
+_client: Optional[Client] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> Client:
+    """
+    The single instance used by the app, created on first use (or by the
+    startup prewarm) rather than at import.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = get_supabase_client()
+    return _client
+
+
+class _LazyClient:
+    """Stands in for the client and forwards to it, so importing this module does no work."""
+
+    def __getattr__(self, name):
+        return getattr(get_client(), name)
+
+
+supabase_client = _LazyClient()
+
+
+_async_client: Optional[AsyncClient] = None
+# Created on first use, from inside the event loop that serves the endpoints
+_async_client_lock: Optional[asyncio.Lock] = None
+_async_client_lock_guard = threading.Lock()
+
+
+def _get_async_client_lock() -> asyncio.Lock:
+    global _async_client_lock
+    with _async_client_lock_guard:
+        if _async_client_lock is None:
+            _async_client_lock = asyncio.Lock()
+        return _async_client_lock
+
+
+async def get_async_client() -> AsyncClient:
+    """
+    The async client for the endpoint layer, created on first use. All its
+    requests share one connection pool of SUPABASE_MAX_CONNECTIONS, so a
+    database round-trip holds a pooled connection, not a worker thread.
+    """
+    global _async_client
+    if _async_client is None:
+        async with _get_async_client_lock():
+            if _async_client is None:
+                if not settings.SUPABASE_URL or not settings.SUPABASE_KEY:
+                    raise ValueError("Supabase URL and Key must be set in .env file")
+                # The cassette transport only records/replays while a cassette is active
+                http_client = httpx.AsyncClient(
+                    transport=cassette.AsyncCassetteTransport(
+                        limits=httpx.Limits(max_connections=settings.SUPABASE_MAX_CONNECTIONS)
+                    ),
+                    timeout=settings.SUPABASE_TIMEOUT,
+                    follow_redirects=True
+                )
+                _async_client = await acreate_client(
+                    settings.SUPABASE_URL, settings.SUPABASE_KEY,
+                    options=AsyncClientOptions(httpx_client=http_client)
+                )
+    return _async_client
+
+
+async def close_async_client() -> None:
+    """Closes the async client's connection pool (app shutdown)."""
+    global _async_client
+    client, _async_client = _async_client, None
+    if client is not None:
+        await client.options.httpx_client.aclose()
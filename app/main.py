@@ -1,13 +1,66 @@
 
 
+import asyncio
+from contextlib import asynccontextmanager
+
+import anyio.to_thread
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from app.api.v1.api import api_router
+from app.core import auth, prewarm
+from app.core.compression import CompressionMiddleware
+from app.core.config import settings
+from app.db import supabase_client
+from app.services import hotel_index, hotel_service, ors_service, plan_service, planner_pool, routing_engine
+
+
+def _prewarm_steps() -> dict:
+    """What a cold worker loads before it reports ready (see app/core/prewarm.py)."""
+    steps = {
+        "supabase_client": supabase_client.get_client,
+        "supabase_async_client": supabase_client.get_async_client,
+        "ors_connection": ors_service.warm_up
+    }
+    if settings.CLERK_ISSUER_URL:
+        steps["clerk_jwks"] = auth.get_clerk_jwks
+    if settings.PREWARM_LOCATION_CATALOG:
+        steps["location_catalog"] = plan_service.prewarm_location_catalog
+    # Candidate lists of the popular interest combinations
+    if settings.PRECOMPUTE_INTEREST_COMBOS:
+        steps["candidate_lists"] = lambda: plan_service.precompute_candidate_lists(
+            settings.PRECOMPUTE_INTEREST_COMBOS
+        )
+    if settings.HOTEL_BACKEND == "local":
+        steps["hotel_index"] = lambda: len(hotel_index.get_index().hotels)
+    if settings.ROUTING_BACKEND == "local":
+        steps["road_graph"] = routing_engine.get_engine
+    if planner_pool.enabled():
+        steps["planner_pool"] = planner_pool.start
+    return steps
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Sync endpoints run in this thread pool; size it from load test data
+    if settings.THREADPOOL_SIZE:
+        anyio.to_thread.current_default_thread_limiter().total_tokens = settings.THREADPOOL_SIZE
+    # Warm up without delaying startup; /ready reports when it is done
+    warming = asyncio.create_task(prewarm.run(_prewarm_steps(), settings.PREWARM_TIMEOUT))
+    yield
+    warming.cancel()
+    hotel_service.close()
+    ors_service.close()
+    planner_pool.close()
+    await supabase_client.close_async_client()
+
 
 app = FastAPI(
     title="Sri Lanka Travel Planner API",
     description="Backend service for the smart travel planning application.",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # ------------------------------------------------------------
@@ -21,6 +74,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ------------------------------------------------------------
+# ✅ Compress large responses (brotli or gzip, negotiated)
+# ------------------------------------------------------------
+app.add_middleware(CompressionMiddleware, minimum_size=settings.COMPRESSION_MIN_SIZE)
+
 # ------------------------------------------------------------
 # ✅ Include API routes
 # ------------------------------------------------------------
@@ -31,5 +89,11 @@ def read_root():
     """Root endpoint to check if the API is running."""
     return {"status": "ok", "message": "Welcome to the Travel Planner API!"}
 
+
+@app.get("/ready", tags=["Health"])
+def read_ready():
+    """Readiness probe: 503 until the startup prewarm has finished."""
+    return ORJSONResponse(prewarm.status(), status_code=200 if prewarm.is_ready() else 503)
+
 # Run with:
 # uvicorn app.main:app --reload
\ No newline at end of file
@@ -137,8 +137,8 @@
 
 # File: app/models/schemas.py
 
-from pydantic import BaseModel, EmailStr
-from typing import List, Optional
+from pydantic import BaseModel, EmailStr, Field
+from typing import List, Literal, Optional
 
 # --- ClerkUser Model (Existing) ---
 class ClerkUser(BaseModel):
@@ -151,11 +151,25 @@ class ClerkUser(BaseModel):
 
 # --- Trip Generation Models (Existing) ---
 
+# Keys of ors_service.ROUTING_PROFILES
+RoutingProfile = Literal["driving-car", "tuk-tuk", "cycling-regular", "foot-walking"]
+
 class TripGenerationRequest(BaseModel):
     num_people: int
     num_days: int
     budget: float
     interests: List[str]
+    # How the group gets around; durations and route geometry follow this profile
+    routing_profile: RoutingProfile = "driving-car"
+    # Hours of driving and visits per day (None: the server's DAILY_HOURS_BUDGET)
+    daily_hours: Optional[float] = Field(default=None, gt=0, le=16)
+    # "inline": full GeoJSON in route_geometries (default)
+    # "refs": only route_refs; fetch geometry later from GET /trips/routes/{ref}
+    geometry_mode: Literal["inline", "refs"] = "inline"
+    # "geojson": LineString coordinates; "polyline": Google encoded polyline
+    geometry_format: Literal["geojson", "polyline"] = "geojson"
+    # Douglas-Peucker tolerance in metres; None keeps every ORS vertex
+    simplify_tolerance_m: Optional[float] = Field(default=None, ge=0)
 
 class LocationResponse(BaseModel):
     id: str
@@ -167,7 +181,14 @@ class LocationResponse(BaseModel):
 class TripDayResponse(BaseModel):
     day_number: int
     locations: List[LocationResponse]
-    route_geometries: List[Optional[dict]] # <-- This field is from our last change
+    route_geometries: List[Optional[dict]] = [] # <-- Empty when geometry_mode is "refs"; shape follows geometry_format
+    route_refs: Optional[List[str]] = None # One reference per leg (geometry_mode "refs")
+    day_route_ref: Optional[str] = None # Reference for the whole day's route (geometry_mode "refs")
+
+
+class RouteGeometryResponse(BaseModel):
+    ref: str
+    route_geometries: List[Optional[dict]] # One geometry per leg of the reference
 
 class TripResponse(BaseModel):
     id: str
@@ -176,6 +197,63 @@ class TripResponse(BaseModel):
     total_budget: float
     itinerary: List[TripDayResponse]
     user_id: Optional[str] = None
+    routing_profile: RoutingProfile = "driving-car"
+    # Nearest hotels per day ("day1": [...]); filled in the background after the plan is saved,
+    # so only GET /trips/{id} returns it
+    hotel_suggestions: Optional[dict] = None
+    # Shortcuts taken to answer within the request's time budget: "estimated_durations",
+    # "route_geometry_skipped" (days carry route refs instead), "partial_itinerary" (fewer days)
+    degradations: List[str] = []
+
+
+# --- Saved Trip Read Models ---
+
+class TripGeometryOptions(BaseModel):
+    # Same meaning as on TripGenerationRequest (query parameters of GET /trips/{id})
+    geometry_mode: Literal["inline", "refs"] = "inline"
+    geometry_format: Literal["geojson", "polyline"] = "geojson"
+    simplify_tolerance_m: Optional[float] = Field(default=None, ge=0)
+
+class TripSummary(BaseModel):
+    id: str
+    num_people: int
+    num_days: int
+    total_budget: float
+    created_at: Optional[str] = None
+
+class TripListResponse(BaseModel):
+    trips: List[TripSummary]
+    next_cursor: Optional[str] = None # Pass as ?cursor= to get the next (older) page; None on the last page
+
+
+# --- Trip Edit Models ---
+
+class TripDayEditRequest(BaseModel):
+    add_location_ids: List[str] = []
+    remove_location_ids: List[str] = []
+    # Exact new order of the day's location ids (after add/remove); disables optimize
+    order: Optional[List[str]] = None
+    # Re-sequence the day by drive time (ignored when 'order' is given)
+    optimize: bool = True
+    # Same meaning as on TripGenerationRequest
+    geometry_mode: Literal["inline", "refs"] = "inline"
+    geometry_format: Literal["geojson", "polyline"] = "geojson"
+    simplify_tolerance_m: Optional[float] = Field(default=None, ge=0)
+
+
+# --- Batch Trip Generation Models ---
+
+class BatchTripGenerationRequest(BaseModel):
+    requests: List[TripGenerationRequest]
+
+class BatchTripResult(BaseModel):
+    index: int # Position of the item in the batch request
+    status_code: int
+    trip: Optional[TripResponse] = None
+    detail: Optional[str] = None # Error message when the item failed
+
+class BatchTripResponse(BaseModel):
+    results: List[BatchTripResult]
 
 
 # --- Reservation Models (Existing) ---
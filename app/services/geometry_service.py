@@ -0,0 +1,190 @@
+# File: app/services/geometry_service.py
+
+import math
+from typing import List, Tuple, Dict, Any, Optional
+
+from app.core import cache
+from app.core.config import settings
+from app.services import planner_pool
+
+# Metres per degree of latitude (close enough for Sri Lanka's size)
+METERS_PER_DEGREE = 111_320.0
+
+# Formatted geometries, keyed by (leg key, format, tolerance). A leg is
+# simplified/encoded once and every later plan or GET reuses the result.
+FORMATTED_GEOMETRY_CACHE = cache.get_cache("formatted_geometries", settings.ROUTE_CACHE_MAX_ENTRIES)
+
+
+def simplify_douglas_peucker(coordinates: List[List[float]], tolerance_m: float) -> List[List[float]]:
+    """
+    Douglas-Peucker line simplification.
+    `coordinates` are GeoJSON [longitude, latitude] pairs; `tolerance_m` is the
+    maximum distance (in metres) a dropped vertex may be from the simplified line.
+    The first and last points are always kept.
+    """
+    if tolerance_m <= 0 or len(coordinates) < 3:
+        return coordinates
+
+    # Project to a local flat plane in metres so the tolerance means the same thing everywhere
+    lat0 = math.radians(coordinates[0][1])
+    x_scale = METERS_PER_DEGREE * math.cos(lat0)
+    xs = [c[0] * x_scale for c in coordinates]
+    ys = [c[1] * METERS_PER_DEGREE for c in coordinates]
+
+    keep = [False] * len(coordinates)
+    keep[0] = keep[-1] = True
+    tolerance_sq = tolerance_m * tolerance_m
+
+    # Iterative (not recursive) so very long routes can't hit the recursion limit
+    stack = [(0, len(coordinates) - 1)]
+    while stack:
+        first, last = stack.pop()
+        ax, ay = xs[first], ys[first]
+        dx, dy = xs[last] - ax, ys[last] - ay
+        segment_len_sq = dx * dx + dy * dy
+
+        max_dist_sq = -1.0
+        max_index = first
+        for i in range(first + 1, last):
+            px, py = xs[i] - ax, ys[i] - ay
+            if segment_len_sq == 0.0:
+                dist_sq = px * px + py * py
+            else:
+                t = max(0.0, min(1.0, (px * dx + py * dy) / segment_len_sq))
+                ex, ey = px - t * dx, py - t * dy
+                dist_sq = ex * ex + ey * ey
+            if dist_sq > max_dist_sq:
+                max_dist_sq = dist_sq
+                max_index = i
+
+        if max_dist_sq > tolerance_sq:
+            keep[max_index] = True
+            stack.append((first, max_index))
+            stack.append((max_index, last))
+
+    return [c for c, kept in zip(coordinates, keep) if kept]
+
+
+def encode_polyline(coordinates: List[List[float]], precision: int = 5) -> str:
+    """
+    Encodes GeoJSON [longitude, latitude] pairs with the Google encoded polyline
+    algorithm (which stores latitude first). Decoders such as
+    @mapbox/polyline or Google Maps' geometry library read it directly.
+    """
+    factor = 10 ** precision
+    encoded = []
+    prev_lat = prev_lon = 0
+
+    for lon, lat in ((c[0], c[1]) for c in coordinates):
+        lat_i = int(round(lat * factor))
+        lon_i = int(round(lon * factor))
+        for delta in (lat_i - prev_lat, lon_i - prev_lon):
+            value = ~(delta << 1) if delta < 0 else (delta << 1)
+            while value >= 0x20:
+                encoded.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            encoded.append(chr(value + 63))
+        prev_lat, prev_lon = lat_i, lon_i
+
+    return "".join(encoded)
+
+
+def decode_polyline(encoded: str, precision: int = 5) -> List[List[float]]:
+    """Inverse of encode_polyline: returns GeoJSON [longitude, latitude] pairs."""
+    factor = 10 ** precision
+    coordinates = []
+    index = lat = lon = 0
+
+    while index < len(encoded):
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lon += deltas[1]
+        coordinates.append([lon / factor, lat / factor])
+
+    return coordinates
+
+
+def format_route_geometry(
+        leg_key: Any,
+        geometry: Optional[Dict[str, Any]],
+        geometry_format: str = "geojson",
+        simplify_tolerance_m: Optional[float] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Converts a raw ORS GeoJSON LineString into the requested output format:
+      "geojson"  -> {"type": "LineString", "coordinates": [...]}
+      "polyline" -> {"type": "EncodedPolyline", "polyline": "...", "precision": 5}
+    optionally simplified first. `leg_key` identifies the leg for caching.
+    """
+    return format_route_geometries([(leg_key, geometry)], geometry_format, simplify_tolerance_m)[0]
+
+
+def format_route_geometries(
+        legs: List[Tuple[Any, Optional[Dict[str, Any]]]],
+        geometry_format: str = "geojson",
+        simplify_tolerance_m: Optional[float] = None
+) -> List[Optional[Dict[str, Any]]]:
+    """
+    format_route_geometry for several (leg_key, geometry) pairs at once.
+    Uncached legs are rendered together, in the planner pool when there are
+    at least PLANNER_OFFLOAD_MIN_POINTS coordinates to go through.
+    """
+    if geometry_format == "geojson" and not simplify_tolerance_m:
+        return [geometry for _, geometry in legs]
+
+    formatted: List[Optional[Dict[str, Any]]] = [None] * len(legs)
+    pending = []
+    for i, (leg_key, geometry) in enumerate(legs):
+        if geometry is None:
+            continue
+        formatted[i] = FORMATTED_GEOMETRY_CACHE.get((leg_key, geometry_format, simplify_tolerance_m or 0.0))
+        if formatted[i] is None:
+            pending.append(i)
+    if not pending:
+        return formatted
+
+    points = sum(len(legs[i][1].get("coordinates") or []) for i in pending)
+    rendered = planner_pool.run_many(
+        render_route_geometry,
+        [(legs[i][1], geometry_format, simplify_tolerance_m) for i in pending],
+        offload=points >= settings.PLANNER_OFFLOAD_MIN_POINTS
+    )
+    for i, result in zip(pending, rendered):
+        formatted[i] = result
+        FORMATTED_GEOMETRY_CACHE.set((legs[i][0], geometry_format, simplify_tolerance_m or 0.0), result)
+    return formatted
+
+
+def render_route_geometry(
+        geometry: Dict[str, Any],
+        geometry_format: str,
+        simplify_tolerance_m: Optional[float]
+) -> Dict[str, Any]:
+    """The uncached conversion behind format_route_geometry (runs in planner pool workers too)."""
+    coordinates = geometry.get("coordinates") or []
+    if simplify_tolerance_m:
+        coordinates = simplify_douglas_peucker(coordinates, simplify_tolerance_m)
+
+    if geometry_format == "polyline":
+        formatted = {
+            "type": "EncodedPolyline",
+            "polyline": encode_polyline(coordinates, settings.POLYLINE_PRECISION),
+            "precision": settings.POLYLINE_PRECISION
+        }
+    else:
+        # Round to ~1 cm; the extra ORS digits are noise but still cost bytes
+        formatted = {
+            "type": geometry.get("type", "LineString"),
+            "coordinates": [[round(c[0], 6), round(c[1], 6)] for c in coordinates]
+        }
+    return formatted
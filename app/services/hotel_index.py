@@ -0,0 +1,157 @@
+# File: app/services/hotel_index.py
+
+"""
+In-process nearest-hotel lookups (HOTEL_BACKEND=local).
+
+Answers the same question as the external hotel service's /nearest-hotels,
+without the network hop. The hotel dataset is loaded once into a grid index.
+For each day's end point, it returns the HOTEL_NEAREST_K closest hotels that
+can take the whole group (capacity >= num_people), nearest first:
+
+    {"day1": [{"name": ..., "lat": ..., "long": ..., "capacity": ...}, ...], ...}
+
+The dataset comes from HOTEL_DATASET_PATH, a JSON file (optionally .gz) that
+holds a list of hotel records or {"hotels": [...]}. When no path is set, it
+comes from the Supabase table HOTEL_DATASET_TABLE. Each record needs "lat",
+"long" (or "lon") and "capacity". Every other field is returned unchanged.
+"""
+
+import gzip
+import heapq
+import json
+import math
+import sys
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+# Grid cell size (degrees); ~5.5 km, hotels are much sparser than road nodes
+HOTEL_CELL_DEG = 0.05
+HOTEL_MAX_RINGS = 40
+EARTH_RADIUS_M = 6_371_000
+
+
+def _haversine_m(lon1: float, lat1: float, lon2: float, lat2: float) -> float:
+    lon1, lat1, lon2, lat2 = map(math.radians, (lon1, lat1, lon2, lat2))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(h))
+
+
+class HotelIndex:
+    """Grid index over hotel records for k-nearest queries with a capacity filter."""
+
+    def __init__(self, hotels: List[Dict[str, Any]]):
+        self.hotels: List[Dict[str, Any]] = []
+        self._points: List[Tuple[float, float, int]] = []  # (lon, lat, capacity) per hotel
+        self._grid: Dict[Tuple[int, int], List[int]] = {}
+        skipped = 0
+        for hotel in hotels:
+            try:
+                lon = float(hotel["long"] if "long" in hotel else hotel["lon"])
+                lat = float(hotel["lat"])
+                capacity = int(hotel.get("capacity") or 0)
+            except (KeyError, TypeError, ValueError):
+                skipped += 1
+                continue
+            i = len(self.hotels)
+            self.hotels.append(hotel)
+            self._points.append((lon, lat, capacity))
+            self._grid.setdefault(self._cell(lon, lat), []).append(i)
+        # Hotels in a cell, largest first, so a capacity filter can stop early
+        for members in self._grid.values():
+            members.sort(key=lambda i: -self._points[i][2])
+        if skipped:
+            print(f"Hotel index: skipped {skipped} records without usable lat/long/capacity", file=sys.stderr)
+            sys.stderr.flush()
+
+    @staticmethod
+    def _cell(lon: float, lat: float) -> Tuple[int, int]:
+        return (int(math.floor(lon / HOTEL_CELL_DEG)), int(math.floor(lat / HOTEL_CELL_DEG)))
+
+    def nearest(self, coords: Tuple[float, float], k: int, min_capacity: int = 0) -> List[Tuple[float, int]]:
+        """
+        The k hotels nearest to (lon, lat) with capacity >= min_capacity, as
+        (distance_m, hotel index) pairs, nearest first.
+        """
+        lon, lat = float(coords[0]), float(coords[1])
+        cx, cy = self._cell(lon, lat)
+        # Degrees of longitude shrink towards the poles; this keeps the ring bound conservative
+        cell_m = HOTEL_CELL_DEG * math.pi / 180 * EARTH_RADIUS_M * math.cos(math.radians(min(abs(lat) + 1, 89)))
+        best: List[Tuple[float, int]] = []  # max-heap of (-distance, index)
+        for ring in range(HOTEL_MAX_RINGS + 1):
+            for gx in range(cx - ring, cx + ring + 1):
+                for gy in range(cy - ring, cy + ring + 1):
+                    if max(abs(gx - cx), abs(gy - cy)) != ring:
+                        continue
+                    for i in self._grid.get((gx, gy), ()):
+                        hlon, hlat, capacity = self._points[i]
+                        if capacity < min_capacity:
+                            break
+                        d = _haversine_m(lon, lat, hlon, hlat)
+                        if len(best) < k:
+                            heapq.heappush(best, (-d, i))
+                        elif d < -best[0][0]:
+                            heapq.heapreplace(best, (-d, i))
+            # Anything in a further ring is at least `ring` cells away
+            if len(best) == k and -best[0][0] <= ring * cell_m:
+                break
+        return sorted((-d, i) for d, i in best)
+
+    def nearest_hotels(self, hotel_service_data: Dict[str, Any], k: int) -> Dict[str, List[Dict[str, Any]]]:
+        """Same request and response shape as the hotel service's /nearest-hotels."""
+        num_people = int(hotel_service_data.get("num_people") or 0)
+        return {
+            day: [self.hotels[i] for _, i in self.nearest((point["long"], point["lat"]), k, num_people)]
+            for day, point in (hotel_service_data.get("daily_locations") or {}).items()
+        }
+
+
+def _load_hotels() -> List[Dict[str, Any]]:
+    if settings.HOTEL_DATASET_PATH:
+        opener = gzip.open if settings.HOTEL_DATASET_PATH.endswith(".gz") else open
+        with opener(settings.HOTEL_DATASET_PATH, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        return data["hotels"] if isinstance(data, dict) else data
+
+    from app.db.supabase_client import supabase_client as db_client
+    hotels, page_size = [], 1000
+    while True:
+        # PostgREST caps rows per response, so read the table in pages
+        page = db_client.table(settings.HOTEL_DATASET_TABLE).select('*') \
+            .order('id').range(len(hotels), len(hotels) + page_size - 1).execute().data or []
+        hotels.extend(page)
+        if len(page) < page_size:
+            return hotels
+
+
+_INDEX: Optional[HotelIndex] = None
+_INDEX_LOCK = threading.Lock()
+
+
+def get_index() -> HotelIndex:
+    """
+    Loads the hotel dataset on first use (once per process).
+    """
+    global _INDEX
+    if _INDEX is None:
+        with _INDEX_LOCK:
+            if _INDEX is None:
+                source = settings.HOTEL_DATASET_PATH or f"table {settings.HOTEL_DATASET_TABLE}"
+                print(f"--- Loading hotel dataset from {source} ---")
+                _INDEX = HotelIndex(_load_hotels())
+                print(f"--- Hotel index built: {len(_INDEX.hotels)} hotels ---")
+    return _INDEX
+
+
+def reload_index() -> HotelIndex:
+    """Rebuilds the index from the dataset (e.g. after the hotels table changed)."""
+    global _INDEX
+    index = HotelIndex(_load_hotels())
+    with _INDEX_LOCK:
+        _INDEX = index
+    return index
+
+
+def nearest_hotels(hotel_service_data: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+    return get_index().nearest_hotels(hotel_service_data, settings.HOTEL_NEAREST_K)
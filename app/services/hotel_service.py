@@ -0,0 +1,184 @@
+# File: app/services/hotel_service.py
+
+"""
+Nearest-hotel lookups against the external hotel service (step 7 of planning).
+
+Lookups never hold up a plan. `start_lookup` schedules the POST on a
+dedicated event-loop thread and returns at once, so the request runs while
+the trip is being saved. `attach_to_trip` stores the result in
+trips.hotel_suggestions when it arrives. The loop owns one pooled
+httpx.AsyncClient.
+
+Each call has a short deadline (HOTEL_SERVICE_TIMEOUT). After
+HOTEL_BREAKER_FAILURES consecutive failures the circuit opens, and lookups
+are skipped for HOTEL_BREAKER_RESET_SECONDS. After that one trial call
+decides whether it closes again.
+
+With HOTEL_BACKEND=local the lookup is answered in-process by
+app/services/hotel_index.py instead, in the same response format.
+"""
+
+import asyncio
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+import httpx
+from app.core import cassette
+from app.core.config import settings
+from app.services import hotel_index
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker (closed -> open -> half-open -> closed)."""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at < self.reset_seconds:
+                return "open"
+            return "half-open"
+
+    def allow(self) -> bool:
+        """True if a call may go out now (in half-open, only one trial at a time)."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_seconds or self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+breaker = CircuitBreaker(settings.HOTEL_BREAKER_FAILURES, settings.HOTEL_BREAKER_RESET_SECONDS)
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_client: Optional[httpx.AsyncClient] = None
+_loop_lock = threading.Lock()
+# Database writes of finished lookups (the Supabase client is synchronous)
+_attach_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="hotel-attach")
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop, _client
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="hotel-service-loop", daemon=True).start()
+            _client = httpx.AsyncClient(
+                timeout=settings.HOTEL_SERVICE_TIMEOUT,
+                limits=httpx.Limits(max_connections=settings.HOTEL_SERVICE_MAX_CONNECTIONS),
+                transport=cassette.async_transport()
+            )
+            _loop = loop
+    return _loop
+
+
+async def _lookup(hotel_service_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    hotel_service_endpoint = f"{settings.HOTEL_SERVICE_URL}/nearest-hotels"
+    try:
+        response = await asyncio.wait_for(
+            _client.post(hotel_service_endpoint, json=hotel_service_data),
+            timeout=settings.HOTEL_SERVICE_TIMEOUT
+        )
+        response.raise_for_status()
+        hotel_results = response.json()
+    except httpx.HTTPStatusError as e:
+        print(f"Hotel service returned an error: {e}", file=sys.stderr)
+    except (httpx.RequestError, asyncio.TimeoutError) as e:
+        print(f"Error calling hotel service (e.g., connection refused or timeout): {e!r}", file=sys.stderr)
+    except Exception as e:
+        print(f"An unexpected error occurred during hotel service call: {e}", file=sys.stderr)
+    else:
+        breaker.record_success()
+        return hotel_results
+    breaker.record_failure()
+    sys.stderr.flush()
+    return None
+
+
+def _local_lookup(hotel_service_data: Dict[str, Any]) -> Future:
+    # Answered in-process in microseconds; a finished Future keeps attach_to_trip unchanged
+    lookup: Future = Future()
+    try:
+        lookup.set_result(hotel_index.nearest_hotels(hotel_service_data))
+    except Exception as e:
+        print(f"Local hotel lookup failed: {e}", file=sys.stderr)
+        sys.stderr.flush()
+        lookup.set_result(None)
+    return lookup
+
+
+def start_lookup(hotel_service_data: Dict[str, Any]) -> Optional[Future]:
+    """
+    Starts the nearest-hotel lookup in the background and returns a Future of
+    the results (None on failure). Returns None straight away when there is
+    nothing to look up or the circuit breaker is open.
+    """
+    if not hotel_service_data["daily_locations"]:
+        return None
+    if settings.HOTEL_BACKEND == "local":
+        return _local_lookup(hotel_service_data)
+    if not breaker.allow():
+        print(f"--- Hotel service circuit is {breaker.state}; skipping hotel lookup ---")
+        return None
+    print(f"--- Calling Hotel Service at {settings.HOTEL_SERVICE_URL} (background) ---")
+    return asyncio.run_coroutine_threadsafe(_lookup(hotel_service_data), _get_loop())
+
+
+def _save_hotel_suggestions(trip_id: str, hotel_results: Dict[str, Any]) -> None:
+    # Imported here so this module has no database dependency at import time
+    from app.db.supabase_client import supabase_client as db_client
+    try:
+        db_client.table('trips').update({'hotel_suggestions': hotel_results}).eq('id', trip_id).execute()
+        print(f"--- Hotel suggestions attached to trip {trip_id} ---")
+    except Exception as e:
+        print(f"Failed to attach hotel suggestions to trip {trip_id}: {e}", file=sys.stderr)
+        sys.stderr.flush()
+
+
+def attach_to_trip(lookup: Future, trip_id: str) -> None:
+    """Saves the lookup's results on the trip once they arrive (never blocks)."""
+    def on_done(done: Future) -> None:
+        if done.cancelled() or done.exception() is not None or done.result() is None:
+            return
+        _attach_executor.submit(_save_hotel_suggestions, trip_id, done.result())
+
+    lookup.add_done_callback(on_done)
+
+
+def close() -> None:
+    """Closes the pooled client and stops the loop (app shutdown)."""
+    global _loop, _client
+    with _loop_lock:
+        loop, client = _loop, _client
+        _loop = _client = None
+    if loop is None:
+        return
+    asyncio.run_coroutine_threadsafe(client.aclose(), loop).result(timeout=5)
+    loop.call_soon_threadsafe(loop.stop)
@@ -120,72 +120,374 @@
 # File: app/services/ors_service.py
 # File: app/services/ors_service.py
 
+import contextvars
 import httpx
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app.core import cache, cassette, deadline
 from app.core.config import settings
-from typing import List, Tuple, Dict, Any
+from app.services import routing_engine
+from typing import Callable, List, Tuple, Dict, Any, Optional, TypeVar
 
 # ORS API base URL
-ORS_BASE_URL = "https://api.openrouteservice.org"
+ORS_BASE_URL = settings.ORS_BASE_URL
 
+_client: Optional[httpx.Client] = None
+_client_lock = threading.Lock()
 
-def get_coordinates_for_location(location_name: str) -> Tuple[float, float] | None:
+
+def get_client() -> httpx.Client:
     """
-    Uses ORS Geocoding to find the coordinates for a location name.
-    Returns (longitude, latitude) or None.
+    The pooled ORS client, created on first use and shared by every request
+    and matrix tile, so connections (and their TLS handshakes) are reused.
+    Timeouts are set per request from the request budget.
     """
-    client = httpx.Client()
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                # The cassette transport checks for an active cassette on every request
+                _client = httpx.Client(transport=cassette.CassetteTransport(
+                    limits=httpx.Limits(max_connections=settings.ORS_MAX_CONNECTIONS)
+                ))
+    return _client
+
+
+def warm_up() -> None:
+    """Opens a pooled connection to ORS ahead of the first request (startup prewarm)."""
+    if cassette.active_cassette() is not None:
+        return
     try:
-        response = client.get(
+        get_client().get(f"{ORS_BASE_URL}/", timeout=settings.ORS_REQUEST_TIMEOUT)
+    except httpx.HTTPError as e:
+        print(f"ORS warm-up request failed: {e!r}")
+
+
+def close() -> None:
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        client.close()
+
+# Routing profiles a plan can ask for: name -> (ORS profile that is requested, duration factor).
+# Profiles on the same ORS profile share its cache entries and its requests. Tuk-tuks drive
+# the roads cars do, only slower, so "tuk-tuk" costs no ORS traffic of its own.
+ROUTING_PROFILES: Dict[str, Tuple[str, float]] = {
+    "driving-car": ("driving-car", 1.0),
+    "tuk-tuk": ("driving-car", 1.4),
+    "cycling-regular": ("cycling-regular", 1.0),
+    "foot-walking": ("foot-walking", 1.0),
+}
+DEFAULT_PROFILE = "driving-car"
+
+
+def base_profile(profile: str) -> str:
+    """The ORS profile `profile` is routed with (the namespace of its cache entries)."""
+    return ROUTING_PROFILES[profile][0]
+
+
+# Routes between two points rarely change, so we keep the most recently used
+# ones (LRU, on the configured cache backend), as {"geometry", "duration", "distance"}
+# segments, keyed by ORS profile + coordinates. Failed lookups are never cached.
+ROUTE_CACHE = cache.get_cache("ors_routes", settings.ROUTE_CACHE_MAX_ENTRIES)
+
+
+def _coord_key(coords: Tuple[float, float]) -> Tuple[float, float]:
+    # Rounded to ~10 cm so coordinates parsed back from a route reference hit the same entry
+    return (round(coords[0], 6), round(coords[1], 6))
+
+
+def route_cache_key(start_coords: Tuple[float, float], end_coords: Tuple[float, float],
+                    profile: str = DEFAULT_PROFILE) -> Tuple[str, float, float, float, float]:
+    return (base_profile(profile),) + _coord_key(start_coords) + _coord_key(end_coords)
+
+
+# Pairwise durations (seconds, None = unreachable) from every matrix we fetch,
+# keyed by ORS profile + coordinates, so edits and repeated plans only ask ORS
+# for pairs we have never seen. Values are unscaled (duration factor 1).
+DURATION_CACHE = cache.get_cache("ors_durations", settings.DURATION_CACHE_MAX_ENTRIES)
+_NOT_CACHED = cache.MISSING
+
+
+def _cached_durations(namespace: str, keys: List[Tuple[float, float]]) -> Dict[Tuple, float | None]:
+    """Every cached pair among `keys` in one backend lookup, keyed (namespace, *start, *end)."""
+    return DURATION_CACHE.get_many(
+        (namespace,) + start + end for i, start in enumerate(keys) for j, end in enumerate(keys) if i != j
+    )
+
+
+def _scaled(duration: float | None, profile: str) -> float | None:
+    factor = ROUTING_PROFILES[profile][1]
+    return duration if duration is None or factor == 1.0 else round(duration * factor, 1)
+
+
+class RateLimiter:
+    """Spaces calls evenly so that at most `per_minute` start in any minute (thread-safe)."""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next_at = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            start_at = max(now, self._next_at)
+            self._next_at = start_at + self.interval
+        if start_at > now:
+            time.sleep(start_at - now)
+
+
+# Geocoding results by normalised name, kept across restarts (ORS geocoding is
+# slow and rate limited, and place names hardly ever move). Values are
+# {"coordinates": [lon, lat], "confidence", "label", "layer"}; names ORS found
+# nothing for ("coordinates": None) are kept for GEOCODE_NOT_FOUND_TTL only.
+# Failed lookups are never cached.
+GEOCODE_CACHE = cache.get_cache(
+    "ors_geocodes", settings.GEOCODE_CACHE_MAX_ENTRIES, ttl=settings.GEOCODE_CACHE_TTL, persistent=True
+)
+_geocode_limiter = RateLimiter(settings.ORS_GEOCODE_RATE_PER_MINUTE)
+
+
+def _geocode_key(location_name: str) -> str:
+    # "Sigiriya", " sigiriya" and "SIGIRIYA" are one lookup
+    return " ".join(location_name.casefold().split())
+
+
+def _fetch_geocode(text: str) -> Dict[str, Any]:
+    """
+    One ORS geocode search, paced by the rate limiter and retried with backoff
+    on 429/5xx. Returns the best match ("coordinates": None if there is none).
+    Raises if the request still fails.
+    """
+    def fetch() -> List[Dict[str, Any]] | None:
+        if deadline.expired():
+            raise TimeoutError("request budget spent before geocoding")
+        _geocode_limiter.wait()
+        response = get_client().get(
             f"{ORS_BASE_URL}/geocode/search",
+            timeout=deadline.timeout(settings.ORS_REQUEST_TIMEOUT),
             params={
                 "api_key": settings.ORS_API_KEY,
-                "text": location_name,
+                "text": text,
                 "boundary.country": "LKA",  # Restrict search to Sri Lanka
                 "size": 1
             }
         )
         response.raise_for_status()  # Raise error for bad responses (4xx, 5xx)
-        data = response.json()
+        return response.json().get("features")
 
-        if data.get("features"):
-            # Coordinates are [longitude, latitude]
-            coords = data["features"][0]["geometry"]["coordinates"]
-            return (coords[0], coords[1])
-        return None
-    except httpx.HTTPStatusError as e:
-        print(f"HTTP error during geocoding: {e}")
-        return None
-    except Exception as e:
-        print(f"Error in get_coordinates_for_location: {e}")
+    features = _with_retries(fetch, settings.ORS_GEOCODE_RETRIES, f"Geocoding {text!r}")
+    if not features:
+        return {"coordinates": None, "confidence": None, "label": None, "layer": None}
+    properties = features[0].get("properties") or {}
+    # Coordinates are [longitude, latitude]
+    coords = features[0]["geometry"]["coordinates"]
+    return {
+        "coordinates": [coords[0], coords[1]],
+        "confidence": properties.get("confidence"),
+        "label": properties.get("label"),
+        "layer": properties.get("layer"),
+    }
+
+
+def geocode_locations(location_names: List[str]) -> Dict[str, Dict[str, Any] | None]:
+    """
+    Geocodes many location names at once (e.g. for catalog ingestion).
+    Names are deduplicated ignoring case and spacing, known names come from
+    GEOCODE_CACHE, and the rest are fetched ORS_GEOCODE_CONCURRENCY at a time
+    within ORS_GEOCODE_RATE_PER_MINUTE.
+
+    Returns a result for every input name: {"coordinates": [lon, lat] or None
+    (no match), "confidence" (0-1, from ORS), "label", "layer"}, or None if
+    the lookup failed (worth retrying later).
+    """
+    keys = {name: _geocode_key(name) for name in location_names}
+    # The normalised name is only the cache key; ORS gets the name as written
+    # (the first spelling seen), which its search ranks on
+    texts: Dict[str, str] = {}
+    for name, key in keys.items():
+        texts.setdefault(key, name.strip())
+    unique_keys = [key for key in texts if key]
+    results: Dict[str, Dict[str, Any] | None] = GEOCODE_CACHE.get_many(unique_keys)
+    missing = [key for key in unique_keys if key not in results]
+
+    if missing:
+        print(f"--- Geocoding {len(missing)} of {len(unique_keys)} names via ORS "
+              f"({len(unique_keys) - len(missing)} cached) ---")
+        found, not_found = {}, {}
+        workers = min(max(1, settings.ORS_GEOCODE_CONCURRENCY), len(missing))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ors-geocode") as executor:
+            # Each lookup runs in a copy of this context, so it keeps the request budget
+            futures = {key: executor.submit(contextvars.copy_context().run, _fetch_geocode, texts[key])
+                       for key in missing}
+            for key, future in futures.items():
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Geocoding {texts[key]!r} failed: {e}")
+                    continue
+                results[key] = result
+                (found if result["coordinates"] is not None else not_found)[key] = result
+        GEOCODE_CACHE.set_many(found)
+        if not_found:
+            GEOCODE_CACHE.set_many(not_found, ttl=settings.GEOCODE_NOT_FOUND_TTL)
+
+    return {name: results.get(key) for name, key in keys.items()}
+
+
+def get_coordinates_for_location(location_name: str) -> Tuple[float, float] | None:
+    """
+    Uses ORS Geocoding to find the coordinates for a location name.
+    Returns (longitude, latitude) or None. Answers from the geocode cache when
+    it can; use geocode_locations() for many names at once.
+    """
+    result = geocode_locations([location_name])[location_name]
+    if result is None or result["coordinates"] is None:
         return None
-    finally:
-        client.close()
+    return tuple(result["coordinates"])
 
 
-def get_distance_matrix(locations: List[Tuple[float, float]]) -> dict | None:
+def _matrix_tiles(num_sources: int, num_destinations: int) -> List[Tuple[range, range]]:
     """
-    Gets a duration matrix from ORS for a list of coordinates.
-    The coordinates must be in (longitude, latitude) format.
+    Splits a sources x destinations matrix into tiles that each stay within
+    ORS_MATRIX_MAX_ELEMENTS. Rows are kept as wide as possible.
+    """
+    max_elements = settings.ORS_MATRIX_MAX_ELEMENTS
+    destinations_per_tile = min(num_destinations, max_elements)
+    sources_per_tile = max(1, max_elements // destinations_per_tile)
+    return [
+        (range(s, min(s + sources_per_tile, num_sources)), range(d, min(d + destinations_per_tile, num_destinations)))
+        for s in range(0, num_sources, sources_per_tile)
+        for d in range(0, num_destinations, destinations_per_tile)
+    ]
+
+
+T = TypeVar("T")
+
+
+def _with_retries(call: Callable[[], T], retries: int, what: str) -> T:
+    """
+    Runs `call` (one ORS request), retrying it up to `retries` times with
+    backoff (0.5 s, 1 s, 2 s, ...) while the request budget allows.
+    Raises the last error, or at once for a 4xx other than 429.
+    """
+    attempt = 0
+    while True:
+        try:
+            return call()
+        except Exception as e:
+            # 4xx other than 429 (rate limit) won't get better by retrying
+            if isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500 \
+                    and e.response.status_code != 429:
+                raise
+            if attempt >= retries or deadline.below(0.5 * 2 ** attempt):
+                raise
+            attempt += 1
+            print(f"{what} failed ({e}), retry {attempt}/{retries}")
+            time.sleep(0.5 * 2 ** (attempt - 1))
+
+
+def _fetch_matrix_tile(client: httpx.Client, source_coords: List[Tuple[float, float]],
+                       destination_coords: List[Tuple[float, float]], ors_profile: str) -> List[List[float | None]]:
+    """
+    Fetches one tile. Only the tile's own coordinates are sent, with
+    sources/destinations indexes into that short list.
+    Retries with backoff; raises if the tile still fails.
     """
-    client = httpx.Client()
     headers = {
         'Authorization': settings.ORS_API_KEY,
         'Content-Type': 'application/json'
     }
     body = {
-        "locations": locations,
+        "locations": source_coords + destination_coords,
+        "sources": list(range(len(source_coords))),
+        "destinations": list(range(len(source_coords), len(source_coords) + len(destination_coords))),
         "metrics": ["duration"],  # We only need duration for "shortest time" logic
         "units": "km"
     }
 
-    try:
+    def fetch() -> List[List[float | None]]:
         response = client.post(
-            f"{ORS_BASE_URL}/v2/matrix/driving-car",
+            f"{ORS_BASE_URL}/v2/matrix/{ors_profile}",
             json=body,
-            headers=headers
+            headers=headers,
+            timeout=deadline.timeout(settings.ORS_REQUEST_TIMEOUT)
         )
         response.raise_for_status()
-        return response.json()
+        durations = response.json().get("durations")
+        if not durations or len(durations) != len(source_coords):
+            raise ValueError(f"Unexpected matrix tile shape: {durations!r:.200}")
+        return durations
+
+    return _with_retries(fetch, settings.ORS_MATRIX_TILE_RETRIES, "Matrix tile")
+
+
+def get_distance_matrix(locations: List[Tuple[float, float]],
+                        sources: List[int] | None = None,
+                        destinations: List[int] | None = None,
+                        profile: str = DEFAULT_PROFILE) -> dict | None:
+    """
+    Gets a duration matrix from ORS for a list of coordinates.
+    The coordinates must be in (longitude, latitude) format.
+    `sources`/`destinations` are optional index lists into `locations`
+    (default: all of them), as in the ORS API.
+    `profile` is one of ROUTING_PROFILES; durations are scaled by its factor.
+
+    Matrices larger than ORS_MATRIX_MAX_ELEMENTS are split into tiles that are
+    fetched concurrently (ORS_MATRIX_CONCURRENCY at a time) and retried one by
+    one, then assembled into one dense {"durations": [[...]]} response.
+    With ROUTING_BACKEND=local the offline road graph answers instead (car
+    profiles only; the graph has no footpaths or cycle lanes).
+    """
+    ors_profile = base_profile(profile)
+    if settings.ROUTING_BACKEND == "local" and ors_profile == "driving-car":
+        try:
+            matrix = routing_engine.get_engine().get_distance_matrix(locations, sources, destinations)
+        except Exception as e:
+            print(f"Error in local get_distance_matrix: {e}")
+            return None
+        return {"durations": [[_scaled(value, profile) for value in row] for row in matrix["durations"]]}
+
+    source_coords = [locations[i] for i in sources] if sources is not None else list(locations)
+    destination_coords = [locations[i] for i in destinations] if destinations is not None else list(locations)
+    if not source_coords or not destination_coords:
+        return {"durations": []}
+
+    if deadline.expired():
+        print("Request budget exhausted; skipping ORS matrix request")
+        return None
+
+    tiles = _matrix_tiles(len(source_coords), len(destination_coords))
+    durations: List[List[float | None]] = [[None] * len(destination_coords) for _ in source_coords]
+
+    def fetch_tile(tile: Tuple[range, range]) -> None:
+        rows, cols = tile
+        tile_durations = _fetch_matrix_tile(
+            client,
+            [source_coords[i] for i in rows],
+            [destination_coords[j] for j in cols],
+            ors_profile
+        )
+        for i, row in zip(rows, tile_durations):
+            durations[i][cols.start:cols.stop] = [_scaled(value, profile) for value in row]
+
+    client = get_client()
+    try:
+        if len(tiles) == 1:
+            fetch_tile(tiles[0])
+        else:
+            print(f"--- Matrix {len(source_coords)}x{len(destination_coords)} split into {len(tiles)} tiles ---")
+            with ThreadPoolExecutor(max_workers=settings.ORS_MATRIX_CONCURRENCY) as executor:
+                # Each tile runs in a copy of this context, so it sees the request budget
+                futures = [executor.submit(contextvars.copy_context().run, fetch_tile, tile) for tile in tiles]
+                # result() re-raises the first tile error, if any
+                for future in futures:
+                    future.result()
+        return {"durations": durations}
     except httpx.HTTPStatusError as e:
         if "handshake operation timed out" in str(e):
             print(f"FATAL SSL ERROR in get_distance_matrix: {e}. Check network/firewall.")
@@ -195,16 +497,129 @@ def get_distance_matrix(locations: List[Tuple[float, float]]) -> dict | None:
     except Exception as e:
         print(f"Error in get_distance_matrix: {e}")
         return None
-    finally:
-        client.close()
 
 
-def get_directions_route(start_coords: Tuple[float, float], end_coords: Tuple[float, float]) -> Dict[str, Any] | None:
+def get_duration_matrix(locations: List[Tuple[float, float]], profile: str = DEFAULT_PROFILE) -> dict | None:
+    """
+    Like get_distance_matrix (full matrix over `locations`), but served from
+    DURATION_CACHE where possible. Only the rows/columns with unknown pairs
+    are requested, and their results are cached for next time. The cache is
+    shared by all profiles on the same ORS profile.
+    """
+    namespace = base_profile(profile)
+    keys = [_coord_key(coords) for coords in locations]
+    known = _cached_durations(namespace, keys)
+    durations: List[List[float | None]] = [[None] * len(locations) for _ in locations]
+    missing_rows, missing_cols = set(), set()
+
+    for i, start_key in enumerate(keys):
+        row = durations[i]
+        for j, end_key in enumerate(keys):
+            if i == j:
+                row[j] = 0.0
+                continue
+            cached = known.get((namespace,) + start_key + end_key, _NOT_CACHED)
+            if cached is _NOT_CACHED:
+                missing_rows.add(i)
+                missing_cols.add(j)
+            else:
+                row[j] = cached
+
+    if missing_rows:
+        sources, destinations = sorted(missing_rows), sorted(missing_cols)
+        # Fetched unscaled, in the namespace's own profile
+        matrix = get_distance_matrix(locations, sources=sources, destinations=destinations, profile=namespace)
+        if not matrix or len(matrix.get("durations") or []) != len(sources):
+            return None
+        fetched = {}
+        for i, fetched_row in zip(sources, matrix["durations"]):
+            for j, value in zip(destinations, fetched_row):
+                if i != j:
+                    durations[i][j] = value
+                    fetched[(namespace,) + keys[i] + keys[j]] = value
+        DURATION_CACHE.set_many(fetched)
+
+    if ROUTING_PROFILES[profile][1] != 1.0:
+        durations = [[_scaled(value, profile) for value in row] for row in durations]
+    return {"durations": durations}
+
+
+# Rough travel-time model for when the matrix cannot be fetched in time:
+# road distance ~1.3x the straight line, at a typical average speed per ORS profile
+# (~45 km/h by car on Sri Lankan roads, ~15 km/h cycling, ~5 km/h walking)
+ESTIMATE_DETOUR_FACTOR = 1.3
+ESTIMATE_SPEED_MPS = {"driving-car": 12.5, "cycling-regular": 4.2, "foot-walking": 1.4}
+
+
+def _haversine_m(start: Tuple[float, float], end: Tuple[float, float]) -> float:
+    lon1, lat1, lon2, lat2 = map(math.radians, (start[0], start[1], end[0], end[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6_371_000 * math.asin(math.sqrt(h))
+
+
+def estimate_duration_matrix(locations: List[Tuple[float, float]],
+                             profile: str = DEFAULT_PROFILE) -> List[List[float | None]]:
+    """
+    A full duration matrix without any request: DURATION_CACHE where known,
+    otherwise a straight-line estimate. Estimates are never cached.
     """
-    Gets the vehicle route geometry between two points.
+    namespace = base_profile(profile)
+    speed = ESTIMATE_SPEED_MPS[namespace]
+    keys = [_coord_key(coords) for coords in locations]
+    known = _cached_durations(namespace, keys)
+    durations: List[List[float | None]] = []
+    for i, start in enumerate(locations):
+        row = []
+        for j, end in enumerate(locations):
+            cached = known.get((namespace,) + keys[i] + keys[j], _NOT_CACHED) if i != j else 0.0
+            if cached is _NOT_CACHED:
+                cached = round(_haversine_m(start, end) * ESTIMATE_DETOUR_FACTOR / speed, 1)
+            row.append(_scaled(cached, profile))
+        durations.append(row)
+    return durations
+
+
+def get_directions_route(start_coords: Tuple[float, float], end_coords: Tuple[float, float],
+                         profile: str = DEFAULT_PROFILE) -> Dict[str, Any] | None:
+    """
+    Gets the route geometry between two points for a routing profile.
     Returns a GeoJSON geometry dictionary.
+    Results are served from ROUTE_CACHE when possible.
+    """
+    segment = get_directions_segment(start_coords, end_coords, profile)
+    return segment["geometry"] if segment else None
+
+
+def get_directions_segment(start_coords: Tuple[float, float], end_coords: Tuple[float, float],
+                           profile: str = DEFAULT_PROFILE) -> Dict[str, Any] | None:
+    """
+    Like get_directions_route, but returns the whole segment:
+    {"geometry": GeoJSON LineString, "duration": seconds, "distance": metres},
+    as routed by the profile's ORS profile (the segment is shared by every
+    profile on it, so its duration is unscaled).
+    Concurrent requests for the same uncached leg share one ORS call.
     """
-    client = httpx.Client()
+    ors_profile = base_profile(profile)
+    return ROUTE_CACHE.get_or_compute(
+        route_cache_key(start_coords, end_coords, ors_profile),
+        lambda: _route_segment(start_coords, end_coords, ors_profile)
+    )
+
+
+def _route_segment(start_coords: Tuple[float, float], end_coords: Tuple[float, float],
+                   ors_profile: str) -> Dict[str, Any] | None:
+    if settings.ROUTING_BACKEND == "local" and ors_profile == "driving-car":
+        try:
+            return routing_engine.get_engine().get_route(start_coords, end_coords) or None
+        except Exception as e:
+            print(f"Error in local get_directions_route: {e}")
+            return None
+
+    if deadline.expired():
+        print("Request budget exhausted; skipping ORS directions request")
+        return None
+
+    client = get_client()
     headers = {
         'Authorization': settings.ORS_API_KEY,
         'Content-Type': 'application/json'
@@ -225,16 +640,23 @@ def get_directions_route(start_coords: Tuple[float, float], end_coords: Tuple[fl
     try:
         # We ask for GeoJSON format directly
         response = client.post(
-            f"{ORS_BASE_URL}/v2/directions/driving-car/geojson",
+            f"{ORS_BASE_URL}/v2/directions/{ors_profile}/geojson",
             json=body,
-            headers=headers
+            headers=headers,
+            timeout=deadline.timeout(settings.ORS_REQUEST_TIMEOUT)
         )
         response.raise_for_status()
         data = response.json()
 
         # Extract the geometry from the GeoJSON response
         if data.get("features") and len(data["features"]) > 0:
-            return data["features"][0]["geometry"]
+            feature = data["features"][0]
+            summary = (feature.get("properties") or {}).get("summary") or {}
+            return {
+                "geometry": feature["geometry"],
+                "duration": summary.get("duration"),
+                "distance": summary.get("distance")
+            }
         return None
     except httpx.HTTPStatusError as e:
         print(f"Error getting directions route: {e.response.status_code} - {e.response.text}")
@@ -242,5 +664,3 @@ def get_directions_route(start_coords: Tuple[float, float], end_coords: Tuple[fl
     except Exception as e:
         print(f"Error in get_directions_route: {e}")
         return None
-    finally:
-        client.close()
\ No newline at end of file
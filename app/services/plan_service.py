@@ -1,19 +1,44 @@
 # File: app/services/plan_service.py
 
-import httpx
 from supabase import Client
-from app.models.schemas import TripGenerationRequest, TripResponse, LocationResponse, TripDayResponse
+from app.models.schemas import TripGenerationRequest, TripResponse, LocationResponse, TripDayResponse, \
+    BatchTripResult, TripDayEditRequest, TripGeometryOptions, TripSummary, TripListResponse
+from app.core import cache, deadline
 from app.core.config import settings
-from app.services import ors_service
+from app.services import ors_service, geometry_service, hotel_service, planner_pool, segment_store
 from fastapi import HTTPException
-from typing import List, Dict, Any, Optional
+from array import array
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple, Iterator
+import base64
+import json
 import sys
+import threading
+import time
 import traceback
+import uuid
 
 # Import the client instance directly
 from app.db.supabase_client import supabase_client as db_client
 
 
+# Catalog rows we have fetched, by id (used by trip edits to avoid re-fetching);
+# they expire with the candidate lists so catalog edits show up in both, and
+# invalidate_candidate_lists() drops them straight away
+LOCATION_CACHE = cache.get_cache("catalog_locations", settings.LOCATION_CACHE_MAX_ENTRIES,
+                                 ttl=settings.CANDIDATE_LIST_TTL)
+
+# The catalog version, changed by invalidate_candidate_lists(). Candidate lists built
+# under another version are stale. On a shared cache backend this reaches every worker
+# on its next read: there is no in-process copy to wait out.
+CATALOG_STATE = cache.get_cache("catalog_state", 16, local_front=False)
+
+
+def _catalog_version() -> Optional[str]:
+    return CATALOG_STATE.get("version")
+
+
 # Helper function (no changes)
 def parse_point_string(point_str: str) -> Dict[str, float]:
     try:
@@ -24,8 +49,17 @@ def parse_point_string(point_str: str) -> Dict[str, float]:
         return {"longitude": 0.0, "latitude": 0.0}
 
 
-def generate_trip_plan(request: TripGenerationRequest, user_id: Optional[str] = None) -> TripResponse:
-    # ... (Steps 1, 2, 3 - Budget Check, Fetch Locations, Prioritize - NO CHANGES) ...
+def _to_location_response(loc: Dict[str, Any]) -> LocationResponse:
+    return LocationResponse(
+        id=loc['id'],
+        name=loc['name'],
+        description=loc['description'],
+        image_url=loc['image_url'],
+        coordinates={"longitude": float(loc['lon']), "latitude": float(loc['lat'])}
+    )
+
+
+def _check_budget(request: TripGenerationRequest) -> None:
     # 1. Budget Check
     min_budget = settings.DAILY_BUDGET_PER_PERSON * request.num_people * request.num_days
     if request.budget < min_budget:
@@ -34,24 +68,29 @@ def generate_trip_plan(request: TripGenerationRequest, user_id: Optional[str] =
             detail=f"Budget is too low. Minimum required budget for {request.num_people} people for {request.num_days} days is ${min_budget}."
         )
 
+
+def _fetch_locations_for_interests(interests: List[str]) -> List[Dict[str, Any]]:
     # 2. Fetch locations
     try:
         locations_response = db_client.rpc(
             'get_locations_by_tags',
-            {'tag_names': request.interests}
+            {'tag_names': interests}
         ).execute()
 
         if not locations_response.data:
             raise HTTPException(status_code=404, detail="No locations found matching your interests.")
 
-        all_locations = locations_response.data
+        LOCATION_CACHE.set_many({loc['id']: loc for loc in locations_response.data})
+        return locations_response.data
     except Exception as e:
         print(f"Supabase error fetching locations: {e}", file=sys.stderr)
         sys.stderr.flush()
         raise HTTPException(status_code=500, detail="Error fetching locations from database.")
 
+
+def _prioritize_locations(all_locations: List[Dict[str, Any]], interests: List[str]) -> List[Dict[str, Any]]:
     # 3. Prioritize locations
-    interest_set = set(request.interests)
+    interest_set = set(interests)
     perfect_matches = []
     partial_matches = []
     for loc in all_locations:
@@ -67,125 +106,558 @@ def generate_trip_plan(request: TripGenerationRequest, user_id: Optional[str] =
     if not sorted_locations:
         raise HTTPException(status_code=44, detail="No valid locations with coordinates found for your interests.")
 
-    # 4. Build the Itinerary
-    itinerary_days = []
-    available_locations = sorted_locations.copy()
+    return sorted_locations
 
-    # Start at the airport
-    current_coords = settings.STARTING_POINT_COORDS
 
-    # 5. Prepare data for the external hotel service
-    hotel_service_data = {
-        "num_people": request.num_people,
-        "daily_locations": {}
-    }
+def _location_coords(loc: Dict[str, Any]) -> Tuple[float, float]:
+    return (float(loc['lon']), float(loc['lat']))
 
-    # 6. Main Day Generation Loop
-    for day_num in range(1, request.num_days + 1):
-        day_plan_locations = []
-        day_route_segments = []  # <-- NEW: List to hold route geometries for the day
 
-        # Assign up to 6 locations per day
-        for _ in range(6):
-            if not available_locations:
-                break
+def _location_coords_or_none(loc: Dict[str, Any]) -> Optional[Tuple[float, float]]:
+    try:
+        return _location_coords(loc)
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def _visit_seconds(loc: Dict[str, Any]) -> float:
+    """Time spent at a location: its visit_duration_minutes, else DEFAULT_VISIT_MINUTES."""
+    try:
+        minutes = float(loc['visit_duration_minutes'])
+    except (KeyError, TypeError, ValueError):
+        minutes = settings.DEFAULT_VISIT_MINUTES
+    return max(minutes, 0.0) * 60
+
+
+class DurationTable:
+    """
+    An in-memory ORS duration matrix, looked up by (longitude, latitude) pairs.
+    One table can be shared by several plans whose candidates overlap.
+    `estimated` tables were filled from straight-line estimates to meet a deadline.
+    """
+
+    def __init__(self, coords: List[Tuple[float, float]], durations: List[List[Optional[float]]],
+                 estimated: bool = False):
+        self.index = {coord: i for i, coord in enumerate(coords)}
+        self.durations = durations
+        self.estimated = estimated
+        self._shared: Optional[planner_pool.SharedMatrix] = None
+        self._shared_lock = threading.Lock()
+
+    def shared_ref(self) -> tuple:
+        """This matrix in shared memory, for planner pool tasks (copied on first use, freed with the table)."""
+        with self._shared_lock:
+            if self._shared is None:
+                self._shared = planner_pool.SharedMatrix(self.durations)
+        return self._shared.ref()
+
+    def get(self, start: Tuple[float, float], end: Tuple[float, float]) -> Optional[float]:
+        i = self.index.get(start)
+        j = self.index.get(end)
+        if i is None or j is None:
+            return None
+        return self.durations[i][j]
+
+
+def fetch_duration_table(location_groups: List[List[Dict[str, Any]]],
+                         profile: str = ors_service.DEFAULT_PROFILE) -> Optional[DurationTable]:
+    """
+    Fetches ONE duration matrix covering the airport and every location in
+    every group (duplicates are only sent once).
+    Returns None if ORS fails, which means no day can be planned.
+    """
+    coords = [settings.STARTING_POINT_COORDS]
+    seen = {settings.STARTING_POINT_COORDS}
+    for locations in location_groups:
+        for loc in locations:
             try:
-                coord_list = [current_coords] + [
-                    (float(loc['lon']), float(loc['lat'])) for loc in available_locations
-                ]
+                coord = _location_coords(loc)
             except (ValueError, KeyError, TypeError) as coord_err:
-                print(f"Error preparing coordinates for ORS: {coord_err}. Skipping day planning step.")
-                break
+                print(f"Error preparing coordinates for ORS: {coord_err}. Skipping {loc.get('name', 'Unknown')}.")
+                continue
+            if coord not in seen:
+                seen.add(coord)
+                coords.append(coord)
 
-            matrix = ors_service.get_distance_matrix(coord_list)
+    return _duration_table_for_coords(coords, profile)
 
-            if not matrix or 'durations' not in matrix or not matrix['durations'] or not matrix['durations'][0]:
-                print(f"ORS Matrix API failed or returned unexpected structure: {matrix}. Breaking plan generation.")
-                available_locations = []
-                break
-            travel_times = matrix['durations'][0][1:]
-            if len(travel_times) != len(available_locations):
-                print(
-                    f"Mismatch between travel times ({len(travel_times)}) and available locations ({len(available_locations)}). Skipping step.")
-                break
-            if not travel_times:
-                print("No travel times returned by ORS. Stopping day planning.")
-                break
-            closest_index = min(range(len(travel_times)),
-                                key=lambda i: travel_times[i] if travel_times[i] is not None else float('inf'))
-            if travel_times[closest_index] is None:
-                print(
-                    f"Could not find a route to any remaining locations from {current_coords}. Stopping day planning.")
-                break
 
-            chosen_location = available_locations.pop(closest_index)
+def _duration_table_for_coords(coords: List[Tuple[float, float]],
+                               profile: str = ors_service.DEFAULT_PROFILE) -> Optional[DurationTable]:
+    if deadline.below(settings.PLAN_MATRIX_MIN_SECONDS):
+        print("--- Request budget too low for the ORS matrix; estimating durations ---")
+        return DurationTable(coords, ors_service.estimate_duration_matrix(coords, profile), estimated=True)
 
-            # --- NEW: Get the route geometry for this step ---
-            start_coords_for_route = current_coords
-            end_coords_for_route = (float(chosen_location['lon']), float(chosen_location['lat']))
+    matrix = ors_service.get_duration_matrix(coords, profile)
 
-            # This calls 'get_directions_route' for "driving-car"
-            route_geom = ors_service.get_directions_route(start_coords_for_route, end_coords_for_route)
+    if not matrix or 'durations' not in matrix or not matrix['durations'] or not matrix['durations'][0]:
+        print(f"ORS Matrix API failed or returned unexpected structure: {matrix}. Breaking plan generation.")
+        matrix = None
+    elif len(matrix['durations']) != len(coords):
+        print(f"Mismatch between matrix rows ({len(matrix['durations'])}) and coordinates ({len(coords)}).")
+        matrix = None
 
-            if route_geom:
-                day_route_segments.append(route_geom)
-            else:
-                day_route_segments.append(None)  # Add None if route fails
-            # --- END NEW ---
-
-            day_plan_locations.append(chosen_location)
-            current_coords = end_coords_for_route  # Update current_coords for the *next* iteration
-
-        # Add the day's plan
-        if day_plan_locations:
-            last_location_of_the_day = day_plan_locations[-1]
-            hotel_service_data["daily_locations"][f"day{day_num}"] = {
-                "lat": float(last_location_of_the_day['lat']),
-                "long": float(last_location_of_the_day['lon'])
-            }
-            itinerary_days.append(
-                TripDayResponse(
-                    day_number=day_num,
-                    locations=[
-                        LocationResponse(
-                            id=loc['id'],
-                            name=loc['name'],
-                            description=loc['description'],
-                            image_url=loc['image_url'],
-                            coordinates={"longitude": float(loc['lon']), "latitude": float(loc['lat'])}
-                        ) for loc in day_plan_locations
-                    ],
-                    route_geometries=day_route_segments  # <-- NEW: Add the route list
-                )
-            )
-        if not available_locations:
-            break
+    if matrix is None:
+        # Only a spent budget is worth an estimated plan (the matrix ran out of time); any
+        # other ORS failure (bad key, 4xx, outage, bad response) still fails the plan
+        if deadline.expired() or deadline.below(settings.PLAN_MATRIX_MIN_SECONDS):
+            print("--- ORS matrix failed with the request budget spent; estimating durations ---")
+            return DurationTable(coords, ors_service.estimate_duration_matrix(coords, profile), estimated=True)
+        return None
 
-    # 7. Call Hotel Service (No changes)
-    if hotel_service_data["daily_locations"]:
-        hotel_service_endpoint = f"{settings.HOTEL_SERVICE_URL}/nearest-hotels"
-        print(f"--- Calling Hotel Service at {hotel_service_endpoint} ---")
-        print(hotel_service_data)
-        try:
-            with httpx.Client(timeout=10.0) as client:
-                response = client.post(hotel_service_endpoint, json=hotel_service_data)
-                response.raise_for_status()
-                hotel_results = response.json()
-                print(f"Hotel service response: {hotel_results}")
-        except httpx.HTTPStatusError as e:
-            print(f"Hotel service returned an error: {e}", file=sys.stderr)
-        except httpx.RequestError as e:
-            print(f"Error calling hotel service (e.g., connection refused): {e}", file=sys.stderr)
-        except Exception as e:
-            print(f"An unexpected error occurred during hotel service call: {e}", file=sys.stderr)
-        sys.stdout.flush()
-        sys.stderr.flush()
+    return DurationTable(coords, matrix['durations'])
 
-    if not itinerary_days:
+
+# --- Precomputed candidate lists (steps 2-3) ---
+# Users pick from a small interest vocabulary, and in practice from a handful
+# of combinations. For each combination (and routing profile) we keep the prioritized
+# candidates and their duration table (row 0 = durations from the airport), so steps 2-3 and
+# the matrix become a dictionary lookup. An entry older than CANDIDATE_LIST_TTL
+# is still served while a background thread rebuilds it from the catalog.
+# Entries built from estimated durations, or before the last catalog change
+# (see invalidate_candidate_lists), count as stale straight away.
+
+class PlannerLocation:
+    """A candidate as the day loop sees it: converted coordinates and its duration-table row."""
+    __slots__ = ("loc", "coords", "row")
+
+    def __init__(self, loc: Dict[str, Any], coords: Tuple[float, float], row: int):
+        self.loc = loc
+        self.coords = coords
+        self.row = row
+
+
+class CandidateList:
+    """The prioritized candidate locations for one interest combination."""
+
+    def __init__(self, interests_key: Tuple[str, ...], locations: List[Dict[str, Any]],
+                 durations: DurationTable, profile: str = ors_service.DEFAULT_PROFILE,
+                 catalog_version: Optional[str] = None):
+        self.interests_key = interests_key
+        self.profile = profile
+        self.catalog_version = catalog_version
+        self.locations = locations
+        self.location_ids = [loc['id'] for loc in locations]
+        self.durations = durations
+        self.airport_durations = [
+            durations.get(settings.STARTING_POINT_COORDS, _location_coords(loc)) for loc in locations
+        ]
+        # Converted once here, not on every step of every plan
+        self.planner_locations = []
+        for loc in locations:
+            coords = _location_coords_or_none(loc)
+            row = durations.index.get(coords)
+            if row is not None:
+                self.planner_locations.append(PlannerLocation(loc, coords, row))
+        self.planner_rows = array('l', (record.row for record in self.planner_locations))
+        self.planner_visit_seconds = array('d', (_visit_seconds(record.loc) for record in self.planner_locations))
+        # Day selections made on this list, by daily budget (see _schedule_days)
+        self.schedules: "OrderedDict[float, Tuple[List[List[int]], bool]]" = OrderedDict()
+        self.schedules_lock = threading.Lock()
+        self.built_at = time.monotonic()
+
+    def is_stale(self) -> bool:
+        return self.durations.estimated or time.monotonic() - self.built_at > settings.CANDIDATE_LIST_TTL \
+            or self.catalog_version != _catalog_version()
+
+
+# Keyed by (routing profile, interests key)
+CANDIDATE_LISTS: "OrderedDict[Tuple[str, Tuple[str, ...]], CandidateList]" = OrderedDict()
+_candidate_lists_lock = threading.Lock()
+_candidate_build_locks: Dict[Tuple[str, Tuple[str, ...]], threading.Lock] = {}
+_candidate_refreshing = set()
+
+
+def _interests_key(interests: List[str]) -> Tuple[str, ...]:
+    return tuple(sorted(set(interests)))
+
+
+def _build_candidate_list(interests_key: Tuple[str, ...], profile: str) -> CandidateList:
+    # Read before the catalog, so a change during the build leaves the list stale
+    catalog_version = _catalog_version()
+    all_locations = _fetch_locations_for_interests(list(interests_key))
+    sorted_locations = _prioritize_locations(all_locations, list(interests_key))
+    durations = fetch_duration_table([sorted_locations], profile)
+    if durations is None:
+        # Not cached: the next request tries ORS again
         raise HTTPException(status_code=404,
                             detail="Could not generate any valid itinerary days with the selected locations and routing.")
+    return CandidateList(interests_key, sorted_locations, durations, profile, catalog_version)
 
-    # 8. Save the new trip to the database
+
+def _store_candidate_list(candidates: CandidateList) -> None:
+    cache_key = (candidates.profile, candidates.interests_key)
+    with _candidate_lists_lock:
+        CANDIDATE_LISTS[cache_key] = candidates
+        CANDIDATE_LISTS.move_to_end(cache_key)
+        while len(CANDIDATE_LISTS) > settings.CANDIDATE_LIST_MAX_COMBOS:
+            CANDIDATE_LISTS.popitem(last=False)
+
+
+def _refresh_candidate_list(cache_key: Tuple[str, Tuple[str, ...]]) -> None:
+    profile, interests_key = cache_key
+    try:
+        _store_candidate_list(_build_candidate_list(interests_key, profile))
+    except Exception as e:
+        # Keep serving the stale entry; the next request retries
+        print(f"Failed to refresh candidate list for {interests_key} ({profile}): {e}", file=sys.stderr)
+        sys.stderr.flush()
+    finally:
+        with _candidate_lists_lock:
+            _candidate_refreshing.discard(cache_key)
+
+
+def get_candidate_list(interests: List[str], profile: str = ors_service.DEFAULT_PROFILE) -> CandidateList:
+    """
+    The candidate list for `interests` and routing `profile`, from memory when possible.
+    Raises HTTPException when the catalog has nothing usable (never cached).
+    """
+    interests_key = _interests_key(interests)
+    cache_key = (profile, interests_key)
+    with _candidate_lists_lock:
+        candidates = CANDIDATE_LISTS.get(cache_key)
+        if candidates is not None:
+            CANDIDATE_LISTS.move_to_end(cache_key)
+            if candidates.is_stale() and cache_key not in _candidate_refreshing:
+                _candidate_refreshing.add(cache_key)
+                threading.Thread(target=_refresh_candidate_list, args=(cache_key,), daemon=True).start()
+            return candidates
+        build_lock = _candidate_build_locks.setdefault(cache_key, threading.Lock())
+
+    # One build per combination at a time; concurrent requests wait for it
+    with build_lock:
+        with _candidate_lists_lock:
+            candidates = CANDIDATE_LISTS.get(cache_key)
+        if candidates is None:
+            candidates = _build_candidate_list(interests_key, profile)
+            _store_candidate_list(candidates)
+            print(f"--- Candidate list built for {'+'.join(interests_key)} ({profile}): "
+                  f"{len(candidates.locations)} locations ---")
+    return candidates
+
+
+def get_candidate_lists(interest_sets: List[List[str]],
+                        profile: str = ors_service.DEFAULT_PROFILE) -> Dict[Tuple[str, ...], Any]:
+    """
+    The candidate lists for several interest combinations on one routing profile,
+    keyed by interests key. Lists already in memory are served as get_candidate_list
+    serves them; the missing ones are built together from ONE duration table over
+    the union of their locations, so a batch pays for one ORS matrix, not one per
+    combination. A combination that cannot be built maps to its exception instead.
+    """
+    results: Dict[Tuple[str, ...], Any] = {}
+    missing = []
+    for interests_key in dict.fromkeys(_interests_key(interests) for interests in interest_sets):
+        with _candidate_lists_lock:
+            cached = (profile, interests_key) in CANDIDATE_LISTS
+        if cached:
+            results[interests_key] = get_candidate_list(list(interests_key), profile)
+        else:
+            missing.append(interests_key)
+    if not missing:
+        return results
+
+    catalog_version = _catalog_version()
+    prioritized: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+    for interests_key in missing:
+        try:
+            all_locations = _fetch_locations_for_interests(list(interests_key))
+            prioritized[interests_key] = _prioritize_locations(all_locations, list(interests_key))
+        except Exception as e:
+            results[interests_key] = e
+
+    if prioritized:
+        durations = fetch_duration_table(list(prioritized.values()), profile)
+        for interests_key, sorted_locations in prioritized.items():
+            if durations is None:
+                results[interests_key] = HTTPException(
+                    status_code=404,
+                    detail="Could not generate any valid itinerary days with the selected locations and routing.")
+                continue
+            candidates = CandidateList(interests_key, sorted_locations, durations, profile, catalog_version)
+            _store_candidate_list(candidates)
+            results[interests_key] = candidates
+        print(f"--- Candidate lists built for {len(prioritized)} combinations ({profile}) "
+              f"from one duration table ---")
+    return results
+
+
+def invalidate_candidate_lists() -> None:
+    """
+    Call after the catalog changes (POST /catalog/invalidate does). Drops this
+    worker's candidate lists and the cached catalog rows, and moves the catalog
+    version on, so other workers rebuild their lists in the background. With
+    CACHE_BACKEND=local the version is per worker; the others catch up
+    within CANDIDATE_LIST_TTL.
+    """
+    CATALOG_STATE.set("version", uuid.uuid4().hex)
+    LOCATION_CACHE.clear()
+    with _candidate_lists_lock:
+        CANDIDATE_LISTS.clear()
+    print("--- Catalog changed: candidate lists and cached locations dropped ---")
+
+
+def precompute_candidate_lists(combinations: List[List[str]]) -> None:
+    """Builds the candidate lists for the given interest combinations (e.g. at startup)."""
+    for interests in combinations:
+        try:
+            get_candidate_list(interests)
+        except Exception as e:
+            print(f"Could not precompute candidate list for {interests}: {e}", file=sys.stderr)
+    sys.stderr.flush()
+
+
+def prepare_candidate_locations(request: TripGenerationRequest) -> CandidateList:
+    """
+    Runs the budget check and looks up the candidate list (steps 1-3).
+    Raises HTTPException for anything the user needs to fix.
+    """
+    _check_budget(request)
+    with deadline.holding_back(settings.PLAN_SAVE_RESERVE_SECONDS):
+        return get_candidate_list(request.interests, request.routing_profile)
+
+
+# Daily budgets whose schedules are kept per candidate list
+SCHEDULES_PER_CANDIDATE_LIST = 16
+
+
+def _schedule_days(candidates: CandidateList, num_days: int, day_seconds: float) -> List[List[int]]:
+    """
+    The positions of the candidates chosen for each day (planner_pool.select_days).
+
+    The selection is greedy and depends only on the candidate list and the
+    daily budget. A longer trip's first days are therefore the same as a
+    shorter trip's, so one schedule per (list, budget) serves every trip
+    length up to the longest computed so far. A schedule that ran out of
+    reachable candidates serves every trip length.
+    """
+    with candidates.schedules_lock:
+        cached = candidates.schedules.get(day_seconds)
+        if cached is not None:
+            candidates.schedules.move_to_end(day_seconds)
+            days, complete = cached
+            if complete or len(days) >= num_days:
+                return days[:num_days]
+
+    records = candidates.planner_locations
+    start_row = candidates.durations.index[settings.STARTING_POINT_COORDS]
+    # Matrix cells scanned, at most: every candidate, once per stop that can fit in the trip
+    shortest_visit = min(candidates.planner_visit_seconds, default=0.0)
+    max_stops = num_days * (int(day_seconds // shortest_visit) + 1) if shortest_visit > 0 else len(records)
+    offload = planner_pool.enabled() and \
+        len(records) * min(len(records), max_stops) >= settings.PLANNER_OFFLOAD_MIN_STEPS
+    args = (candidates.planner_rows, candidates.planner_visit_seconds, start_row, num_days, day_seconds)
+    matrix = candidates.durations.durations
+    days = planner_pool.run(
+        planner_pool.select_days, candidates.durations.shared_ref() if offload else matrix, *args,
+        offload=offload, inline_args=(matrix,) + args
+    )
+
+    with candidates.schedules_lock:
+        candidates.schedules[day_seconds] = (days, len(days) < num_days)
+        candidates.schedules.move_to_end(day_seconds)
+        while len(candidates.schedules) > SCHEDULES_PER_CANDIDATE_LIST:
+            candidates.schedules.popitem(last=False)
+    return days
+
+
+def _iter_day_selections(
+        candidates: CandidateList,
+        num_days: int,
+        daily_hours: Optional[float] = None
+) -> Iterator[Tuple[int, List[Dict[str, Any]], List[Tuple[Tuple[float, float], Tuple[float, float]]],
+                    List[Tuple[str, str]]]]:
+    """
+    Chooses the locations for each day (step 6): always the closest remaining
+    location according to the duration table, for as long as driving there
+    and visiting it fits in the day's hours (`daily_hours`, default
+    DAILY_HOURS_BUDGET). Yields (day_number, chosen locations, route legs,
+    leg location-id pairs) per day, so callers can emit a day before any
+    route geometry is fetched.
+
+    Only the in-memory duration table is used (no ORS calls). The schedule is
+    kept on the candidate list, and large selections run in the planner pool
+    (see _schedule_days).
+    """
+    records = candidates.planner_locations
+    day_seconds = (daily_hours or settings.DAILY_HOURS_BUDGET) * 3600
+    selections = _schedule_days(candidates, num_days, day_seconds)
+    if len(selections) < num_days and sum(map(len, selections)) < len(records):
+        print("Could not find a route to any remaining locations. Stopping day planning.")
+
+    # Start at the airport
+    current_coords = settings.STARTING_POINT_COORDS
+    current_id = segment_store.AIRPORT_ID
+
+    for day_num, positions in enumerate(selections, start=1):
+        day_plan_locations = []
+        day_legs = []  # (start, end) pairs, routed later
+        day_leg_ids = []
+        for position in positions:
+            chosen = records[position]
+            day_legs.append((current_coords, chosen.coords))
+            day_leg_ids.append((current_id, chosen.loc['id']))
+            day_plan_locations.append(chosen.loc)
+            # Start of the *next* leg
+            current_coords, current_id = chosen.coords, chosen.loc['id']
+        yield day_num, day_plan_locations, day_legs, day_leg_ids
+
+
+def _fetch_day_routes(
+        day_legs: List[Tuple[Tuple[float, float], Tuple[float, float]]],
+        route_cache: Optional[Dict[Tuple[Tuple[float, float], Tuple[float, float]], Optional[dict]]] = None,
+        geometry_format: str = "geojson",
+        simplify_tolerance_m: Optional[float] = None,
+        leg_ids: Optional[List[Tuple[str, str]]] = None,
+        profile: str = ors_service.DEFAULT_PROFILE
+) -> List[Optional[dict]]:
+    """
+    Gets the route geometry of routing `profile` for every leg of a day, in the
+    requested output format (see geometry_service.format_route_geometry).
+    A failed leg is represented by None so indexes line up with the locations.
+    Legs already in `route_cache` are not requested again. When `leg_ids`
+    (location-id pairs) are given, legs are read from and written to the
+    persisted segment store, so ORS is only asked once per pair.
+    """
+    if route_cache is None:
+        route_cache = {}
+
+    # Geometry belongs to the ORS profile, so e.g. car and tuk-tuk plans share legs
+    ors_profile = ors_service.base_profile(profile)
+    stored = {}
+    if leg_ids:
+        stored = segment_store.get_segments(
+            [(ids, leg[0], leg[1]) for leg, ids in zip(day_legs, leg_ids) if leg not in route_cache],
+            ors_profile
+        )
+
+    for i, leg in enumerate(day_legs):
+        if leg not in route_cache:
+            ids = leg_ids[i] if leg_ids else None
+            segment = stored.get(ids)
+            if segment is None:
+                segment = ors_service.get_directions_segment(leg[0], leg[1], ors_profile)
+                if segment is not None and ids is not None:
+                    segment = segment_store.put_segment(ids, leg[0], leg[1], ors_profile, segment)
+            route_cache[leg] = segment["geometry"] if segment else None
+    # The whole day is formatted in one go, so simplification can use the planner pool
+    return geometry_service.format_route_geometries(
+        [(ors_service.route_cache_key(leg[0], leg[1], ors_profile), route_cache[leg]) for leg in day_legs],
+        geometry_format,
+        simplify_tolerance_m
+    )
+
+
+# --- Route references (geometry_mode "refs") ---
+# A reference is the routing profile and the ordered stop coordinates,
+# "profile:lon,lat~lon,lat~...", so GET /trips/routes/{ref} can always rebuild
+# the geometry without any saved state. Older references have no "profile:" part.
+
+ROUTE_REF_SEPARATOR = "~"
+ROUTE_REF_PROFILE_SEPARATOR = ":"
+
+
+def make_route_ref(points: List[Tuple[float, float]], profile: str = ors_service.DEFAULT_PROFILE) -> str:
+    return profile + ROUTE_REF_PROFILE_SEPARATOR + \
+        ROUTE_REF_SEPARATOR.join(f"{lon:.6f},{lat:.6f}" for lon, lat in points)
+
+
+def parse_route_ref(ref: str) -> Tuple[Optional[str], List[Tuple[float, float]]]:
+    """
+    Parses a route reference back into its routing profile (None for older
+    references without one) and (longitude, latitude) points.
+    Raises ValueError if the reference is malformed.
+    """
+    profile = None
+    if ROUTE_REF_PROFILE_SEPARATOR in ref:
+        profile, ref = ref.split(ROUTE_REF_PROFILE_SEPARATOR, 1)
+        if profile not in ors_service.ROUTING_PROFILES:
+            raise ValueError(f"Unknown routing profile: {profile}")
+    points = []
+    for part in ref.split(ROUTE_REF_SEPARATOR):
+        lon_str, lat_str = part.split(",")
+        lon, lat = float(lon_str), float(lat_str)
+        if not (-180.0 <= lon <= 180.0 and -90.0 <= lat <= 90.0):
+            raise ValueError(f"Coordinate out of range: {part}")
+        points.append((lon, lat))
+    if len(points) < 2:
+        raise ValueError("A route reference needs at least two points.")
+    if len(points) > settings.MAX_ROUTE_REF_POINTS:
+        raise ValueError(f"A route reference can have at most {settings.MAX_ROUTE_REF_POINTS} points.")
+    return profile, points
+
+
+def get_route_geometries_for_ref(
+        points: List[Tuple[float, float]],
+        geometry_format: str = "geojson",
+        simplify_tolerance_m: Optional[float] = None,
+        profile: str = ors_service.DEFAULT_PROFILE
+) -> List[Optional[dict]]:
+    """
+    Returns one route geometry per consecutive pair of points (None for failed legs).
+    """
+    return _fetch_day_routes(list(zip(points, points[1:])), None, geometry_format, simplify_tolerance_m,
+                             profile=profile)
+
+
+def _day_route_fields(
+        request: TripGenerationRequest | TripDayEditRequest | TripGeometryOptions,
+        day_legs: List[Tuple[Tuple[float, float], Tuple[float, float]]],
+        route_cache: Optional[Dict] = None,
+        leg_ids: Optional[List[Tuple[str, str]]] = None,
+        profile: str = ors_service.DEFAULT_PROFILE
+) -> Dict[str, Any]:
+    """
+    Route fields of a TripDayResponse: inline geometries, or references only.
+    Falls back to references when the request budget is too low for routing.
+    """
+    if request.geometry_mode == "inline" and deadline.below(settings.PLAN_GEOMETRY_MIN_SECONDS):
+        deadline.degrade("route_geometry_skipped")
+        return _day_route_fields(TripGeometryOptions(geometry_mode="refs"), day_legs, profile=profile)
+    if request.geometry_mode == "refs":
+        day_points = [day_legs[0][0]] + [end for _, end in day_legs]
+        return {
+            "route_refs": [make_route_ref([start, end], profile) for start, end in day_legs],
+            "day_route_ref": make_route_ref(day_points, profile)
+        }
+    return {"route_geometries": _fetch_day_routes(
+        day_legs, route_cache, request.geometry_format, request.simplify_tolerance_m, leg_ids, profile
+    )}
+
+
+# trips.plan_snapshot (jsonb) holds the saved plan, so reading a trip back needs
+# no joins and no routing:
+#   {"version": 1, "routing_profile": "driving-car", "revision": 0,
+#    "itinerary": [{"day_number": 1, "locations": [LocationResponse, ...]}, ...]}
+# Route geometry is not stored here; it comes from the segment store by location-id pair.
+# Snapshots without "routing_profile" were planned by car. "revision" counts day edits;
+# an edit only replaces the snapshot it read (older snapshots have no revision).
+PLAN_SNAPSHOT_VERSION = 1
+
+
+def _plan_snapshot(days: List[Tuple[int, List[Dict[str, Any]]]],
+                   routing_profile: str = ors_service.DEFAULT_PROFILE) -> Dict[str, Any]:
+    """`days` is a list of (day_number, [LocationResponse dict, ...])."""
+    return {
+        "version": PLAN_SNAPSHOT_VERSION,
+        "routing_profile": routing_profile,
+        "revision": 0,
+        "itinerary": [{"day_number": day_number, "locations": locations} for day_number, locations in days]
+    }
+
+
+def _save_trip(
+        request: TripGenerationRequest,
+        day_location_ids: List[Tuple[int, List[str]]],
+        user_id: Optional[str] = None,
+        snapshot: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Step 8: saves the 'trips' record and its 'trip_days' rows.
+    `day_location_ids` is a list of (day_number, [location_id, ...]).
+    `snapshot` (see _plan_snapshot) is stored in trips.plan_snapshot.
+    Returns the inserted 'trips' row.
+    """
     new_trip_id = None
     new_trip = None
 
@@ -202,6 +674,9 @@ def generate_trip_plan(request: TripGenerationRequest, user_id: Optional[str] =
             trip_data_to_insert['user_id'] = user_id
 
         print(f"--- Trip data to insert: {trip_data_to_insert} ---")
+
+        if snapshot is not None:
+            trip_data_to_insert['plan_snapshot'] = snapshot
         sys.stdout.flush()
 
         trip_insert_response = db_client.table('trips').insert(trip_data_to_insert).execute()
@@ -226,17 +701,17 @@ def generate_trip_plan(request: TripGenerationRequest, user_id: Optional[str] =
     # Part 2: Save the 'trip_days' records
     try:
         trip_days_data = []
-        for day in itinerary_days:
-            for i, loc in enumerate(day.locations):
-                if loc.id:
+        for day_number, location_ids in day_location_ids:
+            for i, location_id in enumerate(location_ids):
+                if location_id:
                     trip_days_data.append({
                         "trip_id": new_trip_id,
-                        "day_number": day.day_number,
+                        "day_number": day_number,
                         "step_order": i + 1,
-                        "location_id": loc.id
+                        "location_id": location_id
                     })
                 else:
-                    print(f"Warning: Location {loc.name} has invalid ID on Day {day.day_number}, skipping.")
+                    print(f"Warning: Location at step {i + 1} has invalid ID on Day {day_number}, skipping.")
 
         if trip_days_data:
             print(f"--- Saving {len(trip_days_data)} trip day entries... ---")
@@ -261,13 +736,626 @@ def generate_trip_plan(request: TripGenerationRequest, user_id: Optional[str] =
         sys.stderr.flush()
         raise HTTPException(status_code=500, detail="Internal error after saving trip.")
 
+    return new_trip
+
+
+def _hotel_day_entry(last_location_of_the_day: Dict[str, Any]) -> Dict[str, float]:
+    return {
+        "lat": float(last_location_of_the_day['lat']),
+        "long": float(last_location_of_the_day['lon'])
+    }
+
+
+def _build_itinerary(
+        request: TripGenerationRequest,
+        candidates: CandidateList,
+        route_cache: Optional[Dict] = None
+) -> Tuple[List[TripDayResponse], Dict[str, Any]]:
+    """
+    Steps 4-6: builds the itinerary days and the hotel service payload.
+    """
+    # 4. Build the Itinerary
+    itinerary_days = []
+
+    # 5. Prepare data for the external hotel service
+    hotel_service_data = {
+        "num_people": request.num_people,
+        "daily_locations": {}
+    }
+
+    if candidates.durations.estimated:
+        deadline.degrade("estimated_durations")
+
+    # 6. Main Day Generation Loop (keeping enough of the budget to save the trip)
+    with deadline.holding_back(settings.PLAN_SAVE_RESERVE_SECONDS):
+        for day_num, day_plan_locations, day_legs, day_leg_ids in _iter_day_selections(
+                candidates, request.num_days, request.daily_hours):
+            if itinerary_days and deadline.expired():
+                deadline.degrade("partial_itinerary")
+                break
+            hotel_service_data["daily_locations"][f"day{day_num}"] = _hotel_day_entry(day_plan_locations[-1])
+            itinerary_days.append(
+                TripDayResponse(
+                    day_number=day_num,
+                    locations=[_to_location_response(loc) for loc in day_plan_locations],
+                    **_day_route_fields(request, day_legs, route_cache, day_leg_ids, request.routing_profile)
+                )
+            )
+
+    return itinerary_days, hotel_service_data
+
+
+def _finish_trip_plan(
+        request: TripGenerationRequest,
+        itinerary_days: List[TripDayResponse],
+        hotel_service_data: Dict[str, Any],
+        user_id: Optional[str] = None
+) -> TripResponse:
+    """
+    Steps 7-9: starts the hotel lookup, saves the trip and builds the response.
+    """
+    if not itinerary_days:
+        raise HTTPException(status_code=404,
+                            detail="Could not generate any valid itinerary days with the selected locations and routing.")
+
+    # 7. Hotel lookup runs in the background, alongside the save; results are attached to the trip later
+    hotel_lookup = hotel_service.start_lookup(hotel_service_data)
+
+    # 8. Save the new trip to the database
+    new_trip = _save_trip(
+        request,
+        [(day.day_number, [loc.id for loc in day.locations]) for day in itinerary_days],
+        user_id=user_id,
+        snapshot=_plan_snapshot([
+            (day.day_number, [loc.model_dump() for loc in day.locations]) for day in itinerary_days
+        ], request.routing_profile)
+    )
+
+    if hotel_lookup is not None:
+        hotel_service.attach_to_trip(hotel_lookup, new_trip['id'])
+
     # 9. Return the full trip plan
     return TripResponse(
-        id=new_trip_id,
+        id=new_trip['id'],
         num_people=new_trip['num_people'],
         num_days=new_trip['num_days'],
         total_budget=new_trip['total_budget'],
         itinerary=itinerary_days,
-        user_id=new_trip.get('user_id')
+        user_id=new_trip.get('user_id'),
+        routing_profile=request.routing_profile,
+        degradations=deadline.degradations()
+    )
+
+
+def generate_trip_plan(request: TripGenerationRequest, user_id: Optional[str] = None) -> TripResponse:
+    # 1-3. Budget Check, then the (usually precomputed) candidates and their duration matrix
+    candidates = prepare_candidate_locations(request)
+
+    # 4-6. The day loop
+    itinerary_days, hotel_service_data = _build_itinerary(request, candidates)
+
+    # 7-9. Hotel service, save, respond
+    return _finish_trip_plan(request, itinerary_days, hotel_service_data, user_id=user_id)
+
+
+def generate_trip_plans_batch(
+        requests: List[TripGenerationRequest],
+        user_id: Optional[str] = None
+) -> List[BatchTripResult]:
+    """
+    Generates several plans at once, sharing the expensive work between them:
+      - items with the same interests share one candidate list,
+      - the candidate lists the batch has to build share one duration matrix
+        over the union of their locations (one per routing profile),
+      - each route leg is requested once, however many plans use it.
+    A failing item is reported in its own result and does not fail the batch.
+    """
+    results: List[Optional[BatchTripResult]] = [None] * len(requests)
+    prepared: Dict[int, CandidateList] = {}
+
+    def record_error(index: int, status_code: int, detail: Any) -> None:
+        results[index] = BatchTripResult(index=index, status_code=status_code, detail=str(detail))
+
+    def record_exception(index: int, e: Exception) -> None:
+        if isinstance(e, HTTPException):
+            record_error(index, e.status_code, e.detail)
+        else:
+            print(f"Unexpected error preparing batch item {index}: {e}", file=sys.stderr)
+            record_error(index, 500, f"Error during plan generation: {e}")
+
+    # 1. Budget check for every item
+    by_profile: Dict[str, List[int]] = {}
+    for index, request in enumerate(requests):
+        try:
+            _check_budget(request)
+        except Exception as e:
+            record_exception(index, e)
+            continue
+        by_profile.setdefault(request.routing_profile, []).append(index)
+
+    # 2-3. Candidate lists, the missing ones built together per profile
+    for profile, indices in by_profile.items():
+        try:
+            with deadline.holding_back(settings.PLAN_SAVE_RESERVE_SECONDS):
+                lists = get_candidate_lists([requests[index].interests for index in indices], profile)
+        except Exception as e:
+            for index in indices:
+                record_exception(index, e)
+            continue
+        for index in indices:
+            candidates = lists[_interests_key(requests[index].interests)]
+            if isinstance(candidates, Exception):
+                record_exception(index, candidates)
+            else:
+                prepared[index] = candidates
+
+    if prepared:
+        print(f"--- Batch: {len(prepared)} plans, "
+              f"{len({c.interests_key for c in prepared.values()})} interest combinations ---")
+        # Legs are shared between plans on the same ORS profile
+        route_caches: Dict[str, Dict] = {}
+
+        for index, candidates in sorted(prepared.items()):
+            request = requests[index]
+            try:
+                # Shares the batch's budget, but reports only its own degradations
+                with deadline.request_deadline():
+                    route_cache = route_caches.setdefault(ors_service.base_profile(request.routing_profile), {})
+                    itinerary_days, hotel_service_data = _build_itinerary(request, candidates, route_cache)
+                    trip = _finish_trip_plan(request, itinerary_days, hotel_service_data, user_id=user_id)
+                results[index] = BatchTripResult(index=index, status_code=200, trip=trip)
+            except HTTPException as e:
+                record_error(index, e.status_code, e.detail)
+            except Exception as e:
+                print(f"Unexpected error generating batch item {index}: {e}", file=sys.stderr)
+                traceback.print_exc(file=sys.stderr)
+                record_error(index, 500, f"Error during plan generation: {e}")
+
+        print(f"--- Batch: {sum(len(cache) for cache in route_caches.values())} distinct route legs fetched ---")
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    return results
+
+
+def stream_trip_plan(
+        request: TripGenerationRequest,
+        candidates: CandidateList,
+        user_id: Optional[str] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Streaming variant of generate_trip_plan.
+    Yields plain dict events in this order:
+      {"event": "day", ...}     as soon as a day's locations are chosen
+      {"event": "routes", ...}  once that day's route geometries are fetched
+                                (skipped for geometry_mode "refs"; the day event carries refs)
+      {"event": "trip", ...}    after the trip is saved (carries the trip id)
+      {"event": "error", ...}   if something fails after streaming has started
+    Only location ids and the small location records (for the saved snapshot)
+    are kept between days, never the route geometries.
+    """
+    day_location_ids = []
+    snapshot_days = []
+    hotel_service_data = {
+        "num_people": request.num_people,
+        "daily_locations": {}
+    }
+
+    try:
+        for day_num, day_plan_locations, day_legs, day_leg_ids in _iter_day_selections(
+                candidates, request.num_days, request.daily_hours):
+            hotel_service_data["daily_locations"][f"day{day_num}"] = _hotel_day_entry(day_plan_locations[-1])
+            day_location_ids.append((day_num, [loc['id'] for loc in day_plan_locations]))
+
+            day_event = {
+                "event": "day",
+                "day_number": day_num,
+                "locations": [_to_location_response(loc).model_dump() for loc in day_plan_locations]
+            }
+            snapshot_days.append((day_num, day_event["locations"]))
+            if request.geometry_mode == "refs":
+                # No "routes" event: the client fetches geometry by reference when it needs it
+                day_event.update(_day_route_fields(request, day_legs, profile=request.routing_profile))
+                yield day_event
+                continue
+
+            yield day_event
+            yield {
+                "event": "routes",
+                "day_number": day_num,
+                "route_geometries": _fetch_day_routes(
+                    day_legs, None, request.geometry_format, request.simplify_tolerance_m, day_leg_ids,
+                    request.routing_profile
+                )
+            }
+
+        if not day_location_ids:
+            raise HTTPException(status_code=404,
+                                detail="Could not generate any valid itinerary days with the selected locations and routing.")
+
+        hotel_lookup = hotel_service.start_lookup(hotel_service_data)
+
+        new_trip = _save_trip(request, day_location_ids, user_id=user_id,
+                              snapshot=_plan_snapshot(snapshot_days, request.routing_profile))
+        if hotel_lookup is not None:
+            hotel_service.attach_to_trip(hotel_lookup, new_trip['id'])
+        yield {
+            "event": "trip",
+            "id": new_trip['id'],
+            "num_people": new_trip['num_people'],
+            "num_days": new_trip['num_days'],
+            "total_budget": new_trip['total_budget'],
+            "user_id": new_trip.get('user_id')
+        }
+
+    except HTTPException as e:
+        yield {"event": "error", "status_code": e.status_code, "detail": e.detail}
+    except Exception as e:
+        print(f"Unexpected error while streaming plan: {e}", file=sys.stderr)
+        traceback.print_exc(file=sys.stderr)
+        sys.stderr.flush()
+        yield {"event": "error", "status_code": 500, "detail": f"Error during plan generation: {e}"}
+
+
+# --- Incremental trip edits ---
+
+def _normalize_location_row(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Rows from the 'locations' table may carry a "POINT(lon lat)" string instead
+    of the lon/lat columns returned by get_locations_by_tags.
+    """
+    if row.get('lon') is not None and row.get('lat') is not None:
+        return row
+    for column in ('coordinates', 'location', 'geom'):
+        value = row.get(column)
+        if isinstance(value, str) and value.upper().startswith("POINT"):
+            point = parse_point_string(value)
+            return {**row, 'lon': point['longitude'], 'lat': point['latitude']}
+    return None
+
+
+def prewarm_location_catalog() -> int:
+    """
+    Loads the whole locations table into LOCATION_CACHE (startup prewarm), so
+    the first edits and trip reads after a deploy don't wait on the database.
+    Returns the number of rows cached.
+    """
+    rows, page_size = [], 1000
+    while True:
+        # PostgREST caps rows per response, so read the table in pages
+        page = db_client.table('locations').select('*') \
+            .order('id').range(len(rows), len(rows) + page_size - 1).execute().data or []
+        rows.extend(page)
+        if len(page) < page_size:
+            break
+    locations = [loc for loc in map(_normalize_location_row, rows) if loc is not None]
+    LOCATION_CACHE.set_many({loc['id']: loc for loc in locations})
+    return len(locations)
+
+
+def _get_locations_by_ids(location_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Catalog rows by id, from LOCATION_CACHE first; only misses go to the database.
+    """
+    found = LOCATION_CACHE.get_many(location_ids)
+    missing = [loc_id for loc_id in location_ids if loc_id not in found]
+    if missing:
+        try:
+            response = db_client.table('locations').select('*').in_('id', missing).execute()
+        except Exception as e:
+            print(f"Supabase error fetching locations by id: {e}", file=sys.stderr)
+            sys.stderr.flush()
+            raise HTTPException(status_code=500, detail="Error fetching locations from database.")
+        for row in response.data or []:
+            loc = _normalize_location_row(row)
+            if loc is None:
+                print(f"Warning: Location {row.get('name', 'Unknown')} missing coordinates, skipping.")
+                continue
+            found[loc['id']] = loc
+        LOCATION_CACHE.set_many({loc_id: found[loc_id] for loc_id in missing if loc_id in found})
+    return found
+
+
+def _sequence_nearest_next(
+        start_coords: Tuple[float, float],
+        locations: List[Dict[str, Any]],
+        durations: DurationTable
+) -> List[Dict[str, Any]]:
+    """
+    Orders `locations` by always driving to the closest remaining one.
+    Locations with no known route are appended at the end in their given order.
+    """
+    remaining = locations.copy()
+    ordered = []
+    current_coords = start_coords
+    while remaining:
+        travel_times = [durations.get(current_coords, _location_coords(loc)) for loc in remaining]
+        closest_index = min(range(len(travel_times)),
+                            key=lambda i: travel_times[i] if travel_times[i] is not None else float('inf'))
+        if travel_times[closest_index] is None:
+            ordered.extend(remaining)
+            break
+        chosen = remaining.pop(closest_index)
+        ordered.append(chosen)
+        current_coords = _location_coords(chosen)
+    return ordered
+
+
+def edit_trip_day(trip_id: str, day_number: int, edit: TripDayEditRequest, user_id: str) -> TripDayResponse:
+    """
+    Adds, removes or reorders the locations of ONE day of a saved trip.
+
+    Only that day is re-optimized (with cached durations), route geometry is
+    only fetched for legs that are not already cached, and only the
+    'trip_days' rows that actually changed are written.
+
+    There is no transaction across the writes, so they are ordered to make a
+    partial save detectable: the changed rows go in one upsert, and the plan
+    snapshot is replaced last, and only if it is still the one read here
+    (409 otherwise). A snapshot that disagrees with 'trip_days' (an edit that
+    stopped part-way) is rebuilt from 'trip_days' by the next edit.
+    """
+    # 1. Load the trip and make sure it belongs to the user
+    try:
+        trip_response = db_client.table('trips').select('id, user_id, plan_snapshot').eq('id', trip_id).execute()
+        trip_days_response = db_client.table('trip_days').select(
+            'day_number, step_order, location_id'
+        ).eq('trip_id', trip_id).execute()
+    except Exception as e:
+        print(f"Supabase error loading trip {trip_id}: {e}", file=sys.stderr)
+        sys.stderr.flush()
+        raise HTTPException(status_code=500, detail="Error loading trip from database.")
+
+    if not trip_response.data or trip_response.data[0].get('user_id') != user_id:
+        raise HTTPException(status_code=404, detail="Trip not found.")
+    snapshot = trip_response.data[0].get('plan_snapshot')
+    profile = (snapshot or {}).get('routing_profile', ors_service.DEFAULT_PROFILE)
+
+    days: Dict[int, List[str]] = {}
+    for row in sorted(trip_days_response.data or [], key=lambda r: (r['day_number'], r['step_order'])):
+        days.setdefault(row['day_number'], []).append(row['location_id'])
+    if day_number not in days:
+        raise HTTPException(status_code=404, detail=f"Day {day_number} not found in this trip.")
+    old_ids = days[day_number]
+
+    if snapshot and _snapshot_location_ids(snapshot) != days:
+        print(f"--- Plan snapshot of trip {trip_id} disagrees with its trip_days rows "
+              f"(interrupted edit?); rebuilding it ---", file=sys.stderr)
+        sys.stderr.flush()
+        revision = snapshot.get('revision')
+        snapshot = _snapshot_from_days(days, profile)
+        snapshot['revision'] = revision
+
+    # 2. Apply the edit to the list of ids
+    new_ids = [loc_id for loc_id in old_ids if loc_id not in set(edit.remove_location_ids)]
+    for loc_id in edit.add_location_ids:
+        other_day = next((d for d, ids in days.items() if d != day_number and loc_id in ids), None)
+        if other_day is not None:
+            raise HTTPException(status_code=400, detail=f"Location {loc_id} is already planned on day {other_day}.")
+        if loc_id not in new_ids:
+            new_ids.append(loc_id)
+    if edit.order is not None:
+        if sorted(edit.order) != sorted(new_ids):
+            raise HTTPException(status_code=400, detail="'order' must list exactly the day's locations.")
+        new_ids = list(edit.order)
+    if not new_ids:
+        raise HTTPException(status_code=400, detail="A day must keep at least one location.")
+
+    # 3. Resolve coordinates (the day starts where the previous day ended)
+    previous_days = [d for d in days if d < day_number]
+    previous_last_id = days[max(previous_days)][-1] if previous_days else None
+    locations_by_id = _get_locations_by_ids(new_ids + ([previous_last_id] if previous_last_id else []))
+    unknown = [loc_id for loc_id in new_ids if loc_id not in locations_by_id]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Unknown location id(s): {', '.join(unknown)}")
+
+    if previous_last_id and previous_last_id in locations_by_id:
+        start_id = previous_last_id
+        start_coords = _location_coords(locations_by_id[previous_last_id])
+    else:
+        start_id = segment_store.AIRPORT_ID
+        start_coords = settings.STARTING_POINT_COORDS
+    day_locations = [locations_by_id[loc_id] for loc_id in new_ids]
+
+    # 4. Re-optimize this day only, unless the client gave an explicit order
+    if edit.order is None and edit.optimize:
+        durations = _duration_table_for_coords(
+            [start_coords] + [_location_coords(loc) for loc in day_locations], profile
+        )
+        if durations is not None:
+            day_locations = _sequence_nearest_next(start_coords, day_locations, durations)
+            new_ids = [loc['id'] for loc in day_locations]
+
+    # 5. Write only the changed 'trip_days' rows (one upsert), then the snapshot
+    changed_rows = [
+        {"trip_id": trip_id, "day_number": day_number, "step_order": i + 1, "location_id": loc_id}
+        for i, loc_id in enumerate(new_ids) if i >= len(old_ids) or old_ids[i] != loc_id
+    ]
+    snapshot_saved = True
+    try:
+        if changed_rows:
+            db_client.table('trip_days').upsert(
+                changed_rows, on_conflict='trip_id,day_number,step_order'
+            ).execute()
+        if len(old_ids) > len(new_ids):
+            db_client.table('trip_days').delete().eq('trip_id', trip_id).eq(
+                'day_number', day_number).gt('step_order', len(new_ids)).execute()
+        if snapshot:
+            for day in snapshot.get('itinerary', []):
+                if day.get('day_number') == day_number:
+                    day['locations'] = [_to_location_response(loc).model_dump() for loc in day_locations]
+            revision = snapshot.get('revision')
+            snapshot['revision'] = (revision or 0) + 1
+            # Compare-and-set on the revision we read
+            query = db_client.table('trips').update({'plan_snapshot': snapshot}).eq('id', trip_id)
+            if revision is None:
+                query = query.is_('plan_snapshot->>revision', 'null')
+            else:
+                query = query.eq('plan_snapshot->>revision', str(revision))
+            snapshot_saved = bool(query.execute().data)
+    except Exception as e:
+        print(f"---!!! Error saving edit of trip {trip_id} day {day_number}: {e} !!!---", file=sys.stderr)
+        traceback.print_exc(file=sys.stderr)
+        sys.stderr.flush()
+        raise HTTPException(status_code=500, detail="Failed to save the edited day. Check backend log.")
+    if not snapshot_saved:
+        print(f"--- Trip {trip_id} was edited concurrently; day {day_number} snapshot not saved ---",
+              file=sys.stderr)
+        sys.stderr.flush()
+        raise HTTPException(status_code=409,
+                            detail="The trip was changed by another request. Reload it and try again.")
+
+    # 6. Routes: unchanged legs come straight from the route cache or segment store
+    day_legs = []
+    day_leg_ids = []
+    current_coords, current_id = start_coords, start_id
+    for loc in day_locations:
+        day_legs.append((current_coords, _location_coords(loc)))
+        day_leg_ids.append((current_id, loc['id']))
+        current_coords, current_id = _location_coords(loc), loc['id']
+
+    return TripDayResponse(
+        day_number=day_number,
+        locations=[_to_location_response(loc) for loc in day_locations],
+        **_day_route_fields(edit, day_legs, leg_ids=day_leg_ids, profile=profile)
+    )
+
+
+# --- Saved trips (read side) ---
+
+TRIP_SUMMARY_COLUMNS = 'id, num_people, num_days, total_budget, created_at'
+
+
+def _snapshot_location_ids(snapshot: Dict[str, Any]) -> Dict[int, List[str]]:
+    """The snapshot's location ids per (non-empty) day, shaped like the 'trip_days' rows."""
+    return {
+        day['day_number']: [loc['id'] for loc in day['locations']]
+        for day in snapshot.get('itinerary', []) if day.get('locations')
+    }
+
+
+def _snapshot_from_days(days: Dict[int, List[str]],
+                        routing_profile: str = ors_service.DEFAULT_PROFILE) -> Dict[str, Any]:
+    """A snapshot built from 'trip_days' location ids (day_number -> [location_id, ...])."""
+    locations_by_id = _get_locations_by_ids([loc_id for ids in days.values() for loc_id in ids])
+    return _plan_snapshot([
+        (day_number, [_to_location_response(locations_by_id[loc_id]).model_dump()
+                      for loc_id in ids if loc_id in locations_by_id])
+        for day_number, ids in sorted(days.items())
+    ], routing_profile)
+
+
+def _snapshot_from_trip_days(trip_id: str) -> Dict[str, Any]:
+    """Rebuilds the snapshot of a trip saved before plan_snapshot existed."""
+    try:
+        trip_days_response = db_client.table('trip_days').select(
+            'day_number, step_order, location_id'
+        ).eq('trip_id', trip_id).execute()
+    except Exception as e:
+        print(f"Supabase error loading days of trip {trip_id}: {e}", file=sys.stderr)
+        sys.stderr.flush()
+        raise HTTPException(status_code=500, detail="Error loading trip from database.")
+
+    days: Dict[int, List[str]] = {}
+    for row in sorted(trip_days_response.data or [], key=lambda r: (r['day_number'], r['step_order'])):
+        days.setdefault(row['day_number'], []).append(row['location_id'])
+    return _snapshot_from_days(days)
+
+
+def get_trip(trip_id: str, user_id: str, options: TripGeometryOptions) -> TripResponse:
+    """
+    Loads a saved trip of `user_id` from its plan snapshot.
+    Route geometry (if requested inline) comes from the segment store; only
+    legs it has never seen go to ORS.
+    """
+    try:
+        trip_response = db_client.table('trips').select(
+            f'{TRIP_SUMMARY_COLUMNS}, user_id, plan_snapshot, hotel_suggestions'
+        ).eq('id', trip_id).eq('user_id', user_id).execute()
+    except Exception as e:
+        print(f"Supabase error loading trip {trip_id}: {e}", file=sys.stderr)
+        sys.stderr.flush()
+        raise HTTPException(status_code=500, detail="Error loading trip from database.")
+
+    if not trip_response.data:
+        raise HTTPException(status_code=404, detail="Trip not found.")
+    trip = trip_response.data[0]
+    snapshot = trip.get('plan_snapshot') or _snapshot_from_trip_days(trip_id)
+    profile = snapshot.get('routing_profile', ors_service.DEFAULT_PROFILE)
+
+    itinerary = []
+    current_coords, current_id = settings.STARTING_POINT_COORDS, segment_store.AIRPORT_ID
+    for day in snapshot.get('itinerary', []):
+        locations = [LocationResponse(**loc) for loc in day['locations']]
+        if not locations:
+            continue
+        day_legs, day_leg_ids = [], []
+        for loc in locations:
+            coords = (float(loc.coordinates['longitude']), float(loc.coordinates['latitude']))
+            day_legs.append((current_coords, coords))
+            day_leg_ids.append((current_id, loc.id))
+            current_coords, current_id = coords, loc.id
+        itinerary.append(TripDayResponse(
+            day_number=day['day_number'],
+            locations=locations,
+            **_day_route_fields(options, day_legs, leg_ids=day_leg_ids, profile=profile)
+        ))
+
+    return TripResponse(
+        id=trip['id'],
+        num_people=trip['num_people'],
+        num_days=trip['num_days'],
+        total_budget=trip['total_budget'],
+        itinerary=itinerary,
+        user_id=trip.get('user_id'),
+        routing_profile=profile,
+        hotel_suggestions=trip.get('hotel_suggestions')
+    )
+
+
+def encode_trip_cursor(created_at: str, trip_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([created_at, trip_id]).encode()).decode().rstrip("=")
+
+
+def decode_trip_cursor(cursor: str) -> Tuple[str, str]:
+    """
+    Raises ValueError if the cursor is malformed. Both values go into a PostgREST
+    filter, so created_at must be an ISO-8601 timestamp and trip_id a UUID.
+    """
+    try:
+        created_at, trip_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("Malformed cursor.")
+    if not isinstance(created_at, str) or not isinstance(trip_id, str):
+        raise ValueError("Malformed cursor.")
+    try:
+        datetime.fromisoformat(created_at)
+        trip_id = str(uuid.UUID(trip_id))
+    except ValueError:
+        raise ValueError("Malformed cursor.")
+    return created_at, trip_id
+
+
+def list_trips(user_id: str, limit: int, cursor: Optional[str] = None) -> TripListResponse:
+    """
+    The user's trips, newest first, `limit` per page.
+    Keyset pagination on (created_at, id): a page is one indexed range scan,
+    however deep into the history it is. Raises ValueError for a bad cursor.
+    """
+    query = db_client.table('trips').select(TRIP_SUMMARY_COLUMNS).eq('user_id', user_id)
+    if cursor:
+        created_at, trip_id = decode_trip_cursor(cursor)
+        query = query.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt."{trip_id}")')
+    try:
+        response = query.order('created_at', desc=True).order('id', desc=True).limit(limit + 1).execute()
+    except Exception as e:
+        print(f"Supabase error listing trips for {user_id}: {e}", file=sys.stderr)
+        sys.stderr.flush()
+        raise HTTPException(status_code=500, detail="Error loading trips from database.")
 
-    )
\ No newline at end of file
+    rows = response.data or []
+    page = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit and page[-1].get('created_at'):
+        next_cursor = encode_trip_cursor(page[-1]['created_at'], page[-1]['id'])
+    return TripListResponse(trips=[TripSummary(**row) for row in page], next_cursor=next_cursor)
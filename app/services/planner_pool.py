@@ -0,0 +1,252 @@
+# File: app/services/planner_pool.py
+
+"""
+Executor boundary for the CPU-bound planning stages.
+
+With PLANNER_EXECUTOR=inline (the default) every stage runs in the calling
+thread, as before. With PLANNER_EXECUTOR=process, heavy stages go to a pool
+of PLANNER_PROCESSES worker processes, so a large plan uses other cores and
+does not hold the GIL for the requests running next to it. A stage only
+leaves the process when its work is above its threshold
+(PLANNER_OFFLOAD_MIN_STEPS / PLANNER_OFFLOAD_MIN_POINTS); light requests
+never pay for the hop.
+
+Duration matrices are not pickled. A DurationTable is copied once into a
+shared-memory block (`SharedMatrix`), and tasks carry only its name. Each
+worker attaches to a block once and keeps it mapped for the later plans on
+the same candidate list. The block is unlinked when the table is garbage
+collected, e.g. when its candidate list is evicted or rebuilt.
+
+Tasks must be top-level functions of modules that are cheap to import
+(this one, geometry_service). If the pool fails, the stage runs inline.
+"""
+
+import array
+import math
+import multiprocessing
+import os
+import sys
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Any, Callable, Iterable, List, Optional, Sequence
+
+from app.core.config import settings
+
+# Shared matrices a worker keeps mapped (one per live candidate list, roughly)
+WORKER_ATTACHED_MATRICES = 64
+FLOAT_SIZE = 8
+
+
+class SharedMatrix:
+    """An n x n duration matrix in shared memory: float64, row-major, NaN for unreachable."""
+
+    def __init__(self, durations: Sequence[Sequence[Optional[float]]]):
+        self.n = len(durations)
+        self._shm = shared_memory.SharedMemory(create=True, size=max(self.n * self.n * FLOAT_SIZE, FLOAT_SIZE))
+        self.name = self._shm.name
+        cells = self._shm.buf.cast('d')
+        nan = math.nan
+        for i, row in enumerate(durations):
+            cells[i * self.n:(i + 1) * self.n] = _float_row(row, nan)
+        cells.release()
+        self._finalizer = weakref.finalize(self, _release, self._shm)
+
+    def ref(self) -> tuple:
+        """What a task carries instead of the matrix."""
+        return (self.name, self.n)
+
+    def close(self) -> None:
+        self._finalizer()
+
+
+def _float_row(row: Sequence[Optional[float]], nan: float) -> array.array:
+    return array.array('d', (nan if value is None else value for value in row))
+
+
+def _release(shm: shared_memory.SharedMemory) -> None:
+    shm.close()
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+class _SharedRows:
+    """Row access to an attached SharedMatrix, shaped like the list-of-lists matrix (matrix[row][col])."""
+    __slots__ = ("cells", "n")
+
+    def __init__(self, cells: memoryview, n: int):
+        self.cells = cells
+        self.n = n
+
+    def __getitem__(self, row: int) -> memoryview:
+        return self.cells[row * self.n:(row + 1) * self.n]
+
+
+# Worker side: attached blocks by name, least recently used first
+_attached: "OrderedDict[str, tuple]" = OrderedDict()
+
+
+def _attach(ref: tuple) -> _SharedRows:
+    name, n = ref
+    entry = _attached.get(name)
+    if entry is None:
+        shm = shared_memory.SharedMemory(name=name)
+        entry = (shm, _SharedRows(shm.buf.cast('d'), n))
+        _attached[name] = entry
+        while len(_attached) > WORKER_ATTACHED_MATRICES:
+            old_shm, old_rows = _attached.popitem(last=False)[1]
+            old_rows.cells.release()
+            old_shm.close()
+    else:
+        _attached.move_to_end(name)
+    return entry[1]
+
+
+# --- Stages ---
+
+def select_days(matrix, rows: Sequence[int], visit_seconds: Sequence[float], start_row: int,
+                num_days: int, day_seconds: float) -> List[List[int]]:
+    """
+    The day loop's choice of locations (step 6). From `start_row`, always move
+    to the closest remaining candidate whose drive plus visit still fits in
+    the day's `day_seconds`; the day ends when none does. A day's first stop
+    is taken even if it alone overruns, so far-away candidates are not
+    skipped for good. The next day starts where the last one ended.
+
+    `rows` and `visit_seconds` describe the candidates in priority order
+    (ties keep that order). Returns each day's chosen candidate positions;
+    stops early when nothing reachable is left. `matrix` is a list-of-lists
+    matrix or a SharedMatrix ref.
+    """
+    if isinstance(matrix, tuple):
+        matrix = _attach(matrix)
+    remaining = (1 << len(rows)) - 1
+    current_row = start_row
+    days = []
+    for _ in range(num_days):
+        day = []
+        left = day_seconds
+        while remaining:
+            travel_times = matrix[current_row]
+            closest_index = -1
+            closest_time = float('inf')
+            bits = remaining
+            while bits:
+                lowest = bits & -bits
+                i = lowest.bit_length() - 1
+                travel_time = travel_times[rows[i]]
+                # NaN (unreachable, in shared matrices) never compares smaller
+                if travel_time is not None and travel_time < closest_time \
+                        and (not day or travel_time + visit_seconds[i] <= left):
+                    closest_index, closest_time = i, travel_time
+                bits ^= lowest
+            if closest_index < 0:
+                break
+            remaining &= ~(1 << closest_index)
+            day.append(closest_index)
+            left -= closest_time + visit_seconds[closest_index]
+            current_row = rows[closest_index]
+        if not day:
+            break
+        days.append(day)
+        if not remaining:
+            break
+    return days
+
+
+# --- Pool ---
+
+_pool: Optional[Executor] = None
+_pool_lock = threading.Lock()
+
+
+def _worker_init() -> None:
+    # Import the stage modules up front, not on a request's first task
+    from app.services import geometry_service  # noqa: F401
+
+
+def enabled() -> bool:
+    return settings.PLANNER_EXECUTOR == "process"
+
+
+def _get_pool() -> Executor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                workers = settings.PLANNER_PROCESSES or os.cpu_count() or 1
+                # spawn: forking a server with live threads and sockets is not safe
+                _pool = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_worker_init
+                )
+                print(f"--- Planner process pool started with {workers} workers ---")
+    return _pool
+
+
+def _discard_pool(pool: Executor) -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def start() -> Optional[int]:
+    """Starts the pool and its workers ahead of the first plan (startup prewarm)."""
+    if not enabled():
+        return None
+    pool = _get_pool()
+    workers = settings.PLANNER_PROCESSES or os.cpu_count() or 1
+    for future in [pool.submit(os.getpid) for _ in range(workers)]:
+        future.result()
+    return workers
+
+
+def run(func: Callable[..., Any], *args, offload: bool = True, inline_args: Optional[tuple] = None) -> Any:
+    """
+    Runs `func(*args)` in the pool when enabled and `offload` (the caller's
+    size check), else inline. `inline_args` replaces `args` for the inline
+    call, e.g. the in-process matrix instead of its shared-memory ref.
+    Falls back to inline if the pool is broken or a block is already gone.
+    """
+    if enabled() and offload:
+        pool = _get_pool()
+        try:
+            return pool.submit(func, *args).result()
+        except BrokenProcessPool as e:
+            print(f"Planner process pool failed ({e}); running {func.__name__} inline", file=sys.stderr)
+            sys.stderr.flush()
+            _discard_pool(pool)
+        except FileNotFoundError as e:
+            print(f"Shared matrix missing ({e}); running {func.__name__} inline", file=sys.stderr)
+            sys.stderr.flush()
+    return func(*(inline_args if inline_args is not None else args))
+
+
+def run_many(func: Callable[..., Any], items: Iterable[tuple], offload: bool = True) -> List[Any]:
+    """Like run(), for many independent calls of `func` (spread over the workers)."""
+    items = list(items)
+    if enabled() and offload and len(items) > 1:
+        pool = _get_pool()
+        try:
+            return [future.result() for future in [pool.submit(func, *args) for args in items]]
+        except BrokenProcessPool as e:
+            print(f"Planner process pool failed ({e}); running {func.__name__} inline", file=sys.stderr)
+            sys.stderr.flush()
+            _discard_pool(pool)
+    return [func(*args) for args in items]
+
+
+def close() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,436 @@
+# File: app/services/routing_engine.py
+
+"""
+Offline road-network routing (ROUTING_BACKEND=local).
+
+Loads a Sri Lanka road graph from a local JSON file (optionally .gz) and
+answers the same questions we otherwise send to ORS:
+  - one-to-many / many-to-many duration matrices
+  - point-to-point routes with a GeoJSON LineString geometry
+
+Queries use contraction hierarchies (CH). Contracting a country-sized graph
+takes a while in Python, so do it once ahead of time:
+
+    python -m app.services.routing_engine build raw_graph.json graph_ch.json.gz
+
+Graph file format:
+    {
+      "nodes": [[lon, lat], ...],
+      "edges": [[from, to, duration_s, distance_m, oneway], ...],   # oneway is optional (default false)
+      "ch": {"rank": [...], "shortcuts": [[from, to, duration_s, distance_m, via_node], ...]}   # optional
+    }
+If "ch" is missing, the hierarchy is built when the file is loaded.
+"""
+
+import gzip
+import heapq
+import json
+import math
+import sys
+import threading
+from typing import List, Tuple, Dict, Any, Optional
+
+from app.core.config import settings
+
+INF = float("inf")
+
+# Grid cell size (degrees) for snapping coordinates to the nearest graph node
+SNAP_CELL_DEG = 0.01
+SNAP_MAX_RINGS = 50
+
+# Witness searches stop after this many settled nodes; a missed witness only
+# adds an unnecessary shortcut, never a wrong answer
+WITNESS_SETTLE_LIMIT = 60
+
+
+def _read_graph_file(path: str) -> Dict[str, Any]:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_graph_file(path: str, data: Dict[str, Any]) -> None:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "wt", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+
+
+def _add_edge(adj: List[Dict[int, Tuple[float, float, int]]], u: int, v: int,
+              duration: float, distance: float, via: int) -> bool:
+    """Keeps only the fastest edge between two nodes. Returns True if it was added/improved."""
+    current = adj[u].get(v)
+    if current is None or duration < current[0]:
+        adj[u][v] = (duration, distance, via)
+        return True
+    return False
+
+
+class RoadGraph:
+    """
+    A road graph with its contraction hierarchy.
+
+    `up_forward[u]`  : edges u -> v with rank[v] > rank[u]  (searched from the source)
+    `up_backward[v]` : edges u -> v with rank[u] > rank[v], stored at v (searched from the target)
+    `edge_via[(u, v)]` is the contracted node a shortcut skips, or -1 for a real road.
+    """
+
+    def __init__(self, nodes: List[List[float]], edges: List[List[Any]], ch: Optional[Dict[str, Any]] = None):
+        self.nodes = [(float(lon), float(lat)) for lon, lat in nodes]
+        n = len(self.nodes)
+
+        out_adj: List[Dict[int, Tuple[float, float, int]]] = [dict() for _ in range(n)]
+        in_adj: List[Dict[int, Tuple[float, float, int]]] = [dict() for _ in range(n)]
+        for edge in edges:
+            u, v, duration, distance = int(edge[0]), int(edge[1]), float(edge[2]), float(edge[3])
+            oneway = bool(edge[4]) if len(edge) > 4 else False
+            if u == v:
+                continue
+            _add_edge(out_adj, u, v, duration, distance, -1)
+            _add_edge(in_adj, v, u, duration, distance, -1)
+            if not oneway:
+                _add_edge(out_adj, v, u, duration, distance, -1)
+                _add_edge(in_adj, u, v, duration, distance, -1)
+
+        if ch is None:
+            self.rank, self.shortcuts = self._contract(out_adj, in_adj)
+        else:
+            self.rank = [int(r) for r in ch["rank"]]
+            self.shortcuts = [(int(s[0]), int(s[1]), float(s[2]), float(s[3]), int(s[4])) for s in ch["shortcuts"]]
+            for u, w, duration, distance, via in self.shortcuts:
+                _add_edge(out_adj, u, w, duration, distance, via)
+
+        self.up_forward: List[List[Tuple[int, float]]] = [[] for _ in range(n)]
+        self.up_backward: List[List[Tuple[int, float]]] = [[] for _ in range(n)]
+        self.edge_data: Dict[Tuple[int, int], Tuple[float, float, int]] = {}
+        for u in range(n):
+            for v, (duration, distance, via) in out_adj[u].items():
+                self.edge_data[(u, v)] = (duration, distance, via)
+                if self.rank[v] > self.rank[u]:
+                    self.up_forward[u].append((v, duration))
+                else:
+                    self.up_backward[v].append((u, duration))
+
+        # Snapping index: only nodes that are actually connected
+        self._grid: Dict[Tuple[int, int], List[int]] = {}
+        for i, (lon, lat) in enumerate(self.nodes):
+            if self.up_forward[i] or self.up_backward[i] or out_adj[i]:
+                self._grid.setdefault(self._cell(lon, lat), []).append(i)
+
+        self._backward_cache: Dict[int, Dict[int, float]] = {}
+        self._backward_cache_lock = threading.Lock()
+
+    # --- Preprocessing ---
+
+    @staticmethod
+    def _contract(out_adj, in_adj) -> Tuple[List[int], List[Tuple[int, int, float, float, int]]]:
+        """
+        Contracts nodes one by one (lazy edge-difference ordering), adding
+        shortcuts where no witness path exists. Mutates out_adj/in_adj.
+        """
+        n = len(out_adj)
+        contracted = [False] * n
+        deleted_neighbours = [0] * n
+        rank = [0] * n
+        shortcuts: List[Tuple[int, int, float, float, int]] = []
+
+        def witness_distances(source: int, skip: int, max_cost: float) -> Dict[int, float]:
+            dist = {source: 0.0}
+            heap = [(0.0, source)]
+            settled = 0
+            while heap and settled < WITNESS_SETTLE_LIMIT:
+                d, x = heapq.heappop(heap)
+                if d > dist.get(x, INF):
+                    continue
+                if d > max_cost:
+                    break
+                settled += 1
+                for y, (duration, _, _) in out_adj[x].items():
+                    if y == skip or contracted[y]:
+                        continue
+                    nd = d + duration
+                    if nd < dist.get(y, INF):
+                        dist[y] = nd
+                        heapq.heappush(heap, (nd, y))
+            return dist
+
+        def needed_shortcuts(v: int) -> List[Tuple[int, int, float, float, int]]:
+            result = []
+            outgoing = [(w, data) for w, data in out_adj[v].items() if not contracted[w]]
+            if not outgoing:
+                return result
+            for u, (in_duration, in_distance, _) in in_adj[v].items():
+                if contracted[u]:
+                    continue
+                targets = [(w, data) for w, data in outgoing if w != u]
+                if not targets:
+                    continue
+                max_cost = in_duration + max(data[0] for _, data in targets)
+                dist = witness_distances(u, v, max_cost)
+                for w, (out_duration, out_distance, _) in targets:
+                    via_cost = in_duration + out_duration
+                    if dist.get(w, INF) > via_cost:
+                        result.append((u, w, via_cost, in_distance + out_distance, v))
+            return result
+
+        def priority(v: int) -> int:
+            degree = sum(1 for u in in_adj[v] if not contracted[u]) + \
+                     sum(1 for w in out_adj[v] if not contracted[w])
+            return len(needed_shortcuts(v)) - degree + deleted_neighbours[v]
+
+        heap = [(priority(v), v) for v in range(n)]
+        heapq.heapify(heap)
+        order = 0
+        while heap:
+            _, v = heapq.heappop(heap)
+            if contracted[v]:
+                continue
+            # Lazy update: re-check the priority before contracting
+            current = priority(v)
+            if heap and current > heap[0][0]:
+                heapq.heappush(heap, (current, v))
+                continue
+
+            for u, w, duration, distance, via in needed_shortcuts(v):
+                if _add_edge(out_adj, u, w, duration, distance, via):
+                    _add_edge(in_adj, w, u, duration, distance, via)
+                    shortcuts.append((u, w, duration, distance, via))
+
+            contracted[v] = True
+            rank[v] = order
+            order += 1
+            for neighbour in set(in_adj[v]) | set(out_adj[v]):
+                if not contracted[neighbour]:
+                    deleted_neighbours[neighbour] += 1
+
+        # A shortcut may have been replaced by a faster one later; keep only live ones
+        live = [s for s in shortcuts if out_adj[s[0]].get(s[1], (None, None, None))[2] == s[4]
+                and out_adj[s[0]][s[1]][0] == s[2]]
+        return rank, live
+
+    def to_dict(self, edges: List[List[Any]]) -> Dict[str, Any]:
+        return {
+            "nodes": [list(node) for node in self.nodes],
+            "edges": edges,
+            "ch": {"rank": self.rank, "shortcuts": [list(s) for s in self.shortcuts]}
+        }
+
+    # --- Snapping ---
+
+    @staticmethod
+    def _cell(lon: float, lat: float) -> Tuple[int, int]:
+        return (int(math.floor(lon / SNAP_CELL_DEG)), int(math.floor(lat / SNAP_CELL_DEG)))
+
+    def nearest_node(self, coords: Tuple[float, float]) -> Optional[int]:
+        lon, lat = float(coords[0]), float(coords[1])
+        cx, cy = self._cell(lon, lat)
+        x_scale = math.cos(math.radians(lat))
+        best, best_d = None, INF
+        for ring in range(SNAP_MAX_RINGS + 1):
+            for gx in range(cx - ring, cx + ring + 1):
+                for gy in range(cy - ring, cy + ring + 1):
+                    if max(abs(gx - cx), abs(gy - cy)) != ring:
+                        continue
+                    for i in self._grid.get((gx, gy), ()):
+                        nlon, nlat = self.nodes[i]
+                        d = ((nlon - lon) * x_scale) ** 2 + (nlat - lat) ** 2
+                        if d < best_d:
+                            best, best_d = i, d
+            # Anything in a further ring is at least `ring` cells away
+            if best is not None and math.sqrt(best_d) <= ring * SNAP_CELL_DEG * x_scale:
+                break
+        return best
+
+    # --- Queries ---
+
+    def _upward_search(self, source: int, adjacency: List[List[Tuple[int, float]]]) -> Tuple[Dict[int, float], Dict[int, int]]:
+        dist = {source: 0.0}
+        parent: Dict[int, int] = {}
+        heap = [(0.0, source)]
+        while heap:
+            d, x = heapq.heappop(heap)
+            if d > dist[x]:
+                continue
+            for y, duration in adjacency[x]:
+                nd = d + duration
+                if nd < dist.get(y, INF):
+                    dist[y] = nd
+                    parent[y] = x
+                    heapq.heappush(heap, (nd, y))
+        return dist, parent
+
+    def _backward_space(self, target: int) -> Dict[int, float]:
+        # Catalog locations are queried over and over, so their backward
+        # search spaces are worth keeping
+        cached = self._backward_cache.get(target)
+        if cached is None:
+            cached, _ = self._upward_search(target, self.up_backward)
+            with self._backward_cache_lock:
+                if len(self._backward_cache) >= settings.ROUTING_BACKWARD_CACHE_SIZE:
+                    self._backward_cache.pop(next(iter(self._backward_cache)))
+                self._backward_cache[target] = cached
+        return cached
+
+    def duration_matrix(self, sources: List[int], targets: List[int]) -> List[List[Optional[float]]]:
+        """
+        Many-to-many durations (seconds) with bucket-based CH: one backward
+        search per target, one forward search per source.
+        """
+        buckets: Dict[int, List[Tuple[int, float]]] = {}
+        for j, target in enumerate(targets):
+            for x, d in self._backward_space(target).items():
+                buckets.setdefault(x, []).append((j, d))
+
+        matrix: List[List[Optional[float]]] = []
+        for source in sources:
+            row = [INF] * len(targets)
+            forward, _ = self._upward_search(source, self.up_forward)
+            for x, df in forward.items():
+                for j, db in buckets.get(x, ()):
+                    if df + db < row[j]:
+                        row[j] = df + db
+            matrix.append([None if d == INF else round(d, 2) for d in row])
+        return matrix
+
+    def _unpack(self, u: int, v: int, out: List[int]) -> None:
+        """Appends the real road nodes from u (exclusive) to v (inclusive)."""
+        stack = [(u, v)]
+        while stack:
+            a, b = stack.pop()
+            via = self.edge_data[(a, b)][2]
+            if via < 0:
+                out.append(b)
+            else:
+                # Process (a, via) first, so push it last
+                stack.append((via, b))
+                stack.append((a, via))
+
+    def shortest_path(self, source: int, target: int) -> Optional[Tuple[float, float, List[int]]]:
+        """Returns (duration_s, distance_m, node path) or None if unreachable."""
+        if source == target:
+            return 0.0, 0.0, [source]
+
+        forward, forward_parent = self._upward_search(source, self.up_forward)
+        backward, backward_parent = self._upward_search(target, self.up_backward)
+
+        meet, best = None, INF
+        for x, df in forward.items():
+            db = backward.get(x)
+            if db is not None and df + db < best:
+                meet, best = x, df + db
+        if meet is None:
+            return None
+
+        # Up-path source -> meet, then down-path meet -> target
+        up_chain = [meet]
+        while up_chain[-1] != source:
+            up_chain.append(forward_parent[up_chain[-1]])
+        up_chain.reverse()
+        down_chain = [meet]
+        while down_chain[-1] != target:
+            down_chain.append(backward_parent[down_chain[-1]])
+
+        path = [source]
+        for a, b in zip(up_chain, up_chain[1:]):
+            self._unpack(a, b, path)
+        for a, b in zip(down_chain, down_chain[1:]):
+            self._unpack(a, b, path)
+
+        distance = sum(self.edge_data[(a, b)][1] for a, b in zip(path, path[1:]))
+        return best, distance, path
+
+
+class RoutingEngine:
+    """
+    ORS-shaped facade over a RoadGraph: takes and returns (longitude, latitude) coordinates.
+    """
+
+    def __init__(self, graph: RoadGraph):
+        self.graph = graph
+
+    @classmethod
+    def load(cls, path: str) -> "RoutingEngine":
+        data = _read_graph_file(path)
+        return cls(RoadGraph(data["nodes"], data["edges"], data.get("ch")))
+
+    def get_distance_matrix(self, locations: List[Tuple[float, float]],
+                            sources: Optional[List[int]] = None,
+                            destinations: Optional[List[int]] = None) -> Dict[str, Any]:
+        """
+        Same response shape as the ORS matrix endpoint: {"durations": [[...]]}.
+        Unreachable pairs are None (ORS returns null).
+        """
+        snapped = [self.graph.nearest_node(coords) for coords in locations]
+        source_indexes = sources if sources is not None else list(range(len(locations)))
+        destination_indexes = destinations if destinations is not None else list(range(len(locations)))
+
+        source_nodes = [snapped[i] for i in source_indexes]
+        destination_nodes = [snapped[j] for j in destination_indexes]
+        known_sources = [node for node in source_nodes if node is not None]
+        known_destinations = [node for node in destination_nodes if node is not None]
+        matrix = self.graph.duration_matrix(known_sources, known_destinations)
+
+        # Put the rows/columns for points that couldn't be snapped back in as None
+        source_rows = iter(matrix)
+        durations = []
+        for node in source_nodes:
+            if node is None:
+                durations.append([None] * len(destination_nodes))
+                continue
+            values = iter(next(source_rows))
+            durations.append([None if dest is None else next(values) for dest in destination_nodes])
+        return {"durations": durations}
+
+    def get_route(self, start_coords: Tuple[float, float], end_coords: Tuple[float, float]) -> Optional[Dict[str, Any]]:
+        """
+        Returns {"geometry": GeoJSON LineString, "duration": s, "distance": m} or None.
+        """
+        source = self.graph.nearest_node(start_coords)
+        target = self.graph.nearest_node(end_coords)
+        if source is None or target is None:
+            return None
+        result = self.graph.shortest_path(source, target)
+        if result is None:
+            return None
+        duration, distance, path = result
+        coordinates = [list(self.graph.nodes[i]) for i in path]
+        if len(coordinates) == 1:
+            coordinates.append(coordinates[0])
+        return {
+            "geometry": {"type": "LineString", "coordinates": coordinates},
+            "duration": round(duration, 2),
+            "distance": round(distance, 2)
+        }
+
+
+_ENGINE: Optional[RoutingEngine] = None
+_ENGINE_LOCK = threading.Lock()
+
+
+def get_engine() -> RoutingEngine:
+    """
+    Loads the graph from settings.ROAD_GRAPH_PATH on first use (once per process).
+    """
+    global _ENGINE
+    if _ENGINE is None:
+        with _ENGINE_LOCK:
+            if _ENGINE is None:
+                print(f"--- Loading road graph from {settings.ROAD_GRAPH_PATH} ---")
+                _ENGINE = RoutingEngine.load(settings.ROAD_GRAPH_PATH)
+                print(f"--- Road graph loaded: {len(_ENGINE.graph.nodes)} nodes, "
+                      f"{len(_ENGINE.graph.shortcuts)} shortcuts ---")
+    return _ENGINE
+
+
+def build_graph_file(input_path: str, output_path: str) -> None:
+    """Contracts a raw graph file and writes it back out with its "ch" section."""
+    data = _read_graph_file(input_path)
+    graph = RoadGraph(data["nodes"], data["edges"])
+    _write_graph_file(output_path, graph.to_dict(data["edges"]))
+    print(f"Wrote {output_path}: {len(graph.nodes)} nodes, {len(graph.shortcuts)} shortcuts")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "build":
+        print("Usage: python -m app.services.routing_engine build <raw_graph.json> <output.json[.gz]>")
+        sys.exit(1)
+    build_graph_file(sys.argv[2], sys.argv[3])
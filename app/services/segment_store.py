@@ -0,0 +1,167 @@
+# File: app/services/segment_store.py
+
+"""
+Persisted route segments, so saved trips and repeated plans do not need ORS.
+
+A segment is the route between two catalog locations for one routing profile,
+keyed by (from_location_id, to_location_id, profile). The first leg of a trip
+starts at the airport, whose id is AIRPORT_ID. Each segment holds its
+duration, distance and the endpoint coordinates it was routed for. Geometries
+are stored once per distinct polyline (content-addressed by SHA-256), however
+many segments or trips use them.
+
+The store is a local SQLite database in WAL mode (ROUTE_SEGMENT_STORE_PATH;
+empty disables it). Errors are logged and treated as misses, so a broken
+store only costs ORS calls, never a plan.
+"""
+
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services import geometry_service
+
+AIRPORT_ID = "airport"
+# Lossless for the 6-decimal coordinates we serve
+STORE_PRECISION = 6
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS segment_geometries (
+    hash TEXT PRIMARY KEY,
+    polyline TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS route_segments (
+    from_id TEXT NOT NULL,
+    to_id TEXT NOT NULL,
+    profile TEXT NOT NULL,
+    from_coords TEXT NOT NULL,
+    to_coords TEXT NOT NULL,
+    geometry_hash TEXT NOT NULL REFERENCES segment_geometries(hash),
+    duration REAL,
+    distance REAL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (from_id, to_id, profile)
+);
+"""
+
+SegmentKey = Tuple[str, str]
+Coords = Tuple[float, float]
+
+_local = threading.local()
+
+
+def _coords_text(coords: Coords) -> str:
+    return f"{coords[0]:.6f},{coords[1]:.6f}"
+
+
+def _connection() -> Optional[sqlite3.Connection]:
+    """One connection per thread (sqlite3 connections must stay on their thread)."""
+    if not settings.ROUTE_SEGMENT_STORE_PATH:
+        return None
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        directory = os.path.dirname(settings.ROUTE_SEGMENT_STORE_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(settings.ROUTE_SEGMENT_STORE_PATH, timeout=5.0)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def get_segments(
+        pairs: List[Tuple[SegmentKey, Coords, Coords]],
+        profile: str
+) -> Dict[SegmentKey, Dict[str, Any]]:
+    """
+    Looks up several segments in one query. `pairs` holds
+    ((from_id, to_id), from_coords, to_coords) entries.
+    Returns {(from_id, to_id): {"geometry", "duration", "distance"}} for the hits.
+    A stored segment whose endpoint coordinates differ from the given ones
+    (the location moved in the catalog) counts as a miss.
+    """
+    if not pairs:
+        return {}
+    try:
+        conn = _connection()
+        if conn is None:
+            return {}
+        wanted = {key: (_coords_text(start), _coords_text(end)) for key, start, end in pairs}
+        placeholders = ",".join("(?, ?)" for _ in wanted)
+        params = [value for key in wanted for value in key]
+        rows = conn.execute(
+            f"""
+            SELECT s.from_id, s.to_id, s.from_coords, s.to_coords, s.duration, s.distance, g.polyline
+            FROM route_segments s JOIN segment_geometries g ON g.hash = s.geometry_hash
+            WHERE s.profile = ? AND (s.from_id, s.to_id) IN (VALUES {placeholders})
+            """,
+            [profile] + params
+        ).fetchall()
+    except sqlite3.Error as e:
+        print(f"Route segment store read failed: {e}", file=sys.stderr)
+        sys.stderr.flush()
+        return {}
+
+    found = {}
+    for from_id, to_id, from_coords, to_coords, duration, distance, polyline in rows:
+        if wanted.get((from_id, to_id)) != (from_coords, to_coords):
+            continue
+        found[(from_id, to_id)] = {
+            "geometry": {
+                "type": "LineString",
+                "coordinates": geometry_service.decode_polyline(polyline, STORE_PRECISION)
+            },
+            "duration": duration,
+            "distance": distance
+        }
+    return found
+
+
+def put_segment(
+        key: SegmentKey,
+        start_coords: Coords,
+        end_coords: Coords,
+        profile: str,
+        segment: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    Stores (or replaces) one segment; its geometry is only written if new.
+    Returns the segment exactly as get_segments will read it back (coordinates
+    rounded to the store precision), so first and later loads serve the same bytes.
+    """
+    if not settings.ROUTE_SEGMENT_STORE_PATH:
+        return segment
+    polyline = geometry_service.encode_polyline(segment["geometry"].get("coordinates") or [], STORE_PRECISION)
+    stored = {
+        "geometry": {"type": "LineString", "coordinates": geometry_service.decode_polyline(polyline, STORE_PRECISION)},
+        "duration": segment.get("duration"),
+        "distance": segment.get("distance")
+    }
+    try:
+        conn = _connection()
+        geometry_hash = hashlib.sha256(polyline.encode("ascii")).hexdigest()
+        with conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO segment_geometries (hash, polyline) VALUES (?, ?)",
+                (geometry_hash, polyline)
+            )
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO route_segments
+                    (from_id, to_id, profile, from_coords, to_coords, geometry_hash, duration, distance, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (key[0], key[1], profile, _coords_text(start_coords), _coords_text(end_coords),
+                 geometry_hash, segment.get("duration"), segment.get("distance"), time.time())
+            )
+    except sqlite3.Error as e:
+        print(f"Route segment store write failed: {e}", file=sys.stderr)
+        sys.stderr.flush()
+    return stored
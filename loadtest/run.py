@@ -0,0 +1,379 @@
+# File: loadtest/run.py
+
+"""
+Load generator for the API.
+
+Starts the stub services (loadtest/stubs.py) and the real app under uvicorn,
+pointed at the stubs, then drives it with a configurable request mix and
+concurrency and prints latency percentiles and throughput per endpoint.
+
+Examples:
+    python -m loadtest.run --concurrency 50 --duration 60
+    python -m loadtest.run --workers 4 --mix generate=1,me=5,reserve=1 --latency-ors-ms 80
+    python -m loadtest.run --base-url http://staging:8000 --no-spawn   # existing deployment, see --jwks-out
+
+Every request carries a pre-signed RS256 JWT for one of --users test users;
+the stub Clerk issuer serves the matching JWKS.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from typing import Dict, List, Tuple, Any, Optional
+
+import httpx
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+
+from loadtest.stubs import INTERESTS
+
+# A syntactically valid (but useless) key, so the Supabase client accepts it
+STUB_SUPABASE_KEY = "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.c3R1Yg"
+
+DEFAULT_MIX = "generate=2,stream=1,me=5,reserve=1"
+
+
+# --- Auth ---
+
+def make_signer() -> Tuple[bytes, Dict[str, Any], str]:
+    """Returns (private key PEM, JWKS document, kid)."""
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    kid = "loadtest-" + uuid.uuid4().hex[:8]
+    public_jwk = jwk.construct(public_pem, "RS256").to_dict()
+    public_jwk = {k: (v.decode() if isinstance(v, bytes) else v) for k, v in public_jwk.items()}
+    public_jwk.update({"kid": kid, "use": "sig"})
+    return private_pem, {"keys": [public_jwk]}, kid
+
+
+def make_tokens(private_pem: bytes, kid: str, issuer: str, num_users: int) -> List[str]:
+    expires = int(time.time()) + 24 * 3600
+    return [
+        jwt.encode(
+            {"sub": f"user_loadtest_{i}", "email": f"loadtest{i}@example.com", "iss": issuer, "exp": expires},
+            private_pem.decode(),
+            algorithm="RS256",
+            headers={"kid": kid}
+        )
+        for i in range(num_users)
+    ]
+
+
+# --- Processes ---
+
+def start_process(args: List[str], env: Dict[str, str], log_path: str) -> subprocess.Popen:
+    log = open(log_path, "ab")
+    return subprocess.Popen(args, env={**os.environ, **env}, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_until_up(url: str, timeout: float = 30.0) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+# --- Request mix ---
+
+def parse_mix(mix: str) -> List[Tuple[str, float]]:
+    weights = []
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise SystemExit(f"Unknown operation '{name}'. Choose from: {', '.join(OPERATIONS)}")
+        weights.append((name, float(weight or 1)))
+    return weights
+
+
+def _plan_body(args: argparse.Namespace) -> Dict[str, Any]:
+    return {
+        "num_people": 2,
+        "num_days": args.num_days,
+        "budget": 1_000_000,
+        "interests": random.sample(INTERESTS, random.randint(1, 2))
+    }
+
+
+async def op_generate(client: httpx.AsyncClient, args, state) -> httpx.Response:
+    response = await client.post("/api/v1/trips/generate-plan", json=_plan_body(args), headers=state["headers"])
+    if response.status_code == 200:
+        state["trip_ids"].append(response.json()["id"])
+    return response
+
+
+async def op_stream(client: httpx.AsyncClient, args, state) -> httpx.Response:
+    # Latency is measured to the LAST byte; time-to-first-event is tracked separately
+    started = time.perf_counter()
+    async with client.stream("POST", "/api/v1/trips/generate-plan/stream", json=_plan_body(args),
+                             headers=state["headers"]) as response:
+        async for _ in response.aiter_lines():
+            if "first_event" not in state["scratch"]:
+                state["scratch"]["first_event"] = time.perf_counter() - started
+    return response
+
+
+async def op_me(client: httpx.AsyncClient, args, state) -> httpx.Response:
+    return await client.get("/api/v1/users/me", headers=state["headers"])
+
+
+async def op_me_update(client: httpx.AsyncClient, args, state) -> httpx.Response:
+    return await client.put("/api/v1/users/me", json={"country": "Sri Lanka"}, headers=state["headers"])
+
+
+async def op_reserve(client: httpx.AsyncClient, args, state) -> httpx.Response:
+    trip_id = random.choice(state["trip_ids"]) if state["trip_ids"] else str(uuid.uuid4())
+    return await client.post("/api/v1/trips/reserve-trip", json={
+        "trip_id": trip_id,
+        "first_name": "Load",
+        "last_name": "Test",
+        "email": "loadtest@example.com",
+        "address": None,
+        "post_code": None,
+        "country": "Sri Lanka",
+        "mobile_phone": None,
+        "passport_number": "N0000000"
+    }, headers=state["headers"])
+
+
+OPERATIONS = {
+    "generate": op_generate,
+    "stream": op_stream,
+    "me": op_me,
+    "me_update": op_me_update,
+    "reserve": op_reserve,
+}
+
+
+# --- Load loop ---
+
+async def run_load(args: argparse.Namespace, tokens: List[str]) -> Dict[str, Any]:
+    mix = parse_mix(args.mix)
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    results: Dict[str, List[Tuple[float, int]]] = {name: [] for name in names}
+    first_events: List[float] = []
+    state = {"trip_ids": []}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        warmup_end = time.perf_counter() + args.warmup
+        stop_at = warmup_end + args.duration
+        remaining = [args.requests] if args.requests else None
+
+        async def worker() -> None:
+            while True:
+                now = time.perf_counter()
+                if remaining is not None:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+                elif now >= stop_at:
+                    return
+
+                name = random.choices(names, weights)[0]
+                request_state = {
+                    **state,
+                    "headers": {"Authorization": f"Bearer {random.choice(tokens)}"},
+                    "scratch": {}
+                }
+                started = time.perf_counter()
+                try:
+                    response = await OPERATIONS[name](client, args, request_state)
+                    status = response.status_code
+                except httpx.HTTPError:
+                    status = 0
+                elapsed = time.perf_counter() - started
+
+                if remaining is not None or started >= warmup_end:
+                    results[name].append((elapsed, status))
+                    if "first_event" in request_state["scratch"]:
+                        first_events.append(request_state["scratch"]["first_event"])
+
+        measure_start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        wall = time.perf_counter() - max(measure_start, warmup_end if remaining is None else measure_start)
+
+    return {"results": results, "first_events": first_events, "wall_seconds": wall}
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    index = max(0, min(len(sorted_values) - 1, int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(run: Dict[str, Any]) -> Dict[str, Any]:
+    wall = run["wall_seconds"]
+    summary = {"wall_seconds": round(wall, 2), "endpoints": {}}
+    all_latencies = []
+    total_ok = 0
+    for name, samples in run["results"].items():
+        latencies = sorted(elapsed for elapsed, _ in samples)
+        all_latencies.extend(latencies)
+        ok = sum(1 for _, status in samples if 200 <= status < 400)
+        total_ok += ok
+        summary["endpoints"][name] = {
+            "requests": len(samples),
+            "errors": len(samples) - ok,
+            "rps": round(len(samples) / wall, 2) if wall else 0.0,
+            "mean_ms": round(1000 * sum(latencies) / len(latencies), 1) if latencies else None,
+            "p50_ms": round(1000 * percentile(latencies, 50), 1),
+            "p95_ms": round(1000 * percentile(latencies, 95), 1),
+            "p99_ms": round(1000 * percentile(latencies, 99), 1),
+            "max_ms": round(1000 * latencies[-1], 1) if latencies else None,
+        }
+    all_latencies.sort()
+    summary["total"] = {
+        "requests": len(all_latencies),
+        "ok": total_ok,
+        "rps": round(len(all_latencies) / wall, 2) if wall else 0.0,
+        "p50_ms": round(1000 * percentile(all_latencies, 50), 1),
+        "p95_ms": round(1000 * percentile(all_latencies, 95), 1),
+        "p99_ms": round(1000 * percentile(all_latencies, 99), 1),
+    }
+    if run["first_events"]:
+        first = sorted(run["first_events"])
+        summary["stream_first_event"] = {
+            "p50_ms": round(1000 * percentile(first, 50), 1),
+            "p95_ms": round(1000 * percentile(first, 95), 1),
+        }
+    return summary
+
+
+def print_report(summary: Dict[str, Any], args: argparse.Namespace) -> None:
+    print()
+    print(f"concurrency={args.concurrency} workers={args.workers} mix={args.mix} "
+          f"wall={summary['wall_seconds']}s")
+    header = f"{'endpoint':<12}{'reqs':>8}{'errs':>7}{'rps':>9}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, row in summary["endpoints"].items():
+        print(f"{name:<12}{row['requests']:>8}{row['errors']:>7}{row['rps']:>9}"
+              f"{row['mean_ms'] or 0:>9}{row['p50_ms']:>9}{row['p95_ms']:>9}{row['p99_ms']:>9}{row['max_ms'] or 0:>9}")
+    total = summary["total"]
+    print("-" * len(header))
+    print(f"{'TOTAL':<12}{total['requests']:>8}{total['requests'] - total['ok']:>7}{total['rps']:>9}"
+          f"{'':>9}{total['p50_ms']:>9}{total['p95_ms']:>9}{total['p99_ms']:>9}")
+    if "stream_first_event" in summary:
+        first = summary["stream_first_event"]
+        print(f"stream time to first event: p50={first['p50_ms']}ms p95={first['p95_ms']}ms")
+    print("(latencies in ms)")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load test the Travel Planner API against local stubs.")
+    parser.add_argument("--concurrency", type=int, default=20, help="Concurrent in-flight requests")
+    parser.add_argument("--duration", type=float, default=30.0, help="Measured seconds (ignored with --requests)")
+    parser.add_argument("--requests", type=int, default=0, help="Stop after this many requests instead")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Unmeasured seconds before the run")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Weighted operations (default: {DEFAULT_MIX})")
+    parser.add_argument("--num-days", type=int, default=5, help="num_days of generated plans")
+    parser.add_argument("--users", type=int, default=50, help="Distinct test users (JWTs)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout (s)")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes for the app")
+    parser.add_argument("--threadpool", type=int, default=0, help="THREADPOOL_SIZE for the app (0 = default)")
+    parser.add_argument("--app-port", type=int, default=8010)
+    parser.add_argument("--stub-port", type=int, default=8011)
+    parser.add_argument("--catalog-size", type=int, default=200)
+    parser.add_argument("--latency-ors-ms", type=float, default=60.0)
+    parser.add_argument("--latency-supabase-ms", type=float, default=15.0)
+    parser.add_argument("--latency-clerk-ms", type=float, default=30.0)
+    parser.add_argument("--latency-hotel-ms", type=float, default=100.0)
+    parser.add_argument("--base-url", default=None, help="Target an already running app instead of spawning one")
+    parser.add_argument("--no-spawn", action="store_true", help="Don't start stubs/app (use with --base-url)")
+    parser.add_argument("--issuer", default=None, help="JWT issuer (defaults to the stub Clerk issuer)")
+    parser.add_argument("--jwks-out", default=None, help="Write the test JWKS here (to serve it elsewhere)")
+    parser.add_argument("--json-out", default=None, help="Also write the summary as JSON")
+    parser.add_argument("--log-dir", default=None, help="Where the stub/app logs go (default: temp dir)")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    args.base_url = args.base_url or f"http://127.0.0.1:{args.app_port}"
+    issuer = args.issuer or f"{stub_url}/clerk"
+
+    private_pem, jwks, kid = make_signer()
+    tokens = make_tokens(private_pem, kid, issuer, args.users)
+    if args.jwks_out:
+        with open(args.jwks_out, "w") as f:
+            json.dump(jwks, f)
+
+    processes: List[subprocess.Popen] = []
+    log_dir = args.log_dir or tempfile.mkdtemp(prefix="loadtest-")
+    os.makedirs(log_dir, exist_ok=True)
+    try:
+        if not args.no_spawn:
+            stub_env = {
+                "STUB_JWKS_JSON": json.dumps(jwks),
+                "STUB_CATALOG_SIZE": str(args.catalog_size),
+                "STUB_SEED_USERS": str(args.users),
+                "STUB_LATENCY_ORS_MS": str(args.latency_ors_ms),
+                "STUB_LATENCY_SUPABASE_MS": str(args.latency_supabase_ms),
+                "STUB_LATENCY_CLERK_MS": str(args.latency_clerk_ms),
+                "STUB_LATENCY_HOTEL_MS": str(args.latency_hotel_ms),
+            }
+            processes.append(start_process(
+                [sys.executable, "-m", "uvicorn", "loadtest.stubs:app", "--port", str(args.stub_port),
+                 "--log-level", "warning", "--no-access-log"],
+                stub_env, os.path.join(log_dir, "stubs.log")
+            ))
+            wait_until_up(f"{stub_url}/clerk/.well-known/jwks.json")
+
+            app_env = {
+                "ORS_API_KEY": "stub",
+                "ORS_BASE_URL": f"{stub_url}/ors",
+                "SUPABASE_URL": f"{stub_url}/supabase",
+                "SUPABASE_KEY": STUB_SUPABASE_KEY,
+                "CLERK_ISSUER_URL": issuer,
+                "HOTEL_SERVICE_URL": f"{stub_url}/hotel",
+            }
+            if args.threadpool:
+                app_env["THREADPOOL_SIZE"] = str(args.threadpool)
+            processes.append(start_process(
+                [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.app_port),
+                 "--workers", str(args.workers), "--log-level", "warning", "--no-access-log"],
+                app_env, os.path.join(log_dir, "app.log")
+            ))
+            wait_until_up(f"{args.base_url}/")
+            print(f"Stubs on {stub_url}, app on {args.base_url} (logs in {log_dir})")
+
+        run = asyncio.run(run_load(args, tokens))
+        summary = summarize(run)
+        print_report(summary, args)
+        if args.json_out:
+            with open(args.json_out, "w") as f:
+                json.dump({"args": vars(args), "summary": summary}, f, indent=2)
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == "__main__":
+    main()
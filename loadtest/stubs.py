@@ -0,0 +1,312 @@
+# File: loadtest/stubs.py
+
+"""
+Local stand-ins for every service the API talks to, served by ONE FastAPI app:
+
+    /ors/...       OpenRouteService (matrix, directions, geocode)
+    /supabase/...  Supabase PostgREST (rpc/get_locations_by_tags, users, trips, trip_days, locations)
+    /clerk/...     Clerk issuer (/.well-known/jwks.json)
+    /hotel/...     Hotel service (/nearest-hotels)
+
+Responses are synthetic but shaped like the real ones, and each service
+can be given an artificial latency. Configuration comes from environment
+variables (set by loadtest.run):
+
+    STUB_JWKS_JSON        the JWKS document to serve (public key of the test signer)
+    STUB_LATENCY_ORS_MS, STUB_LATENCY_SUPABASE_MS, STUB_LATENCY_CLERK_MS, STUB_LATENCY_HOTEL_MS
+    STUB_CATALOG_SIZE     number of synthetic locations (default 200)
+    STUB_SEED_USERS       number of user_loadtest_<n> profiles to pre-create (default 0)
+"""
+
+import asyncio
+import itertools
+import json
+import math
+import os
+import random
+import uuid
+from datetime import datetime, timezone
+from typing import List, Dict, Any
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+INTERESTS = ["nature", "history", "beach", "wildlife", "culture", "adventure", "hiking", "religious"]
+
+# Sri Lanka's bounding box (roughly)
+MIN_LON, MAX_LON = 79.7, 81.8
+MIN_LAT, MAX_LAT = 6.0, 9.7
+
+
+def _latency(service: str) -> float:
+    return float(os.getenv(f"STUB_LATENCY_{service}_MS", "0")) / 1000.0
+
+
+def _make_catalog(size: int) -> List[Dict[str, Any]]:
+    rng = random.Random(42)
+    return [
+        {
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "name": f"Stub Location {i}",
+            "description": f"Synthetic catalog entry {i}",
+            "image_url": None,
+            "tags": rng.sample(INTERESTS, rng.randint(1, 3)),
+            "lon": round(rng.uniform(MIN_LON, MAX_LON), 6),
+            "lat": round(rng.uniform(MIN_LAT, MAX_LAT), 6),
+            "visit_duration_minutes": 30 + 15 * (i % 7),
+        }
+        for i in range(size)
+    ]
+
+
+CATALOG = _make_catalog(int(os.getenv("STUB_CATALOG_SIZE", "200")))
+# Test users already have a profile, like real users who have planned a trip before
+SEED_USERS = [
+    {"id": f"user_loadtest_{i}", "email": f"loadtest{i}@example.com", "first_name": "Load", "last_name": f"Test{i}"}
+    for i in range(int(os.getenv("STUB_SEED_USERS", "0")))
+]
+TABLES: Dict[str, List[Dict[str, Any]]] = {
+    "users": SEED_USERS, "trips": [], "trip_days": [], "locations": list(CATALOG)
+}
+_ids = itertools.count(1)
+
+app = FastAPI(title="Load test stubs")
+
+
+def _haversine_m(a: List[float], b: List[float]) -> float:
+    lon1, lat1, lon2, lat2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6_371_000 * math.asin(math.sqrt(h))
+
+
+def _drive_seconds(a: List[float], b: List[float]) -> float:
+    # Road distance ~1.3x straight line, ~45 km/h average
+    return round(_haversine_m(a, b) * 1.3 / 12.5, 1)
+
+
+# --- ORS ---
+
+@app.post("/ors/v2/matrix/{profile}")
+async def ors_matrix(profile: str, request: Request):
+    await asyncio.sleep(_latency("ORS"))
+    body = await request.json()
+    locations = body["locations"]
+    sources = body.get("sources") or list(range(len(locations)))
+    destinations = body.get("destinations") or list(range(len(locations)))
+    return {"durations": [[_drive_seconds(locations[i], locations[j]) for j in destinations] for i in sources]}
+
+
+@app.post("/ors/v2/directions/{profile}/geojson")
+async def ors_directions(profile: str, request: Request):
+    await asyncio.sleep(_latency("ORS"))
+    body = await request.json()
+    (lon1, lat1), (lon2, lat2) = body["coordinates"][0], body["coordinates"][1]
+    # About one vertex per 100 m, like a real road geometry
+    steps = max(2, int(_haversine_m([lon1, lat1], [lon2, lat2]) / 100))
+    coordinates = [
+        [lon1 + (lon2 - lon1) * t / steps + 0.0005 * math.sin(t), lat1 + (lat2 - lat1) * t / steps]
+        for t in range(steps + 1)
+    ]
+    return {
+        "type": "FeatureCollection",
+        "features": [{
+            "type": "Feature",
+            "geometry": {"type": "LineString", "coordinates": coordinates},
+            "properties": {"summary": {"duration": _drive_seconds([lon1, lat1], [lon2, lat2])}}
+        }]
+    }
+
+
+@app.get("/ors/geocode/search")
+async def ors_geocode(text: str, request: Request):
+    await asyncio.sleep(_latency("ORS"))
+    rng = random.Random(text)
+    return {
+        "features": [{
+            "geometry": {"type": "Point", "coordinates": [rng.uniform(MIN_LON, MAX_LON), rng.uniform(MIN_LAT, MAX_LAT)]},
+            "properties": {"label": text, "confidence": round(rng.uniform(0.5, 1.0), 2)}
+        }]
+    }
+
+
+# --- Supabase (PostgREST subset) ---
+
+def _split_top_level(text: str) -> List[str]:
+    parts, depth, quoted, current = [], 0, False, ""
+    for ch in text:
+        if ch == '"':
+            quoted = not quoted
+        elif not quoted and ch == "(":
+            depth += 1
+        elif not quoted and ch == ")":
+            depth -= 1
+        elif not quoted and ch == "," and depth == 0:
+            parts.append(current)
+            current = ""
+            continue
+        current += ch
+    return parts + [current]
+
+
+def _parse_or(text: str) -> tuple:
+    # "(a.lt.x,and(a.eq.x,b.lt.y))" -> ("or", [("a", "lt", "x"), ("and", [...])])
+    conditions = []
+    for part in _split_top_level(text.strip()[1:-1]):
+        if part.startswith(("and(", "or(")):
+            name, _, rest = part.partition("(")
+            conditions.append((name, _parse_or("(" + rest)[1]))
+        else:
+            key, op, operand = part.split(".", 2)
+            conditions.append((key, op, operand.strip('"')))
+    return "or", conditions
+
+
+def _filters(request: Request) -> List[tuple]:
+    filters = []
+    for key, value in request.query_params.multi_items():
+        if key in ("select", "on_conflict", "order", "limit", "offset", "columns"):
+            continue
+        if key == "or":
+            filters.append(_parse_or(value))
+            continue
+        op, _, operand = value.partition(".")
+        filters.append((key, op, operand))
+    return filters
+
+
+def _compare(value: Any, operand: str) -> int:
+    try:
+        a, b = float(value), float(operand)
+    except (TypeError, ValueError):
+        a, b = str(value), operand
+    return (a > b) - (a < b)
+
+
+def _condition(row: Dict[str, Any], condition: tuple) -> bool:
+    if condition[0] in ("or", "and"):
+        results = (_condition(row, c) for c in condition[1])
+        return any(results) if condition[0] == "or" else all(results)
+    key, op, operand = condition
+    column, _, field = key.partition("->>")
+    value = row.get(column)
+    if field:
+        value = (value or {}).get(field)
+        value = None if value is None else str(value)
+    if op == "is":
+        return value is None if operand == "null" else str(value).lower() == operand
+    if op == "eq":
+        return str(value) == operand
+    if op == "in":
+        return str(value) in operand.strip("()").replace('"', "").split(",")
+    if op in ("gt", "lt"):
+        if value is None:
+            return False
+        return _compare(value, operand) == (1 if op == "gt" else -1)
+    return True
+
+
+def _matches(row: Dict[str, Any], filters: List[tuple]) -> bool:
+    return all(_condition(row, condition) for condition in filters)
+
+
+def _order_and_limit(request: Request, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    order = request.query_params.get("order")
+    if order:
+        for term in reversed(order.split(",")):
+            column, _, direction = term.partition(".")
+            rows = sorted(rows, key=lambda r: str(r.get(column)), reverse=direction.startswith("desc"))
+    limit = request.query_params.get("limit")
+    return rows[:int(limit)] if limit else rows
+
+
+def _postgrest_response(request: Request, rows: List[Dict[str, Any]], status_code: int = 200):
+    if "vnd.pgrst.object" in request.headers.get("accept", ""):
+        if not rows:
+            return JSONResponse({"code": "PGRST116", "message": "0 rows"}, status_code=406)
+        return JSONResponse(rows[0], status_code=status_code)
+    return JSONResponse(rows, status_code=status_code)
+
+
+@app.post("/supabase/rest/v1/rpc/get_locations_by_tags")
+async def supabase_rpc_locations(request: Request):
+    await asyncio.sleep(_latency("SUPABASE"))
+    body = await request.json()
+    wanted = set(body.get("tag_names") or [])
+    return [loc for loc in CATALOG if wanted & set(loc["tags"])]
+
+
+@app.get("/supabase/rest/v1/{table}")
+async def supabase_select(table: str, request: Request):
+    await asyncio.sleep(_latency("SUPABASE"))
+    filters = _filters(request)
+    rows = [row for row in TABLES.get(table, []) if _matches(row, filters)]
+    return _postgrest_response(request, _order_and_limit(request, rows))
+
+
+@app.post("/supabase/rest/v1/{table}")
+async def supabase_insert(table: str, request: Request):
+    await asyncio.sleep(_latency("SUPABASE"))
+    payload = await request.json()
+    rows = payload if isinstance(payload, list) else [payload]
+    merge = "merge-duplicates" in request.headers.get("prefer", "")
+    conflict_columns = request.query_params.get("on_conflict", "id").split(",")
+    stored = []
+    for row in rows:
+        row = dict(row)
+        existing = next((r for r in TABLES.setdefault(table, []) if merge
+                         and all(r.get(c) == row.get(c) for c in conflict_columns)), None)
+        if existing is not None:
+            existing.update(row)
+            stored.append(existing)
+            continue
+        row.setdefault("id", str(uuid.UUID(int=next(_ids))))
+        row.setdefault("created_at", datetime.now(timezone.utc).isoformat())
+        TABLES[table].append(row)
+        stored.append(row)
+    # Keep memory flat during long runs
+    if len(TABLES[table]) > 50_000:
+        del TABLES[table][:10_000]
+    return _postgrest_response(request, stored, status_code=201)
+
+
+@app.patch("/supabase/rest/v1/{table}")
+async def supabase_update(table: str, request: Request):
+    await asyncio.sleep(_latency("SUPABASE"))
+    changes = await request.json()
+    filters = _filters(request)
+    updated = []
+    for row in TABLES.get(table, []):
+        if _matches(row, filters):
+            row.update(changes)
+            updated.append(row)
+    return _postgrest_response(request, updated)
+
+
+@app.delete("/supabase/rest/v1/{table}")
+async def supabase_delete(table: str, request: Request):
+    await asyncio.sleep(_latency("SUPABASE"))
+    filters = _filters(request)
+    deleted = [row for row in TABLES.get(table, []) if _matches(row, filters)]
+    TABLES[table] = [row for row in TABLES.get(table, []) if not _matches(row, filters)]
+    return _postgrest_response(request, deleted)
+
+
+# --- Clerk ---
+
+@app.get("/clerk/.well-known/jwks.json")
+async def clerk_jwks():
+    await asyncio.sleep(_latency("CLERK"))
+    return json.loads(os.environ["STUB_JWKS_JSON"])
+
+
+# --- Hotel service ---
+
+@app.post("/hotel/nearest-hotels")
+async def hotel_nearest(request: Request):
+    await asyncio.sleep(_latency("HOTEL"))
+    body = await request.json()
+    return {
+        day: [{"name": f"Stub Hotel near {point['lat']:.3f},{point['long']:.3f}", "lat": point["lat"],
+               "long": point["long"], "capacity": body.get("num_people", 1)}]
+        for day, point in (body.get("daily_locations") or {}).items()
+    }
@@ -0,0 +1,49 @@
+"""
+Checks the streamed plan (plan_service.stream_trip_plan) in geometry_mode
+"refs": the route references must carry the plan's routing profile.
+"""
+
+import pytest
+
+from app.core.config import settings
+from app.services import plan_service
+from app.services.plan_service import CandidateList, DurationTable
+from app.models.schemas import TripGenerationRequest
+
+
+def _candidates(profile):
+    """Four catalog locations on a line east of the airport, durations growing with distance."""
+    airport = settings.STARTING_POINT_COORDS
+    locations = [
+        {"id": f"loc{i}", "name": f"Place {i}", "description": "", "image_url": "",
+         "lon": airport[0] + 0.05 * i, "lat": airport[1], "visit_duration_minutes": 30}
+        for i in range(1, 5)
+    ]
+    coords = [airport] + [(loc["lon"], loc["lat"]) for loc in locations]
+    durations = [[abs(i - j) * 600.0 for j in range(len(coords))] for i in range(len(coords))]
+    return CandidateList(("nature",), locations, DurationTable(coords, durations), profile)
+
+
+@pytest.fixture
+def no_side_effects(monkeypatch):
+    def save_trip(request, day_location_ids, user_id=None, snapshot=None):
+        return {"id": "trip-1", "num_people": request.num_people, "num_days": request.num_days,
+                "total_budget": request.budget, "user_id": user_id}
+
+    monkeypatch.setattr(plan_service, "_save_trip", save_trip)
+    monkeypatch.setattr(plan_service.hotel_service, "start_lookup", lambda data: None)
+
+
+@pytest.mark.parametrize("profile", ["foot-walking", "cycling-regular", "tuk-tuk", "driving-car"])
+def test_streamed_refs_carry_the_routing_profile(no_side_effects, profile):
+    request = TripGenerationRequest(num_people=2, num_days=2, budget=5000, interests=["nature"],
+                                    routing_profile=profile, geometry_mode="refs")
+    events = list(plan_service.stream_trip_plan(request, _candidates(profile)))
+    day_events = [event for event in events if event["event"] == "day"]
+
+    assert day_events and events[-1]["event"] == "trip", events[-1]
+    for event in day_events:
+        refs = event["route_refs"] + [event["day_route_ref"]]
+        assert all(ref.startswith(profile + ":") for ref in refs), refs
+        for ref in refs:
+            assert plan_service.parse_route_ref(ref)[0] == profile
@@ -0,0 +1,143 @@
+"""
+Checks the contraction-hierarchy router (app/services/routing_engine.py)
+against a plain Dijkstra on the same roads, using the bundled fixture graph.
+"""
+
+import copy
+import heapq
+import os
+import random
+
+import pytest
+
+from app.services import routing_engine
+from app.services.routing_engine import RoadGraph, RoutingEngine
+
+FIXTURE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "app", "data", "sri_lanka_fixture_graph.json"
+)
+
+
+def _road_edges(edges):
+    """The fastest real road u -> v for every directed pair: {(u, v): (duration, distance)}."""
+    roads = {}
+    for edge in edges:
+        u, v, duration, distance = int(edge[0]), int(edge[1]), float(edge[2]), float(edge[3])
+        oneway = bool(edge[4]) if len(edge) > 4 else False
+        if u == v:
+            continue
+        for a, b in [(u, v)] if oneway else [(u, v), (v, u)]:
+            if (a, b) not in roads or duration < roads[(a, b)][0]:
+                roads[(a, b)] = (duration, distance)
+    return roads
+
+
+def _dijkstra(num_nodes, roads, source):
+    adjacency = [[] for _ in range(num_nodes)]
+    for (u, v), (duration, _) in roads.items():
+        adjacency[u].append((v, duration))
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    while heap:
+        d, x = heapq.heappop(heap)
+        if d > dist[x]:
+            continue
+        for y, duration in adjacency[x]:
+            if d + duration < dist.get(y, float("inf")):
+                dist[y] = d + duration
+                heapq.heappush(heap, (d + duration, y))
+    return dist
+
+
+def _with_oneways(data, seed=7):
+    """The fixture with about a third of its roads made one-way."""
+    rng = random.Random(seed)
+    variant = copy.deepcopy(data)
+    variant["edges"] = [edge[:4] + [rng.random() < 0.35] for edge in variant["edges"]]
+    variant.pop("ch", None)
+    return variant
+
+
+@pytest.fixture(scope="module")
+def fixture_data():
+    return routing_engine._read_graph_file(FIXTURE_PATH)
+
+
+@pytest.fixture(scope="module", params=["prebuilt ch", "contracted at load", "one-way roads"])
+def case(request, fixture_data):
+    """(graph file data, RoadGraph built from it) for each way a graph gets its hierarchy."""
+    if request.param == "prebuilt ch":
+        data = fixture_data
+    elif request.param == "contracted at load":
+        data = {key: value for key, value in fixture_data.items() if key != "ch"}
+    else:
+        data = _with_oneways(fixture_data)
+    return data, RoadGraph(data["nodes"], data["edges"], data.get("ch"))
+
+
+def test_fixture_ships_a_hierarchy(fixture_data):
+    assert fixture_data.get("ch"), "the fixture should exercise the precomputed 'ch' path"
+    assert len(fixture_data["ch"]["rank"]) == len(fixture_data["nodes"])
+
+
+def test_duration_matrix_matches_dijkstra(case):
+    data, graph = case
+    n = len(data["nodes"])
+    roads = _road_edges(data["edges"])
+    nodes = list(range(n))
+    matrix = graph.duration_matrix(nodes, nodes)
+    for source in nodes:
+        expected = _dijkstra(n, roads, source)
+        for target in nodes:
+            if target in expected:
+                assert matrix[source][target] == pytest.approx(expected[target], abs=0.01), (source, target)
+            else:
+                assert matrix[source][target] is None, (source, target)
+
+
+def test_shortest_path_unpacks_to_real_roads(case):
+    data, graph = case
+    n = len(data["nodes"])
+    roads = _road_edges(data["edges"])
+    for source in range(n):
+        expected = _dijkstra(n, roads, source)
+        for target in range(n):
+            result = graph.shortest_path(source, target)
+            if target not in expected:
+                assert result is None, (source, target)
+                continue
+            duration, distance, path = result
+            assert duration == pytest.approx(expected[target], abs=1e-6), (source, target)
+            assert path[0] == source and path[-1] == target
+            hops = list(zip(path, path[1:]))
+            assert all(hop in roads for hop in hops), (source, target, path)
+            assert sum(roads[hop][0] for hop in hops) == pytest.approx(duration, abs=1e-6)
+            assert sum(roads[hop][1] for hop in hops) == pytest.approx(distance, abs=1e-6)
+
+
+def test_engine_matches_graph_through_coordinates(fixture_data):
+    engine = RoutingEngine.load(FIXTURE_PATH)
+    n = len(fixture_data["nodes"])
+    roads = _road_edges(fixture_data["edges"])
+    rng = random.Random(3)
+    picked = rng.sample(range(n), 8)
+    locations = [tuple(fixture_data["nodes"][i]) for i in picked]
+
+    durations = engine.get_distance_matrix(locations)["durations"]
+    for row, source in enumerate(picked):
+        expected = _dijkstra(n, roads, source)
+        for column, target in enumerate(picked):
+            assert durations[row][column] == pytest.approx(expected[target], abs=0.01)
+
+    sub = engine.get_distance_matrix(locations, sources=[0, 1], destinations=[2, 3, 4])["durations"]
+    assert sub == [row[2:5] for row in durations[:2]]
+
+    start, end = picked[0], picked[1]
+    route = engine.get_route(locations[0], locations[1])
+    coordinates = route["geometry"]["coordinates"]
+    assert route["duration"] == pytest.approx(_dijkstra(n, roads, start)[end], abs=0.01)
+    assert coordinates[0] == list(fixture_data["nodes"][start])
+    assert coordinates[-1] == list(fixture_data["nodes"][end])
+    node_at = {tuple(node): i for i, node in enumerate(fixture_data["nodes"])}
+    path = [node_at[tuple(point)] for point in coordinates]
+    assert all(hop in roads for hop in zip(path, path[1:]))
@@ -0,0 +1,37 @@
+"""
+Checks the trip list cursors (plan_service.encode_trip_cursor / decode_trip_cursor):
+their values end up in a PostgREST filter, so anything but a timestamp and a
+trip UUID must be rejected.
+"""
+
+import base64
+import json
+
+import pytest
+
+from app.services.plan_service import decode_trip_cursor, encode_trip_cursor
+
+CREATED_AT = "2025-03-01T10:20:30.123456+00:00"
+TRIP_ID = "6f1c2d3e-4a5b-4c6d-8e7f-9a0b1c2d3e4f"
+
+
+def _raw_cursor(*values):
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode()).decode().rstrip("=")
+
+
+def test_round_trip():
+    assert decode_trip_cursor(encode_trip_cursor(CREATED_AT, TRIP_ID)) == (CREATED_AT, TRIP_ID)
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64 json",
+    _raw_cursor(CREATED_AT),
+    _raw_cursor(CREATED_AT, 42),
+    _raw_cursor('2025-03-01",id.gt."0', TRIP_ID),
+    _raw_cursor(CREATED_AT, '0"),user_id.neq.("x'),
+    _raw_cursor("yesterday", TRIP_ID),
+    _raw_cursor(CREATED_AT, "trip-1"),
+])
+def test_rejects_malformed_cursors(cursor):
+    with pytest.raises(ValueError):
+        decode_trip_cursor(cursor)